@@ -1,13 +1,109 @@
-
 import anthill.common.admin as a
 
+from . model.leaderboard import LeaderboardError
+
 
 class RootAdminController(a.AdminController):
+    """
+    What's going on with the leaderboards of the gamespace: the busiest and the biggest ones.
+    Please note the rates and latencies are of the instance of the service that renders the page.
+    """
+
+    async def get(self):
+        leaderboards = self.application.leaderboards
+
+        try:
+            largest = await leaderboards.list_largest_leaderboards(self.gamespace)
+            clusters = await leaderboards.list_cluster_counts(self.gamespace)
+            metrics = await leaderboards.get_metrics()
+        except LeaderboardError as e:
+            raise a.ActionError(e.message)
+
+        return {
+            "hottest": leaderboards.metrics.activity.hottest(self.gamespace),
+            "largest": largest,
+            "clusters": clusters,
+            "metrics": metrics
+        }
+
     def render(self, data):
+        metrics = data["metrics"]
+
         return [
-            a.notice("Not implemented", "Not implemented yet.")
+            a.breadcrumbs([], "Leaderboards"),
+            a.content("Hottest leaderboards (per second)", [
+                {"id": "name", "title": "Leaderboard"},
+                {"id": "reads", "title": "Reads"},
+                {"id": "writes", "title": "Writes"}
+            ], [
+                {
+                    "name": name,
+                    "reads": "{0:.2f}".format(reads),
+                    "writes": "{0:.2f}".format(writes)
+                }
+                for gamespace_id, leaderboard_id, name, reads, writes in data["hottest"]
+            ], "primary", empty="No activity recently"),
+            a.content("Largest leaderboards", [
+                {"id": "name", "title": "Leaderboard"},
+                {"id": "sort_order", "title": "Sort order"},
+                {"id": "records", "title": "Records"}
+            ], [
+                {
+                    "name": leaderboard["leaderboard_name"],
+                    "sort_order": leaderboard["leaderboard_sort_order"],
+                    "records": leaderboard["records"]
+                }
+                for leaderboard in data["largest"]
+            ], "default", empty="No records"),
+            a.content("Clustered leaderboards", [
+                {"id": "name", "title": "Leaderboard"},
+                {"id": "sort_order", "title": "Sort order"},
+                {"id": "clusters", "title": "Clusters"}
+            ], [
+                {
+                    "name": leaderboard["leaderboard_name"],
+                    "sort_order": leaderboard["leaderboard_sort_order"],
+                    "clusters": leaderboard["clusters"]
+                }
+                for leaderboard in data["clusters"]
+            ], "default", empty="No clusters"),
+            a.content("Latency (ms)", [
+                {"id": "operation", "title": "Operation"},
+                {"id": "count", "title": "Count"},
+                {"id": "avg", "title": "Average"},
+                {"id": "p50", "title": "p50"},
+                {"id": "p99", "title": "p99"},
+                {"id": "max", "title": "Max"}
+            ], [
+                {
+                    "operation": operation,
+                    "count": histogram["count"],
+                    "avg": "{0:.2f}".format(histogram["avg"]),
+                    "p50": histogram["p50"],
+                    "p99": histogram["p99"],
+                    "max": "{0:.2f}".format(histogram["max"])
+                }
+                for operation, histogram in sorted(metrics["latency"].items())
+            ], "default", empty="Nothing has been done yet"),
+            a.content("Caches", [
+                {"id": "cache", "title": "Cache"},
+                {"id": "size", "title": "Size"},
+                {"id": "hit_ratio", "title": "Hit ratio"}
+            ], [
+                {
+                    "cache": cache,
+                    "size": stats["size"],
+                    "hit_ratio": "{0:.1f}%".format(stats["hit_ratio"] * 100)
+                }
+                for cache, stats in sorted(metrics["caches"].items())
+            ], "default"),
+            a.json_view({
+                "queries": metrics["queries"],
+                "rows_returned": metrics["rows_returned"],
+                "database": metrics["database"],
+                "read_coalescing": metrics.get("read_coalescing")
+            })
         ]
 
     def access_scopes(self):
         return ["leaderboard_admin"]
-
@@ -4,11 +4,114 @@ from tornado.web import HTTPError
 from anthill.common.access import scoped, AccessToken, InternalError
 from anthill.common.handler import AuthenticatedHandler
 
-from . model.leaderboard import LeaderboardNotFound
+from . model.leaderboard import LeaderboardNotFound, LeaderboardError, LeaderboardCursor
+from . model.deletion import AccountsDeletionError
+from . model.shards import ShardError
 
 import ujson
 
 
+# records serialized and flushed to the client at once by a streaming response
+STREAM_CHUNK_SIZE = 200
+
+# periods of a periodic leaderboard that can be read
+PERIOD_CURRENT = "current"
+PERIOD_PREVIOUS = "previous"
+
+
+def dump_page(records, limit):
+    """
+    Dumps a page of leaderboard records. A full page also carries a cursor to request the next page with.
+    """
+
+    result = {
+        "entries": len(records),
+        "data": [
+            record.dump()
+            for record in records
+        ]
+    }
+
+    if records and len(records) >= int(limit):
+        result["cursor"] = LeaderboardCursor.after(records[-1]).encode()
+
+    return result
+
+
+def dump_page_chunks(records, limit=None, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Same as dump_page, but generates the JSON in pieces of `chunk_size` records,
+        so only one piece is kept in memory at a time. Stored profiles are put in as is, never decoded.
+    """
+
+    yield '{"entries":' + str(len(records)) + ',"data":['
+
+    chunk = []
+    separator = ""
+
+    for record in records:
+        chunk.append(record.dump_json())
+
+        if len(chunk) >= chunk_size:
+            yield separator + ",".join(chunk)
+            separator = ","
+            chunk = []
+
+    if chunk:
+        yield separator + ",".join(chunk)
+
+    if limit is not None and records and len(records) >= int(limit):
+        yield '],"cursor":' + ujson.dumps(LeaderboardCursor.after(records[-1]).encode()) + '}'
+    else:
+        yield ']}'
+
+
+def dump_clustered_page(records):
+    """
+    Dumps a page of records of various clusters (like ranks of accounts, or snapshot records).
+    Ranks are within a cluster, so each record carries its cluster too.
+    """
+
+    result = []
+
+    for record in records:
+        item = record.dump()
+        item["cluster"] = record.cluster_id
+        result.append(item)
+
+    return {
+        "entries": len(result),
+        "data": result
+    }
+
+
+def previous_period(handler):
+    """
+    :returns: True if the previous period of a periodic leaderboard is requested (the `period` argument),
+        False for the current one
+    """
+
+    period = handler.get_argument("period", PERIOD_CURRENT)
+
+    if period not in (PERIOD_CURRENT, PERIOD_PREVIOUS):
+        raise HTTPError(400, "Period should be either '{0}' or '{1}'".format(PERIOD_CURRENT, PERIOD_PREVIOUS))
+
+    return period == PERIOD_PREVIOUS
+
+
+class StreamingHandler(AuthenticatedHandler):
+    async def stream(self, chunks):
+        """
+        Writes a JSON response piece by piece, flushing each one to the client
+        """
+
+        self.set_header("Content-Type", "application/json")
+
+        for chunk in chunks:
+            self.write(chunk)
+            await self.flush()
+
+
 class InternalHandler(object):
     def __init__(self, application):
         self.application = application
@@ -18,74 +121,242 @@ class InternalHandler(object):
         leaderboards = self.application.leaderboards
 
         try:
-            leaderboard_id = await leaderboards.find_leaderboard(
+            leaderboard = await leaderboards.find_leaderboard(
                 gamespace, leaderboard_name, sort_order)
         except LeaderboardNotFound:
             raise InternalError(404, "No such leaderboard")
 
         else:
             await leaderboards.delete_leaderboard(
-                gamespace, leaderboard_id)
+                leaderboard.leaderboard_id, gamespace)
 
         return "OK"
 
-    async def post(self, account, gamespace, sort_order, leaderboard_name, score, display_name, expire_in, profile):
+    async def post(self, account, gamespace, sort_order, leaderboard_name, score, display_name, expire_in, profile,
+                   policy=None, period=None, period_reset=0):
 
         leaderboards = self.application.leaderboards
 
-        response = await leaderboards.add_entry(
-            gamespace, leaderboard_name, sort_order, account,
-            display_name, score, expire_in, profile)
+        try:
+            await leaderboards.add_entry(
+                gamespace, leaderboard_name, sort_order, account,
+                display_name, score, expire_in, profile, policy=policy,
+                period=period, period_reset=period_reset)
+        except LeaderboardError as e:
+            raise InternalError(e.code, e.message)
 
-        return response
+        return "OK"
 
-    async def get_top(self, gamespace, sort_order, leaderboard_name, offset=0, limit=1000):
+    async def get_top(self, gamespace, sort_order, leaderboard_name, offset=0, limit=1000, cursor=None,
+                      period=None):
 
         leaderboards = self.application.leaderboards
 
         try:
+            leaderboard_name = await leaderboards.resolve_period(
+                gamespace, leaderboard_name, sort_order, previous=period == PERIOD_PREVIOUS)
+
             data = await leaderboards.list_top_records(
-                leaderboard_name, gamespace, sort_order, offset=offset, limit=limit)
+                leaderboard_name, gamespace, sort_order, offset=offset, limit=limit,
+                cursor=LeaderboardCursor.decode(cursor) if cursor else None)
         except LeaderboardNotFound:
             raise InternalError(404, "No such leaderboard")
+        except LeaderboardError as e:
+            raise InternalError(e.code, e.message)
 
-        return {
-            "entries": len(data),
-            "data": [
-                item.dump()
-                for item in data
-            ]
-        }
+        return dump_page(data, limit)
 
-    async def get_top_account(self, gamespace, account_id, sort_order, leaderboard_name, offset=0, limit=1000):
+    async def get_top_account(self, gamespace, account_id, sort_order, leaderboard_name, offset=0, limit=1000,
+                              cursor=None, period=None):
 
         leaderboards = self.application.leaderboards
 
         try:
+            leaderboard_name = await leaderboards.resolve_period(
+                gamespace, leaderboard_name, sort_order, previous=period == PERIOD_PREVIOUS)
+
             data = await leaderboards.list_top_records_account(
                 leaderboard_name, gamespace, account_id,
-                sort_order, offset=offset, limit=limit)
+                sort_order, offset=offset, limit=limit,
+                cursor=LeaderboardCursor.decode(cursor) if cursor else None)
+        except LeaderboardNotFound:
+            raise InternalError(404, "No such leaderboard")
+        except LeaderboardError as e:
+            raise InternalError(e.code, e.message)
+
+        return dump_page(data, limit)
+
+    async def get_percentile(self, gamespace, sort_order, leaderboard_name, account_id=None, score=None,
+                             period=None):
+
+        leaderboards = self.application.leaderboards
+
+        try:
+            leaderboard_name = await leaderboards.resolve_period(
+                gamespace, leaderboard_name, sort_order, previous=period == PERIOD_PREVIOUS)
+
+            return await leaderboards.get_percentile(
+                gamespace, leaderboard_name, sort_order,
+                account_id=account_id, score=score)
+        except LeaderboardNotFound:
+            raise InternalError(404, "No such leaderboard")
+        except LeaderboardError as e:
+            raise InternalError(e.code, e.message)
+
+    async def create_snapshot(self, gamespace, sort_order, leaderboard_name, snapshot_name, ttl=None, period=None):
+
+        leaderboards = self.application.leaderboards
+
+        try:
+            return await leaderboards.create_snapshot(
+                gamespace, leaderboard_name, sort_order, snapshot_name, ttl=ttl,
+                previous=period == PERIOD_PREVIOUS)
+        except LeaderboardNotFound:
+            raise InternalError(404, "No such leaderboard")
+        except LeaderboardError as e:
+            raise InternalError(e.code, e.message)
+
+    async def list_snapshots(self, gamespace, sort_order, leaderboard_name):
+
+        leaderboards = self.application.leaderboards
+
+        try:
+            snapshots = await leaderboards.list_snapshots(gamespace, leaderboard_name, sort_order)
         except LeaderboardNotFound:
             raise InternalError(404, "No such leaderboard")
+        except LeaderboardError as e:
+            raise InternalError(e.code, e.message)
 
         return {
-            "entries": len(data),
-            "data": [
-                item.dump()
-                for item in data
-            ]
+            "snapshots": snapshots
         }
 
-    async def get_top_all_clusters(self, gamespace, sort_order, leaderboard_name):
+    async def delete_snapshot(self, gamespace, snapshot_id):
+
+        try:
+            await self.application.leaderboards.delete_snapshot(gamespace, snapshot_id)
+        except LeaderboardError as e:
+            raise InternalError(e.code, e.message)
+
+        return "OK"
+
+    async def get_snapshot_top(self, gamespace, sort_order, leaderboard_name, snapshot_name,
+                               account_id=None, cluster_id=None, offset=0, limit=1000):
+
+        leaderboards = self.application.leaderboards
+
+        try:
+            data = await leaderboards.list_snapshot_top(
+                gamespace, leaderboard_name, sort_order, snapshot_name,
+                account_id=account_id, cluster_id=cluster_id, offset=offset, limit=limit)
+        except LeaderboardNotFound:
+            raise InternalError(404, "No such leaderboard")
+        except LeaderboardError as e:
+            raise InternalError(e.code, e.message)
+
+        if data is None:
+            raise InternalError(404, "No record of the account")
+
+        return dump_clustered_page(data)
+
+    async def get_snapshot_around(self, gamespace, sort_order, leaderboard_name, snapshot_name, account_id,
+                                  offset=0, limit=1000):
+
+        leaderboards = self.application.leaderboards
+
+        try:
+            data = await leaderboards.list_snapshot_around(
+                gamespace, leaderboard_name, sort_order, snapshot_name,
+                account_id, offset, limit)
+        except LeaderboardNotFound:
+            raise InternalError(404, "No such leaderboard")
+        except LeaderboardError as e:
+            raise InternalError(e.code, e.message)
+
+        if data is None:
+            raise InternalError(404, "No record of the account")
+
+        return dump_clustered_page(data)
+
+    async def get_snapshot_ranks(self, gamespace, sort_order, leaderboard_name, snapshot_name, accounts):
+
+        leaderboards = self.application.leaderboards
+
+        try:
+            data = await leaderboards.list_snapshot_accounts(
+                gamespace, leaderboard_name, sort_order, snapshot_name,
+                [int(account_id) for account_id in accounts])
+        except (TypeError, ValueError):
+            raise InternalError(400, "Accounts should be a list of account ids")
+        except LeaderboardNotFound:
+            raise InternalError(404, "No such leaderboard")
+        except LeaderboardError as e:
+            raise InternalError(e.code, e.message)
+
+        return dump_clustered_page(data)
+
+    async def get_snapshot_records(self, gamespace, sort_order, leaderboard_name, snapshot_name,
+                                   after_cluster_id=0, after_rank=0, limit=1000):
+        """
+        Walks a whole snapshot, say, to reward every player in it: the `next` of a page is the
+            `after_cluster_id` and `after_rank` of the next page, and is missing on the last page
+        """
+
+        leaderboards = self.application.leaderboards
+
+        try:
+            data, following = await leaderboards.list_snapshot_records(
+                gamespace, leaderboard_name, sort_order, snapshot_name,
+                after_cluster_id=after_cluster_id, after_rank=after_rank, limit=limit)
+        except LeaderboardNotFound:
+            raise InternalError(404, "No such leaderboard")
+        except LeaderboardError as e:
+            raise InternalError(e.code, e.message)
+
+        result = dump_clustered_page(data)
+
+        if following is not None:
+            result["next"] = {
+                "after_cluster_id": following[0],
+                "after_rank": following[1]
+            }
+
+        return result
+
+    async def get_ranks(self, gamespace, sort_order, leaderboard_name, accounts, period=None):
+        """
+        Ranks and scores of many accounts at once, see LeaderboardsModel.list_accounts_ranks
+        """
+
+        leaderboards = self.application.leaderboards
+
+        try:
+            leaderboard_name = await leaderboards.resolve_period(
+                gamespace, leaderboard_name, sort_order, previous=period == PERIOD_PREVIOUS)
+
+            data, missing = await leaderboards.list_accounts_ranks(
+                gamespace, leaderboard_name, sort_order, accounts)
+        except LeaderboardNotFound:
+            raise InternalError(404, "No such leaderboard")
+        except LeaderboardError as e:
+            raise InternalError(e.code, e.message)
+
+        result = dump_clustered_page(data)
+        result["missing"] = missing
+        return result
+
+    async def get_top_all_clusters(self, gamespace, sort_order, leaderboard_name, limit=None):
 
         leaderboards = self.application.leaderboards
 
         try:
             data = await leaderboards.list_top_all_clusters(
-                leaderboard_name, gamespace, sort_order)
+                leaderboard_name, gamespace, sort_order, limit=limit)
         except LeaderboardNotFound:
             raise InternalError(404, "No such leaderboard")
 
+        # internal responses are serialized as a whole by the caller, so at least each record
+        #   is dumped straight from the database row
         return {
             cluster_id: {
                 "entries": len(cluster),
@@ -97,8 +368,157 @@ class InternalHandler(object):
             for cluster_id, cluster in data.items()
         }
 
+    async def get_top_clusters_page(self, gamespace, sort_order, leaderboard_name, after=0, clusters=None,
+                                    limit=None):
+
+        leaderboards = self.application.leaderboards
+
+        try:
+            data, next_cluster_id = await leaderboards.list_top_clusters_page(
+                leaderboard_name, gamespace, sort_order,
+                after_cluster_id=after, clusters=clusters, limit=limit)
+        except LeaderboardNotFound:
+            raise InternalError(404, "No such leaderboard")
+        except LeaderboardError as e:
+            raise InternalError(e.code, e.message)
+
+        return {
+            "clusters": {
+                cluster_id: {
+                    "entries": len(cluster),
+                    "data": [
+                        item.dump()
+                        for item in cluster
+                    ]
+                }
+                for cluster_id, cluster in data.items()
+            },
+            "next": next_cluster_id
+        }
+
+    async def explain_queries(self):
+
+        problems = await self.application.leaderboards.explain_queries()
+
+        return {
+            "problems": [
+                {"query": query, "sort_order": sort_order}
+                for query, sort_order in problems
+            ]
+        }
+
+    async def get_write_behind_stats(self):
+
+        write_behind = self.application.leaderboards.write_behind
+
+        if write_behind is None:
+            raise InternalError(404, "Write-behind is disabled")
+
+        return write_behind.stats()
+
+    async def get_read_coalescing_stats(self):
+
+        leaderboards = self.application.leaderboards
+
+        if leaderboards.reads is None:
+            raise InternalError(404, "Read coalescing is disabled")
+
+        return {
+            "reads": leaderboards.reads.stats(),
+            "friends": self.application.social_service.requests.stats()
+        }
+
+    async def get_metrics(self):
+
+        try:
+            result = await self.application.leaderboards.get_metrics()
+        except LeaderboardError as e:
+            raise InternalError(e.code, e.message)
+
+        result["caches"]["friends"] = self.application.social_service.friends.stats()
+        return result
+
+    async def get_accounts_deletion_stats(self):
+
+        deletion = self.application.leaderboards.deletion
 
-class LeaderboardAroundMeHandler(AuthenticatedHandler):
+        try:
+            jobs = await deletion.list_jobs()
+        except AccountsDeletionError as e:
+            raise InternalError(500, e.message)
+
+        return {
+            "stats": deletion.stats(),
+            "jobs": jobs
+        }
+
+    async def get_expiration_stats(self):
+
+        expirations = self.application.leaderboards.expirations
+
+        if not expirations:
+            raise InternalError(404, "Records expiration is disabled")
+
+        # of every shard
+        return {
+            shard: expiration.stats()
+            for shard, expiration in expirations.items()
+        }
+
+    async def list_misplaced_leaderboards(self, gamespace):
+
+        try:
+            leaderboards = await self.application.leaderboards.list_misplaced_leaderboards(gamespace)
+        except LeaderboardError as e:
+            raise InternalError(e.code, e.message)
+
+        return {
+            "leaderboards": leaderboards
+        }
+
+    async def move_leaderboard(self, gamespace, sort_order, leaderboard_name, shard):
+
+        try:
+            move_id = await self.application.leaderboards.move_leaderboard(
+                gamespace, leaderboard_name, sort_order, shard)
+        except LeaderboardNotFound:
+            raise InternalError(404, "No such leaderboard")
+        except LeaderboardError as e:
+            raise InternalError(e.code, e.message)
+
+        return {
+            "move_id": move_id
+        }
+
+    async def get_shard_moves_stats(self):
+
+        moves = self.application.leaderboards.moves
+
+        try:
+            jobs = await moves.list_moves()
+        except ShardError as e:
+            raise InternalError(e.code, e.message)
+
+        return {
+            "stats": moves.stats(),
+            "moves": jobs
+        }
+
+    async def get_replicas_stats(self):
+
+        replicas = self.application.leaderboards.replicas
+
+        if not replicas:
+            raise InternalError(404, "No read replicas are configured")
+
+        # of every shard that has replicas
+        return {
+            shard: pool.stats()
+            for shard, pool in replicas.items()
+        }
+
+
+class LeaderboardAroundMeHandler(StreamingHandler):
     @scoped()
     async def get(self, sort_order, leaderboard_id):
         try:
@@ -111,6 +531,9 @@ class LeaderboardAroundMeHandler(AuthenticatedHandler):
             gamespace_id = self.current_user.token.get(
                 AccessToken.GAMESPACE)
 
+            leaderboard_id = await leaderboards.resolve_period(
+                gamespace_id, leaderboard_id, sort_order, previous=previous_period(self))
+
             leaderboard_records = await leaderboards.list_around_me_records(
                 account_id, leaderboard_id, gamespace_id,
                 sort_order, offset, limit) or {}
@@ -118,15 +541,74 @@ class LeaderboardAroundMeHandler(AuthenticatedHandler):
         except LeaderboardNotFound:
             raise HTTPError(
                 404, "Leaderboard '%s' was not found." % leaderboard_id)
+        except LeaderboardError as e:
+            raise HTTPError(e.code, e.message)
 
         else:
-            self.dumps({
-                "entries": len(leaderboard_records),
-                "data": [
-                    record.dump()
-                    for record in leaderboard_records
-                ]
-            })
+            await self.stream(dump_page_chunks(leaderboard_records))
+
+
+class LeaderboardPercentileHandler(AuthenticatedHandler):
+    @scoped()
+    async def get(self, sort_order, leaderboard_name):
+        """
+        How high the account's score (or a `score` passed) is in a leaderboard, approximately,
+            see LeaderboardsModel.get_percentile
+        """
+        try:
+            leaderboards = self.application.leaderboards
+
+            score = self.get_argument("score", None)
+
+            account_id = self.current_user.token.account
+            gamespace_id = self.current_user.token.get(
+                AccessToken.GAMESPACE)
+
+            leaderboard_name = await leaderboards.resolve_period(
+                gamespace_id, leaderboard_name, sort_order, previous=previous_period(self))
+
+            result = await leaderboards.get_percentile(
+                gamespace_id, leaderboard_name, sort_order,
+                account_id=account_id, score=score)
+
+        except LeaderboardNotFound:
+            raise HTTPError(
+                404, "Leaderboard '%s' was not found." % leaderboard_name)
+        except LeaderboardError as e:
+            raise HTTPError(e.code, e.message)
+
+        self.dumps(result)
+
+
+class LeaderboardRanksHandler(AuthenticatedHandler):
+    @scoped()
+    async def get(self, sort_order, leaderboard_name):
+        """
+        Ranks and scores of many accounts (a comma-separated `accounts` argument) at once
+        """
+        try:
+            leaderboards = self.application.leaderboards
+
+            accounts = [account_id for account_id in self.get_argument("accounts").split(",") if account_id]
+
+            gamespace_id = self.current_user.token.get(
+                AccessToken.GAMESPACE)
+
+            leaderboard_name = await leaderboards.resolve_period(
+                gamespace_id, leaderboard_name, sort_order, previous=previous_period(self))
+
+            records, missing = await leaderboards.list_accounts_ranks(
+                gamespace_id, leaderboard_name, sort_order, accounts)
+
+        except LeaderboardNotFound:
+            raise HTTPError(
+                404, "Leaderboard '%s' was not found." % leaderboard_name)
+        except LeaderboardError as e:
+            raise HTTPError(e.code, e.message)
+
+        result = dump_clustered_page(records)
+        result["missing"] = missing
+        self.dumps(result)
 
 
 class LeaderboardEntryHandler(AuthenticatedHandler):
@@ -143,6 +625,9 @@ class LeaderboardEntryHandler(AuthenticatedHandler):
             gamespace_id = self.current_user.token.get(
                 AccessToken.GAMESPACE)
 
+            leaderboard_id = await leaderboards.resolve_period(
+                gamespace_id, leaderboard_id, sort_order)
+
             await leaderboards.delete_entry(
                 leaderboard_id, gamespace_id,
                 account_id, sort_order)
@@ -150,9 +635,11 @@ class LeaderboardEntryHandler(AuthenticatedHandler):
         except LeaderboardNotFound:
             raise HTTPError(
                 404, "Leaderboard '%s' was not found." % leaderboard_id)
+        except LeaderboardError as e:
+            raise HTTPError(e.code, e.message)
 
 
-class LeaderboardFriendsHandler(AuthenticatedHandler):
+class LeaderboardFriendsHandler(StreamingHandler):
     @scoped()
     async def get(self, sort_order, leaderboard_id):
         try:
@@ -163,10 +650,13 @@ class LeaderboardFriendsHandler(AuthenticatedHandler):
                 AccessToken.GAMESPACE)
             account_id = self.current_user.token.account
 
-            user_friends = await self.application.social_service.list_friends(
+            user_friends = await self.application.social_service.get_friends(
                 gamespace_id, account_id, profile_fields=[])
 
             if user_friends:
+                leaderboard_id = await self.application.leaderboards.resolve_period(
+                    gamespace_id, leaderboard_id, sort_order, previous=previous_period(self))
+
                 leaderboard_records = await self.application.leaderboards.list_friends_records(
                     user_friends, leaderboard_id,
                     gamespace_id, sort_order,
@@ -177,17 +667,13 @@ class LeaderboardFriendsHandler(AuthenticatedHandler):
         except LeaderboardNotFound:
             raise HTTPError(
                 404, "Leaderboard '%s' was not found." % leaderboard_id)
+        except LeaderboardError as e:
+            raise HTTPError(e.code, e.message)
         else:
-            self.dumps({
-                "entries": len(leaderboard_records),
-                "data": [
-                    record.dump()
-                    for record in leaderboard_records
-                ]
-            })
+            await self.stream(dump_page_chunks(leaderboard_records))
 
 
-class LeaderboardTopHandler(AuthenticatedHandler):
+class LeaderboardTopHandler(StreamingHandler):
     @scoped()
     async def get(self, sort_order, leaderboard_name):
         try:
@@ -195,31 +681,29 @@ class LeaderboardTopHandler(AuthenticatedHandler):
 
             offset = self.get_argument("offset", 0)
             limit = self.get_argument("limit", self.application.limit)
+            cursor = self.get_argument("cursor", None)
 
             account_id = self.get_argument("arbitrary_account", self.current_user.token.account)
 
             gamespace_id = self.current_user.token.get(
                 AccessToken.GAMESPACE)
 
+            leaderboard_name = await leaderboards.resolve_period(
+                gamespace_id, leaderboard_name, sort_order, previous=previous_period(self))
+
             leaderboard_records = await leaderboards.list_top_records_account(
                 leaderboard_name, gamespace_id,
                 account_id, sort_order,
-                offset, limit)
+                offset, limit, cursor=LeaderboardCursor.decode(cursor) if cursor else None)
 
         except LeaderboardNotFound:
             raise HTTPError(
                 404, "Leaderboard '%s' was not found." % leaderboard_name)
+        except LeaderboardError as e:
+            raise HTTPError(e.code, e.message)
 
         else:
-            result = {
-                "entries": len(leaderboard_records),
-                "data": [
-                    record.dump()
-                    for record in leaderboard_records
-                ]
-            }
-
-            self.dumps(result)
+            await self.stream(dump_page_chunks(leaderboard_records, limit))
 
     @scoped()
     async def post(self, sort_order, leaderboard_name):
@@ -229,6 +713,9 @@ class LeaderboardTopHandler(AuthenticatedHandler):
         score = self.get_argument("score")
         display_name = self.get_argument("display_name")
         expire_in = self.get_argument("expire_in", 604800)
+        policy = self.get_argument("policy", None)
+        period = self.get_argument("period", None)
+        period_reset = self.get_argument("period_reset", 0)
         arbitrary_account_id = self.get_argument("arbitrary_account", 0)
 
         account_id = self.current_user.token.account
@@ -239,14 +726,110 @@ class LeaderboardTopHandler(AuthenticatedHandler):
             else:
                 raise HTTPError(403, "Scope 'lb_arbitrary_account' is required for posting for arbitrary account")
 
+        profile = self.get_argument("profile", "{}")
+
+        # only validated, the profile is stored as posted
         try:
-            profile = ujson.loads(self.get_argument("profile", "{}"))
+            ujson.loads(profile)
         except (KeyError, ValueError):
             raise HTTPError(400, "Corrupted 'profile' JSON")
 
         gamespace_id = self.current_user.token.get(
             AccessToken.GAMESPACE)
 
-        await leaderboards.add_entry(
-            gamespace_id, leaderboard_name, sort_order, account_id,
-            display_name, score, expire_in, profile)
+        try:
+            changed = await leaderboards.add_entry(
+                gamespace_id, leaderboard_name, sort_order, account_id,
+                display_name, score, expire_in, profile, policy=policy,
+                period=period, period_reset=period_reset)
+        except LeaderboardError as e:
+            raise HTTPError(e.code, e.message)
+
+        self.dumps({
+            "changed": changed
+        })
+
+
+class LeaderboardSnapshotHandler(StreamingHandler):
+    @scoped()
+    async def get(self, sort_order, leaderboard_name, snapshot_name):
+        """
+        A top of a leaderboard snapshot (of the account's cluster, on a clustered leaderboard)
+        """
+        try:
+            leaderboards = self.application.leaderboards
+
+            offset = self.get_argument("offset", 0)
+            limit = self.get_argument("limit", self.application.limit)
+
+            account_id = self.current_user.token.account
+            gamespace_id = self.current_user.token.get(
+                AccessToken.GAMESPACE)
+
+            leaderboard_records = await leaderboards.list_snapshot_top(
+                gamespace_id, leaderboard_name, sort_order, snapshot_name,
+                account_id=account_id, offset=offset, limit=limit) or []
+
+        except LeaderboardNotFound:
+            raise HTTPError(
+                404, "Leaderboard '%s' was not found." % leaderboard_name)
+        except LeaderboardError as e:
+            raise HTTPError(e.code, e.message)
+
+        else:
+            await self.stream(dump_page_chunks(leaderboard_records))
+
+
+class LeaderboardSnapshotAroundMeHandler(StreamingHandler):
+    @scoped()
+    async def get(self, sort_order, leaderboard_name, snapshot_name):
+        try:
+            leaderboards = self.application.leaderboards
+
+            offset = self.get_argument("offset", 0)
+            limit = self.get_argument("limit", self.application.limit)
+
+            account_id = self.current_user.token.account
+            gamespace_id = self.current_user.token.get(
+                AccessToken.GAMESPACE)
+
+            leaderboard_records = await leaderboards.list_snapshot_around(
+                gamespace_id, leaderboard_name, sort_order, snapshot_name,
+                account_id, offset, limit) or []
+
+        except LeaderboardNotFound:
+            raise HTTPError(
+                404, "Leaderboard '%s' was not found." % leaderboard_name)
+        except LeaderboardError as e:
+            raise HTTPError(e.code, e.message)
+
+        else:
+            await self.stream(dump_page_chunks(leaderboard_records))
+
+
+class LeaderboardSnapshotRankHandler(AuthenticatedHandler):
+    @scoped()
+    async def get(self, sort_order, leaderboard_name, snapshot_name):
+        """
+        The account's record in a leaderboard snapshot, with its rank
+        """
+        try:
+            leaderboards = self.application.leaderboards
+
+            account_id = self.current_user.token.account
+            gamespace_id = self.current_user.token.get(
+                AccessToken.GAMESPACE)
+
+            records = await leaderboards.list_snapshot_accounts(
+                gamespace_id, leaderboard_name, sort_order, snapshot_name, [account_id])
+
+        except LeaderboardNotFound:
+            raise HTTPError(
+                404, "Leaderboard '%s' was not found." % leaderboard_name)
+        except LeaderboardError as e:
+            raise HTTPError(e.code, e.message)
+
+        if not records:
+            raise HTTPError(404, "No record of the account")
+
+        self.dumps(records[0].dump())
@@ -0,0 +1,126 @@
+from collections import OrderedDict
+
+import logging
+import time
+
+
+class LRUCache(object):
+    """
+    Bounded in-process cache: least recently used entries are evicted first,
+        and each entry lives no longer than its time to live.
+    """
+
+    MISSING = object()
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=MISSING):
+        """
+        :returns: a cached value, or `default` (LRUCache.MISSING if not passed) if there's no such
+        """
+        entry = self.entries.get(key)
+
+        if entry is not None:
+            value, expire_at = entry
+            if expire_at > time.time():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self.entries[key]
+
+        self.misses += 1
+        return default
+
+    def set(self, key, value, ttl=None):
+        self.entries[key] = (value, time.time() + (self.ttl if ttl is None else ttl))
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def pop(self, key):
+        entry = self.entries.pop(key, None)
+        return None if entry is None else entry[0]
+
+    def pop_if(self, predicate):
+        """
+        Removes every entry `predicate(key, value)` is true for
+        """
+        for key, (value, expire_at) in list(self.entries.items()):
+            if predicate(key, value):
+                del self.entries[key]
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        requests = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": float(self.hits) / requests if requests else 0.0
+        }
+
+
+class SharedVersions(object):
+    """
+    Versions of what every instance of the service keeps in memory, stored in a key/value storage shared
+        between the instances, so a change made by one of them (a version bumped) reaches the others.
+
+    A version is remembered in process for `ttl` seconds, so the others see a change no later than that,
+        at the cost of a round trip to the storage per key that often.
+    If no key/value storage is passed, versions are kept in process.
+    """
+
+    def __init__(self, kv, prefix, max_keys, ttl):
+        self.kv = kv
+        self.prefix = prefix
+        self.versions = LRUCache(max_size=max_keys, ttl=ttl)
+        self.local = {}
+
+    def __key__(self, key):
+        return "{0}:{1}".format(self.prefix, key)
+
+    async def get(self, key):
+        if self.kv is None:
+            return self.local.get(key, 0)
+
+        version = self.versions.get(key)
+
+        if version is not LRUCache.MISSING:
+            return version
+
+        # noinspection PyBroadException
+        try:
+            async with self.kv.acquire() as kv:
+                version = int(await kv.get(self.__key__(key)) or 0)
+        except Exception:
+            logging.exception("Failed to get version '{0}'".format(self.__key__(key)))
+            version = self.local.get(key, 0)
+
+        self.local[key] = version
+        self.versions.set(key, version)
+        return version
+
+    async def bump(self, key):
+        version = self.local.get(key, 0) + 1
+
+        if self.kv is not None:
+            # noinspection PyBroadException
+            try:
+                async with self.kv.acquire() as kv:
+                    version = int(await kv.incr(self.__key__(key)))
+            except Exception:
+                logging.exception("Failed to bump version '{0}'".format(self.__key__(key)))
+
+        self.local[key] = version
+        self.versions.set(key, version)
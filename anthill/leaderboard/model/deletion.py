@@ -0,0 +1,230 @@
+from tornado.ioloop import PeriodicCallback, IOLoop
+
+from anthill.common.database import DatabaseError
+
+import asyncio
+import logging
+import ujson
+
+
+class AccountsDeletionError(Exception):
+    def __init__(self, message):
+        self.message = message
+
+    def __str__(self):
+        return self.message
+
+
+class AccountsDeletion(object):
+    """
+    Deletes everything of deleted accounts, no matter how many accounts are deleted at once.
+
+    Accounts are deleted as a job, stored in `leaderboard_deletion_jobs` along with how far it went:
+        the accounts are split into chunks of `chunk_size`, and each chunk is deleted with short statements
+        of its own (see delete_chunk), paced to at most `rate` accounts per second so the ranked reads
+        never wait behind it. Progress is stored after every chunk.
+
+    A job that has been interrupted (say, the process has been restarted) is resumed from the chunk it stopped at,
+        by any instance of the service, every `interval` seconds. A job is run by a single instance at a time.
+    """
+
+    LOCK_NAME = "leaderboard_accounts_deletion_{0}"
+
+    # finished jobs are kept for this long, to see what has been deleted
+    KEEP_FINISHED_DAYS = 30
+
+    def __init__(self, db, delete_chunk, on_done, interval, chunk_size, rate):
+        """
+        :param delete_chunk: a coroutine function accepting a gamespace_id (or None for every gamespace)
+            and a list of account ids, returning a dict of table -> rows deleted
+        :param on_done: a coroutine function accepting a gamespace_id (or None), called once a job is done
+        """
+        self.db = db
+        self.delete_chunk = delete_chunk
+        self.on_done = on_done
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self.rate = rate
+
+        self.periodic = None
+        self.resuming = False
+
+        self.jobs = 0
+        self.resumed = 0
+        self.accounts = 0
+        self.chunks = 0
+        self.failed = 0
+        self.deleted = {}
+
+    def start(self):
+        self.periodic = PeriodicCallback(
+            lambda: IOLoop.current().spawn_callback(self.resume), self.interval * 1000)
+        self.periodic.start()
+
+    def stop(self):
+        if self.periodic is not None:
+            self.periodic.stop()
+            self.periodic = None
+
+    def stats(self):
+        return {
+            "jobs": self.jobs,
+            "resumed": self.resumed,
+            "accounts": self.accounts,
+            "chunks": self.chunks,
+            "failed": self.failed,
+            "deleted": dict(self.deleted)
+        }
+
+    async def create(self, gamespace_id, accounts):
+        """
+        :param gamespace_id: a gamespace to delete the accounts in, or None to delete them in every gamespace
+        :returns: an id of a new job
+        """
+        accounts = [int(account_id) for account_id in accounts]
+
+        try:
+            return await self.db.insert(
+                """
+                    INSERT INTO `leaderboard_deletion_jobs`
+                    (`gamespace_id`, `job_accounts`, `job_total`, `job_deleted`)
+                    VALUES (%s, %s, %s, '{}');
+                """, gamespace_id, ujson.dumps(accounts), len(accounts))
+        except DatabaseError as e:
+            raise AccountsDeletionError("Failed to create a deletion job: " + e.args[1])
+
+    async def list_jobs(self, limit=50):
+        try:
+            jobs = await self.db.query(
+                """
+                    SELECT `job_id`, `gamespace_id`, `job_status`, `job_position`, `job_total`,
+                        CAST(`job_deleted` AS CHAR) AS `job_deleted`,
+                        UNIX_TIMESTAMP(`created_at`) AS `created_at`, UNIX_TIMESTAMP(`updated_at`) AS `updated_at`
+                    FROM `leaderboard_deletion_jobs`
+                    ORDER BY `job_id` DESC
+                    LIMIT %s;
+                """, limit)
+        except DatabaseError as e:
+            raise AccountsDeletionError("Failed to list deletion jobs: " + e.args[1])
+
+        for job in jobs:
+            job["job_deleted"] = ujson.loads(job["job_deleted"])
+
+        return jobs
+
+    async def run(self, job_id):
+        """
+        Runs a job until every account of it is deleted
+        :returns: a dict of table -> rows deleted by the job (as a whole, if resumed), or None if the job is
+            being run by someone else, or is finished already
+        """
+
+        lock_name = AccountsDeletion.LOCK_NAME.format(job_id)
+
+        try:
+            async with self.db.acquire() as db:
+                locked = await db.get(
+                    """
+                        SELECT GET_LOCK(%s, 0) AS `locked`;
+                    """, lock_name)
+
+                if not locked or not locked["locked"]:
+                    return None
+
+                try:
+                    return await self.__run__(db, job_id)
+                finally:
+                    await db.get(
+                        """
+                            SELECT RELEASE_LOCK(%s);
+                        """, lock_name)
+        except DatabaseError as e:
+            self.failed += 1
+            raise AccountsDeletionError("Failed to delete accounts: " + e.args[1])
+
+    async def __run__(self, db, job_id):
+        job = await db.get(
+            """
+                SELECT `gamespace_id`, `job_status`, `job_accounts`, `job_position`,
+                    CAST(`job_deleted` AS CHAR) AS `job_deleted`
+                FROM `leaderboard_deletion_jobs`
+                WHERE `job_id`=%s;
+            """, job_id)
+
+        if job is None or job["job_status"] != "running":
+            return None
+
+        gamespace_id = job["gamespace_id"]
+        accounts = ujson.loads(job["job_accounts"])
+        position = job["job_position"]
+        deleted = ujson.loads(job["job_deleted"])
+
+        pause = float(self.chunk_size) / self.rate
+
+        while position < len(accounts):
+            chunk = accounts[position:position + self.chunk_size]
+
+            for table, count in (await self.delete_chunk(gamespace_id, chunk)).items():
+                deleted[table] = deleted.get(table, 0) + count
+                self.deleted[table] = self.deleted.get(table, 0) + count
+
+            position += len(chunk)
+            self.accounts += len(chunk)
+            self.chunks += 1
+
+            await db.execute(
+                """
+                    UPDATE `leaderboard_deletion_jobs`
+                    SET `job_position`=%s, `job_deleted`=%s, `job_status`=%s
+                    WHERE `job_id`=%s;
+                """, position, ujson.dumps(deleted), "running" if position < len(accounts) else "done", job_id)
+
+            if position < len(accounts):
+                await asyncio.sleep(pause)
+
+        self.jobs += 1
+
+        # noinspection PyBroadException
+        try:
+            await self.on_done(gamespace_id)
+        except Exception:
+            logging.exception("Failed to process deleted accounts")
+
+        return deleted
+
+    async def resume(self):
+        """
+        Runs the jobs nobody runs, and deletes the old finished ones
+        """
+        if self.resuming:
+            return
+
+        self.resuming = True
+
+        # noinspection PyBroadException
+        try:
+            jobs = await self.db.query(
+                """
+                    SELECT `job_id`
+                    FROM `leaderboard_deletion_jobs`
+                    WHERE `job_status`='running'
+                    ORDER BY `job_id`;
+                """)
+
+            for job in jobs:
+                if self.periodic is None:
+                    break
+                if await self.run(job["job_id"]) is not None:
+                    self.resumed += 1
+                    logging.info("Resumed accounts deletion job {0}".format(job["job_id"]))
+
+            await self.db.execute(
+                """
+                    DELETE FROM `leaderboard_deletion_jobs`
+                    WHERE `job_status`='done' AND `updated_at` < NOW() - INTERVAL %s DAY
+                    LIMIT 100;
+                """, AccountsDeletion.KEEP_FINISHED_DAYS)
+        except Exception:
+            logging.exception("Failed to resume accounts deletion")
+        finally:
+            self.resuming = False
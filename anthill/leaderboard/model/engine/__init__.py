@@ -0,0 +1,121 @@
+import ujson
+
+# a new score always replaces the stored one
+POLICY_LATEST = "latest"
+# a new score is stored only if it's better than the stored one (according to the sort order)
+POLICY_BEST = "best"
+# a new score is added to the stored one
+POLICY_INCREMENT = "increment"
+
+POLICIES = [POLICY_LATEST, POLICY_BEST, POLICY_INCREMENT]
+
+
+def encode_profile(profile):
+    """
+    :returns: a profile as JSON text, the way engines store (and return) it. Already encoded ones are kept as is.
+    """
+    if isinstance(profile, str):
+        return profile
+    return ujson.dumps(profile, escape_forward_slashes=False)
+
+
+class StorageError(Exception):
+    def __init__(self, message):
+        self.message = message
+
+    def __str__(self):
+        return self.message
+
+
+class StorageEngine(object):
+    """
+    Storage of leaderboard records, and ranking of them. Leaderboards themselves, and the clusters,
+        are always kept in MySQL by the LeaderboardsModel, an engine only cares about the records.
+
+    A record is a dict with `account_id`, `display_name`, `score`, `profile` and `cluster_id`.
+    Profiles are never decoded: they're passed in, stored and returned as JSON text (see encode_profile).
+    A ranked record is a (rank, record) tuple, ranks start with 1.
+    Records are ordered by (score, account_id), both in the sort order of the leaderboard,
+        and ranked within the cluster they belong to.
+
+    `leaderboard` arguments are LeaderboardAdapter instances.
+    `since` arguments of the ranked reads are unix times the read has to see every write made up to
+        (read-your-writes, see ReplicaPool), or None if a slightly stale read would do.
+        Engines that always read what's been written ignore it.
+    Every method raises StorageError upon failure.
+    """
+
+    async def started(self):
+        pass
+
+    async def stopped(self):
+        pass
+
+    async def insert_record(self, gamespace_id, leaderboard, cluster_id, account_id,
+                            display_name, score, time_to_live, profile):
+        """
+        Inserts a record, or updates the existing one of the same account, according to the leaderboard policy.
+        :returns: True if the stored record has been changed
+        """
+        raise NotImplementedError()
+
+    async def write_records(self, gamespace_id, leaderboard, cluster_id, records):
+        """
+        Same as insert_record, for a batch of PendingRecord
+        """
+        raise NotImplementedError()
+
+    async def list_top(self, gamespace_id, leaderboard, cluster_id, offset, limit, after=None, since=None):
+        """
+        :param after: a (score, account_id, rank) of the last record seen, to list the records after it
+            instead of at an offset
+        :returns: a list of ranked records
+        """
+        raise NotImplementedError()
+
+    async def list_around(self, gamespace_id, leaderboard, cluster_id, account_id, offset, limit, since=None):
+        """
+        :param cluster_id: a cluster to look in, or None to look in the one the account's record belongs to
+        :returns: a list of ranked records around the account's one, or None if the account has no record
+        """
+        raise NotImplementedError()
+
+    async def get_score(self, gamespace_id, leaderboard, cluster_id, account_id):
+        """
+        :param cluster_id: a cluster to look in, or None to look in the one the account's record belongs to
+        :returns: a score of the account's record, or None if the account has no record
+        """
+        raise NotImplementedError()
+
+    async def list_accounts(self, gamespace_id, leaderboard, account_ids, offset, limit, since=None):
+        """
+        :returns: a list of ranked records of the accounts given, each ranked within its cluster
+        """
+        raise NotImplementedError()
+
+    async def list_clusters(self, gamespace_id, leaderboard, cluster_ids, limit, since=None):
+        """
+        :returns: a dict of cluster_id -> list of `limit` top ranked records of that cluster,
+            empty clusters are omitted
+        """
+        raise NotImplementedError()
+
+    async def records_expired(self, gamespace_id, leaderboard_id, cluster_id):
+        """
+        Called once records of a cluster have been expired in the `records` table
+        """
+        pass
+
+    async def delete_record(self, gamespace_id, leaderboard, account_id):
+        raise NotImplementedError()
+
+    async def delete_leaderboard(self, gamespace_id, leaderboard_id):
+        raise NotImplementedError()
+
+    async def delete_accounts(self, gamespace_id, account_ids):
+        """
+        Deletes records of the accounts in every leaderboard of a gamespace,
+            or of every gamespace if gamespace_id is None
+        :returns: amount of records deleted
+        """
+        raise NotImplementedError()
@@ -0,0 +1,696 @@
+from anthill.common.database import DatabaseError
+
+from . import StorageEngine, StorageError, POLICY_LATEST, POLICY_BEST, POLICY_INCREMENT
+
+import asyncio
+import struct
+import time
+
+
+class MySQLEngine(StorageEngine):
+    """
+    Keeps the records in the `records` table (or another one of the same schema, see `table`),
+        ranked by the `leaderboard_rank` index.
+    Profiles are read as text (CAST AS CHAR), so they're never parsed.
+    If the rank indexes are passed, small leaderboards are also kept ranked in memory (see RankIndexes).
+    If the replicas are passed, ranked reads go to the replicas (see ReplicaPool), everything else
+        (rank indexes are loaded with the writes, so those too) stays on the primary.
+    """
+
+    # records deleted by a single statement, when records of accounts are deleted
+    DELETE_BATCH_SIZE = 1000
+
+    def __init__(self, db, rank_indexes=None, concurrency=8, table="records", replicas=None, partition_of=None):
+        """
+        :param partition_of: a function of a leaderboard returning the `period_expire_day` its records go with,
+            if the table is partitioned by it, see PeriodRotation
+        """
+        self.db = db
+        self.table = table
+        self.rank_indexes = rank_indexes
+        self.concurrency = concurrency
+        self.replicas = replicas
+        self.partition_of = partition_of
+
+    def __partition__(self, leaderboard, alias=""):
+        """
+        :returns: a condition narrowing a query down to the partition of the leaderboard's records,
+            if the table is partitioned, so the other partitions are not even looked at
+        """
+        if self.partition_of is None:
+            return ""
+        return "AND {0}`period_expire_day`={1}".format(alias, self.__partition_value__(leaderboard))
+
+    def __partition_value__(self, leaderboard):
+        try:
+            return int(self.partition_of(leaderboard))
+        except ValueError as e:
+            raise StorageError(str(e))
+
+    def __partition_columns__(self, leaderboard):
+        """
+        :returns: a column, and a value of it, to add to an insert into a partitioned table
+        """
+        if self.partition_of is None:
+            return "", ""
+        return ", `period_expire_day`", ", {0}".format(self.__partition_value__(leaderboard))
+
+    def __reader__(self, since):
+        """
+        :returns: a database to run a ranked read on
+        """
+        if self.replicas is None:
+            return self.db
+        return self.replicas.reader(since)
+
+    @staticmethod
+    def __better__(sort_order):
+        """
+        Comparison operator for a record that goes higher in the leaderboard.
+        Records are always ordered by (score, account_id), both in the same direction.
+        """
+        return ">" if sort_order == "desc" else "<"
+
+    @staticmethod
+    def __float_score__(score):
+        """
+        `score` is a single-precision column, and MySQL returns it rounded to its shortest representation.
+        Such a value compared as a double is not equal to the stored one, so it has to be rounded
+            back to single precision before going into a query as a boundary.
+        """
+        return struct.unpack("f", struct.pack("f", score))[0]
+
+    @staticmethod
+    def __record_update__(policy, sort_order):
+        """
+        Returns ON DUPLICATE KEY UPDATE clause of the record upsert for a policy given.
+        Please note MySQL applies the assignments left to right, so `score` has to go last.
+        """
+
+        if policy == POLICY_BEST:
+            better = "(`score` IS NULL OR VALUES(`score`) {0} `score`)".format(
+                MySQLEngine.__better__(sort_order))
+
+            # nothing changes at all if the score is not better, so the row is not even written
+            return """
+                `expire_at`=IF({0}, VALUES(`expire_at`), `expire_at`),
+                `profile`=IF({0}, VALUES(`profile`), `profile`),
+                `display_name`=IF({0}, VALUES(`display_name`), `display_name`),
+                `score`=IF({0}, VALUES(`score`), `score`)
+            """.format(better)
+
+        if policy == POLICY_INCREMENT:
+            score = "IFNULL(`score`, 0) + VALUES(`score`)"
+        else:
+            score = "VALUES(`score`)"
+
+        return """
+            `expire_at`=VALUES(`expire_at`), `profile`=VALUES(`profile`),
+            `display_name`=VALUES(`display_name`), `score`={0}
+        """.format(score)
+
+    async def __get_rank_index__(self, gamespace_id, leaderboard_id, cluster_id, sort_order):
+        """
+        :returns: a RankIndex for a cluster of a leaderboard, or None if the rank indexes are disabled,
+            or the leaderboard is too big to be kept in memory
+        """
+
+        if self.rank_indexes is None:
+            return None
+
+        async def load(max_records):
+            # a leaderboard too big is told by the index alone, without reading its records
+            if await self.count_records(gamespace_id, leaderboard_id, cluster_id, max_records + 1) > max_records:
+                return None
+
+            records = await self.load_records(gamespace_id, leaderboard_id, cluster_id, max_records + 1)
+
+            if len(records) > max_records:
+                return None
+
+            return records
+
+        return await self.rank_indexes.get(
+            (gamespace_id, leaderboard_id, cluster_id), sort_order, load)
+
+    def __update_rank_index__(self, gamespace_id, leaderboard_id, cluster_id, account_id,
+                              display_name, score, time_to_live, profile):
+
+        if self.rank_indexes is None:
+            return
+
+        self.rank_indexes.update((gamespace_id, leaderboard_id, cluster_id), {
+            "account_id": int(account_id),
+            "display_name": display_name,
+            "score": score,
+            "profile": profile,
+            "cluster_id": cluster_id,
+            "expire_at": time.time() + int(time_to_live)
+        })
+
+    async def count_records(self, gamespace_id, leaderboard_id, cluster_id, limit):
+        """
+        :returns: amount of records of a cluster (expired ones too), but `limit` at most, counted over
+            the `leaderboard_rank` index, so it stops at `limit` index entries whatever the size of the cluster is
+        """
+        try:
+            counted = await self.db.get(
+                """
+                    SELECT COUNT(*) AS `count`
+                    FROM (
+                        SELECT 1
+                        FROM `{table}`
+                        WHERE `gamespace_id`=%s AND `leaderboard_id`=%s AND `cluster_id`=%s
+                        LIMIT %s
+                    ) AS `limited`;
+                """.format(table=self.table), gamespace_id, leaderboard_id, cluster_id, limit)
+        except DatabaseError as e:
+            raise StorageError("Failed to count records: " + e.args[1])
+
+        return counted["count"]
+
+    async def load_records(self, gamespace_id, leaderboard_id, cluster_id, after, limit):
+        """
+        Walks alive records of a cluster, in pages, by the `account_record` key
+        :param after: account_id of the last record of the previous page, None for the first page
+        :returns: a page of records, with `expire_at` as a unix timestamp
+        """
+        try:
+            return await self.db.query(
+                """
+                    SELECT `account_id`, `display_name`, `score`, CAST(`profile` AS CHAR) AS `profile`, `cluster_id`,
+                        UNIX_TIMESTAMP(`expire_at`) AS `expire_at`
+                    FROM `{table}`
+                    WHERE `gamespace_id`=%s AND `leaderboard_id`=%s AND `account_id` > %s AND `cluster_id`=%s
+                        AND `expire_at` > NOW()
+                    ORDER BY `account_id`
+                    LIMIT %s;
+                """.format(table=self.table), gamespace_id, leaderboard_id,
+                0 if after is None else after, cluster_id, int(limit))
+        except DatabaseError as e:
+            raise StorageError("Failed to load records: " + e.args[1])
+
+    async def load_accounts(self, gamespace_id, leaderboard_id, account_ids):
+        """
+        :returns: records of the accounts given, as they're stored (expired ones too), in every cluster,
+            with `expire_at` as a unix timestamp
+        """
+        try:
+            return await self.db.query(
+                """
+                    SELECT `account_id`, `display_name`, `score`, CAST(`profile` AS CHAR) AS `profile`, `cluster_id`,
+                        UNIX_TIMESTAMP(`expire_at`) AS `expire_at`
+                    FROM `{table}`
+                    WHERE `gamespace_id`=%s AND `leaderboard_id`=%s AND `account_id` IN %s;
+                """.format(table=self.table), gamespace_id, leaderboard_id, account_ids)
+        except DatabaseError as e:
+            raise StorageError("Failed to load records: " + e.args[1])
+
+    async def load_page(self, gamespace_id, leaderboard_id, after, limit):
+        """
+        Walks every record of a leaderboard, in pages, by the `account_record` key
+        :param after: (account_id, cluster_id) of the last record of the previous page, None for the first page
+        :returns: a page of records, with `expire_at` as a unix timestamp
+        """
+
+        if after is None:
+            seek = ""
+            args = []
+        else:
+            seek = "AND (`account_id` > %s OR (`account_id`=%s AND `cluster_id` > %s))"
+            args = [after[0], after[0], after[1]]
+
+        try:
+            return await self.db.query(
+                """
+                    SELECT `account_id`, `display_name`, `score`, CAST(`profile` AS CHAR) AS `profile`, `cluster_id`,
+                        UNIX_TIMESTAMP(`expire_at`) AS `expire_at`
+                    FROM `{table}`
+                    WHERE `gamespace_id`=%s AND `leaderboard_id`=%s {0}
+                    ORDER BY `account_id`, `cluster_id`
+                    LIMIT %s;
+                """.format(seek, table=self.table), gamespace_id, leaderboard_id, *(args + [int(limit)]))
+        except DatabaseError as e:
+            raise StorageError("Failed to load records: " + e.args[1])
+
+    async def copy_records(self, gamespace_id, leaderboard_id, records, overwrite):
+        """
+        Stores records as they are (see load_page), regardless of the policy. Rank indexes are left as they are.
+        :param overwrite: replace the existing records of the same accounts, otherwise they're kept
+        """
+
+        if not records:
+            return
+
+        values = []
+        for record in records:
+            values.extend([
+                record["account_id"], leaderboard_id, gamespace_id, record["expire_at"],
+                record["profile"], record["score"], record["display_name"], record["cluster_id"]])
+
+        if overwrite:
+            update = """
+                ON DUPLICATE KEY UPDATE `expire_at`=VALUES(`expire_at`), `profile`=VALUES(`profile`),
+                    `display_name`=VALUES(`display_name`), `score`=VALUES(`score`)
+            """
+        else:
+            update = ""
+
+        try:
+            await self.db.execute(
+                """
+                    INSERT {ignore} INTO `{table}`
+                    (`account_id`, `leaderboard_id`, `gamespace_id`, `expire_at`,
+                    `profile`, `score`, `display_name`, `cluster_id`)
+                    VALUES {0}
+                    {1};
+                """.format(
+                    ", ".join(["(%s, %s, %s, FROM_UNIXTIME(%s), %s, %s, %s, %s)"] * len(records)), update,
+                    ignore="" if overwrite else "IGNORE", table=self.table),
+                *values)
+        except DatabaseError as e:
+            raise StorageError("Failed to copy records: " + e.args[1])
+
+    async def insert_record(self, gamespace_id, leaderboard, cluster_id, account_id,
+                            display_name, score, time_to_live, profile):
+        """
+        Upserts a record in a single statement, relying on the `account_record` unique key of the `records` table.
+        """
+
+        column, value = self.__partition_columns__(leaderboard)
+
+        async with self.db.acquire() as db:
+            try:
+                # 1 if the record is inserted, 2 if updated, 0 if nothing has changed
+                affected = await db.execute(
+                    """
+                        INSERT INTO `{table}`
+                        (`account_id`, `leaderboard_id`, `gamespace_id`, `expire_at`,
+                        `profile`, `score`, `display_name`, `cluster_id`{1})
+                        VALUES (%s, %s, %s, NOW() + INTERVAL %s SECOND, %s, %s, %s, %s{2})
+                        ON DUPLICATE KEY UPDATE {0};
+                    """.format(
+                        MySQLEngine.__record_update__(leaderboard.policy, leaderboard.sort_order), column, value,
+                        table=self.table),
+                    account_id, leaderboard.leaderboard_id, gamespace_id, time_to_live,
+                    profile, score, display_name, cluster_id)
+
+                changed = affected > 0
+
+                if changed and self.rank_indexes is not None and affected != 1 and \
+                        leaderboard.policy == POLICY_INCREMENT:
+                    stored = await db.get(
+                        """
+                            SELECT `score`
+                            FROM `{table}`
+                            WHERE `gamespace_id`=%s AND `leaderboard_id`=%s AND `account_id`=%s AND `cluster_id`=%s
+                                {0};
+                        """.format(self.__partition__(leaderboard), table=self.table),
+                        gamespace_id, leaderboard.leaderboard_id, account_id, cluster_id)
+
+                    if stored:
+                        score = stored["score"]
+
+            except DatabaseError as e:
+                raise StorageError("Failed to insert record: " + e.args[1])
+
+        if changed:
+            self.__update_rank_index__(
+                gamespace_id, leaderboard.leaderboard_id, cluster_id, account_id,
+                display_name, score, time_to_live, profile)
+
+        return changed
+
+    async def write_records(self, gamespace_id, leaderboard, cluster_id, records):
+        """
+        Writes a batch of records with a single multi-row upsert
+        """
+
+        column, value = self.__partition_columns__(leaderboard)
+
+        values = []
+        for record in records:
+            values.extend([
+                record.account_id, leaderboard.leaderboard_id, gamespace_id, record.time_to_live,
+                record.profile, record.score, record.display_name, cluster_id])
+
+        try:
+            await self.db.execute(
+                """
+                    INSERT INTO `{table}`
+                    (`account_id`, `leaderboard_id`, `gamespace_id`, `expire_at`,
+                    `profile`, `score`, `display_name`, `cluster_id`{2})
+                    VALUES {0}
+                    ON DUPLICATE KEY UPDATE {1};
+                """.format(
+                    ", ".join(["(%s, %s, %s, NOW() + INTERVAL %s SECOND, %s, %s, %s, %s{0})".format(value)] *
+                              len(records)),
+                    MySQLEngine.__record_update__(leaderboard.policy, leaderboard.sort_order), column,
+                    table=self.table),
+                *values)
+        except DatabaseError as e:
+            raise StorageError("Failed to write records: " + e.args[1])
+
+        key = (gamespace_id, leaderboard.leaderboard_id, cluster_id)
+
+        if self.rank_indexes is None or not self.rank_indexes.loaded(key):
+            return
+
+        if leaderboard.policy == POLICY_LATEST:
+            for record in records:
+                self.__update_rank_index__(
+                    gamespace_id, leaderboard.leaderboard_id, cluster_id, record.account_id,
+                    record.display_name, record.score, record.time_to_live, record.profile)
+            return
+
+        # only the database knows what the resulting records are
+        try:
+            stored = await self.db.query(
+                """
+                    SELECT `account_id`, `display_name`, `score`, CAST(`profile` AS CHAR) AS `profile`, `cluster_id`,
+                        UNIX_TIMESTAMP(`expire_at`) AS `expire_at`
+                    FROM `{table}`
+                    WHERE `gamespace_id`=%s AND `leaderboard_id`=%s AND `cluster_id`=%s AND `account_id` IN %s {0};
+                """.format(self.__partition__(leaderboard), table=self.table),
+                gamespace_id, leaderboard.leaderboard_id, cluster_id,
+                [record.account_id for record in records])
+        except DatabaseError as e:
+            raise StorageError("Failed to read written records: " + e.args[1])
+
+        for record in stored:
+            self.rank_indexes.update(key, record)
+
+    async def list_top(self, gamespace_id, leaderboard, cluster_id, offset, limit, after=None, since=None):
+
+        offset = int(offset)
+        limit = int(limit)
+        sort_order = leaderboard.sort_order
+
+        index = await self.__get_rank_index__(
+            gamespace_id, leaderboard.leaderboard_id, cluster_id, sort_order)
+
+        if index is not None:
+            if after is not None:
+                score, account_id, rank = after
+                return index.after(score, account_id, limit)
+            return index.slice(offset, limit)
+
+        if after is not None:
+            score, account_id, rank = after
+            worse = "<" if MySQLEngine.__better__(sort_order) == ">" else ">"
+            score = MySQLEngine.__float_score__(score)
+            seek = "AND (`score` {0} %s OR (`score`=%s AND `account_id` {0} %s))".format(worse)
+            args = [gamespace_id, leaderboard.leaderboard_id, cluster_id, score, score, account_id, 0, limit]
+            first_rank = rank + 1
+        else:
+            seek = ""
+            args = [gamespace_id, leaderboard.leaderboard_id, cluster_id, offset, limit]
+            first_rank = offset + 1
+
+        try:
+            records = await self.__reader__(since).query(
+                """
+                    SELECT `account_id`, `display_name`, `score`, CAST(`profile` AS CHAR) AS `profile`
+                    FROM `{table}`
+                    WHERE `gamespace_id`=%s AND `leaderboard_id`=%s AND `cluster_id`=%s {1} {partition}
+                    ORDER BY `score` {0}, `account_id` {0}
+                    LIMIT %s, %s;
+                """.format(sort_order.upper(), seek, partition=self.__partition__(leaderboard), table=self.table),
+                *args)
+        except DatabaseError as e:
+            raise StorageError("Failed to get top records: " + e.args[1])
+
+        return list(enumerate(records, start=first_rank))
+
+    async def list_around(self, gamespace_id, leaderboard, cluster_id, account_id, offset, limit, since=None):
+
+        offset = int(offset)
+        limit = int(limit)
+        sort_order = leaderboard.sort_order
+        better = MySQLEngine.__better__(sort_order)
+        worse = "<" if better == ">" else ">"
+        order = sort_order.upper()
+        reverse = "ASC" if order == "DESC" else "DESC"
+        partition = self.__partition__(leaderboard)
+
+        async with self.__reader__(since).acquire() as db:
+            try:
+                user_record = None
+
+                if cluster_id is None:
+                    user_record = await db.get(
+                        """
+                            SELECT `score`, `cluster_id`
+                            FROM `{table}`
+                            WHERE `leaderboard_id`=%s AND `account_id`=%s AND `gamespace_id`=%s {partition}
+                            LIMIT 1;
+                        """.format(partition=partition, table=self.table),
+                        leaderboard.leaderboard_id, account_id, gamespace_id)
+
+                    if not user_record:
+                        return None
+
+                    cluster_id = user_record["cluster_id"]
+
+                index = await self.__get_rank_index__(
+                    gamespace_id, leaderboard.leaderboard_id, cluster_id, sort_order)
+
+                if index is not None:
+                    return index.around(account_id, offset, limit)
+
+                if user_record is None:
+                    user_record = await db.get(
+                        """
+                            SELECT `score`, `cluster_id`
+                            FROM `{table}`
+                            WHERE `leaderboard_id`=%s AND `account_id`=%s AND `gamespace_id`=%s {partition}
+                            LIMIT 1;
+                        """.format(partition=partition, table=self.table),
+                        leaderboard.leaderboard_id, account_id, gamespace_id)
+
+                    if not user_record:
+                        return None
+
+                user_score = MySQLEngine.__float_score__(user_record["score"])
+
+                user_rank = await db.get(
+                    """
+                        SELECT COUNT(*) AS `count`
+                        FROM `{table}`
+                        WHERE `gamespace_id`=%s AND `leaderboard_id`=%s AND `cluster_id`=%s {partition} AND
+                            (`score` {0} %s OR (`score`=%s AND `account_id` {0} %s));
+                    """.format(better, partition=partition, table=self.table),
+                    gamespace_id, leaderboard.leaderboard_id, cluster_id, user_score, user_score, account_id)
+
+                user_rank = user_rank["count"] + 1
+
+                records_before = await db.query(
+                    """
+                        SELECT `account_id`, `display_name`, `score`, CAST(`profile` AS CHAR) AS `profile`
+                        FROM `{table}`
+                        WHERE `gamespace_id`=%s AND `leaderboard_id`=%s AND `cluster_id`=%s {partition} AND
+                            (`score` {0} %s OR (`score`=%s AND `account_id` {0} %s))
+                        ORDER BY `score` {1}, `account_id` {1}
+                        LIMIT %s;
+                    """.format(better, reverse, partition=partition, table=self.table),
+                    gamespace_id, leaderboard.leaderboard_id, cluster_id, user_score, user_score, account_id,
+                    limit // 2)
+
+                records_after = await db.query(
+                    """
+                        SELECT `account_id`, `display_name`, `score`, CAST(`profile` AS CHAR) AS `profile`
+                        FROM `{table}`
+                        WHERE `gamespace_id`=%s AND `leaderboard_id`=%s AND `cluster_id`=%s {partition} AND
+                            (`score` {0} %s OR (`score`=%s AND `account_id` {0}= %s))
+                        ORDER BY `score` {1}, `account_id` {1}
+                        LIMIT %s;
+                    """.format(worse, order, partition=partition, table=self.table),
+                    gamespace_id, leaderboard.leaderboard_id, cluster_id, user_score, user_score, account_id,
+                    limit - len(records_before))
+            except DatabaseError as e:
+                raise StorageError("Failed to get records around: " + e.args[1])
+
+        records = list(reversed(records_before)) + list(records_after)
+        first_rank = user_rank - len(records_before)
+
+        return list(enumerate(records, start=first_rank))[offset:offset + limit]
+
+    async def get_score(self, gamespace_id, leaderboard, cluster_id, account_id):
+
+        partition = self.__partition__(leaderboard)
+
+        try:
+            if cluster_id is None:
+                record = await self.db.get(
+                    """
+                        SELECT `score`
+                        FROM `{table}`
+                        WHERE `gamespace_id`=%s AND `leaderboard_id`=%s AND `account_id`=%s {partition}
+                        LIMIT 1;
+                    """.format(partition=partition, table=self.table),
+                    gamespace_id, leaderboard.leaderboard_id, account_id)
+            else:
+                record = await self.db.get(
+                    """
+                        SELECT `score`
+                        FROM `{table}`
+                        WHERE `gamespace_id`=%s AND `leaderboard_id`=%s AND `account_id`=%s AND `cluster_id`=%s
+                            {partition};
+                    """.format(partition=partition, table=self.table),
+                    gamespace_id, leaderboard.leaderboard_id, account_id, cluster_id)
+        except DatabaseError as e:
+            raise StorageError("Failed to get score: " + e.args[1])
+
+        if record is None or record["score"] is None:
+            return None
+
+        return float(record["score"])
+
+    async def list_accounts(self, gamespace_id, leaderboard, account_ids, offset, limit, since=None):
+
+        offset = int(offset)
+        limit = int(limit)
+
+        if not leaderboard.clustered:
+            index = await self.__get_rank_index__(
+                gamespace_id, leaderboard.leaderboard_id, 0, leaderboard.sort_order)
+
+            if index is not None:
+                return index.ranked(account_ids)[offset:offset + limit]
+
+        try:
+            # each account is ranked within the cluster it belongs to
+            records = await self.__reader__(since).query(
+                """
+                    SELECT `account_id`, `display_name`, `score`, CAST(`profile` AS CHAR) AS `profile`, `cluster_id`, (
+                        SELECT COUNT(*)
+                        FROM `{table}` AS `b`
+                        WHERE `b`.`gamespace_id`=`r`.`gamespace_id` AND `b`.`leaderboard_id`=`r`.`leaderboard_id`
+                            AND `b`.`cluster_id`=`r`.`cluster_id` {b_partition} AND (`b`.`score` {1} `r`.`score` OR
+                                (`b`.`score`=`r`.`score` AND `b`.`account_id` {1} `r`.`account_id`))
+                    ) + 1 AS `rank`
+                    FROM `{table}` AS `r`
+                    WHERE `r`.`leaderboard_id`=%s AND `r`.`gamespace_id`=%s AND `r`.`account_id` IN %s {r_partition}
+                    ORDER BY `r`.`score` {0}, `r`.`account_id` {0}
+                    LIMIT %s, %s;
+                """.format(
+                    leaderboard.sort_order.upper(), MySQLEngine.__better__(leaderboard.sort_order),
+                    b_partition=self.__partition__(leaderboard, "`b`."),
+                    r_partition=self.__partition__(leaderboard, "`r`."), table=self.table),
+                leaderboard.leaderboard_id, gamespace_id, account_ids, offset, limit)
+        except DatabaseError as e:
+            raise StorageError("Failed to get records: " + e.args[1])
+
+        return [
+            (record["rank"], record)
+            for record in records
+        ]
+
+    async def list_clusters(self, gamespace_id, leaderboard, cluster_ids, limit, since=None):
+        """
+        Every cluster is requested separately, so each query is a range of the `leaderboard_rank` index
+            that reads `limit` rows at most, no matter how big the leaderboard is.
+        The queries run concurrently, `concurrency` at most at a time.
+        """
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def list_cluster(cluster_id):
+            async with semaphore:
+                return cluster_id, await self.list_top(gamespace_id, leaderboard, cluster_id, 0, limit, since=since)
+
+        clusters = await asyncio.gather(*[
+            list_cluster(cluster_id)
+            for cluster_id in cluster_ids
+        ])
+
+        return {
+            cluster_id: records
+            for cluster_id, records in clusters
+            if records
+        }
+
+    async def records_expired(self, gamespace_id, leaderboard_id, cluster_id):
+        # the index knows when its records expire, so only the expired ones are dropped
+        if self.rank_indexes is not None:
+            self.rank_indexes.expire((gamespace_id, leaderboard_id, cluster_id))
+
+    async def delete_record(self, gamespace_id, leaderboard, account_id):
+
+        try:
+            await self.db.execute(
+                """
+                    DELETE FROM `{table}`
+                    WHERE `leaderboard_id`=%s AND `account_id`=%s AND `gamespace_id`=%s;
+                """.format(table=self.table), leaderboard.leaderboard_id, account_id, gamespace_id)
+        except DatabaseError as e:
+            raise StorageError("Failed to delete record: " + e.args[1])
+
+        if self.rank_indexes is not None:
+            self.rank_indexes.remove_account(gamespace_id, leaderboard.leaderboard_id, account_id)
+
+    async def delete_leaderboard(self, gamespace_id, leaderboard_id):
+
+        if self.rank_indexes is not None:
+            self.rank_indexes.drop(gamespace_id, leaderboard_id)
+
+        try:
+            await self.db.execute(
+                """
+                    DELETE FROM `{table}`
+                    WHERE `leaderboard_id` = %s AND `gamespace_id` = %s;
+                """.format(table=self.table), leaderboard_id, gamespace_id)
+        except DatabaseError as e:
+            raise StorageError("Failed to delete records: " + e.args[1])
+
+    async def purge_records(self, gamespace_id, leaderboard_id, limit):
+        """
+        Deletes up to `limit` records of a leaderboard that lives on elsewhere (say, in another shard),
+            so the rank indexes are left as they are
+        :returns: amount of records deleted
+        """
+        try:
+            return await self.db.execute(
+                """
+                    DELETE FROM `{table}`
+                    WHERE `gamespace_id`=%s AND `leaderboard_id`=%s
+                    LIMIT %s;
+                """.format(table=self.table), gamespace_id, leaderboard_id, int(limit))
+        except DatabaseError as e:
+            raise StorageError("Failed to purge records: " + e.args[1])
+
+    async def delete_accounts(self, gamespace_id, account_ids):
+
+        if self.rank_indexes is not None:
+            self.rank_indexes.remove_accounts(gamespace_id, account_ids)
+
+        if gamespace_id is not None:
+            query = """
+                DELETE
+                FROM `{table}`
+                WHERE `account_id` IN %s AND `gamespace_id`=%s
+                LIMIT %s;
+            """.format(table=self.table)
+            args = [account_ids, gamespace_id]
+        else:
+            query = """
+                DELETE
+                FROM `{table}`
+                WHERE `account_id` IN %s
+                LIMIT %s;
+            """.format(table=self.table)
+            args = [account_ids]
+
+        deleted = 0
+
+        try:
+            # found with the `account_id` index, and deleted in statements of bounded size, so locks are short
+            while True:
+                count = await self.db.execute(query, *(args + [MySQLEngine.DELETE_BATCH_SIZE]))
+                deleted += count
+                if count < MySQLEngine.DELETE_BATCH_SIZE:
+                    break
+        except DatabaseError as e:
+            raise StorageError("Failed to delete records: " + e.args[1])
+
+        return deleted
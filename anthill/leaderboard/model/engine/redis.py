@@ -0,0 +1,719 @@
+from . import StorageEngine, StorageError
+from .. cache import LRUCache
+
+import aioredis
+import asyncio
+import hashlib
+import time
+import ujson
+import uuid
+
+
+# Keys of a leaderboard, where {prefix} is rank:{gamespace_id}:{leaderboard_id}:
+#
+#   {prefix}:{cluster_id}           sorted set, member -> score
+#   {prefix}:{cluster_id}:data      hash, member -> JSON display name, a line break, and the JSON profile as is
+#   {prefix}:{cluster_id}:expire    sorted set, member -> expire_at
+#   {prefix}:{cluster_id}:loaded    is set once the cluster is completely loaded from the durable storage
+#   {prefix}:{cluster_id}:loading   a lock of the process loading the cluster, expires unless the load goes on
+#   {prefix}:accounts               hash, member -> cluster_id
+#   {prefix}:clusters               set of cluster ids
+#   rank:account:{member}           set of "{gamespace_id}:{leaderboard_id}" the account has records in
+#
+# A member is a zero-padded account id, so members of the same score are ordered exactly as account ids are.
+# Please note the scripts derive the keys from the prefix, so they require a single Redis instance.
+
+PRELUDE = """
+local prefix = KEYS[1]
+
+local function prune(board, now)
+    local expired = redis.call("ZRANGEBYSCORE", board .. ":expire", "-inf", now, "LIMIT", 0, 1000)
+    if #expired > 0 then
+        redis.call("ZREM", board, unpack(expired))
+        redis.call("ZREM", board .. ":expire", unpack(expired))
+        redis.call("HDEL", board .. ":data", unpack(expired))
+        redis.call("HDEL", prefix .. ":accounts", unpack(expired))
+    end
+end
+
+local function range(board, desc, start, stop)
+    if desc then
+        return redis.call("ZREVRANGE", board, start, stop, "WITHSCORES")
+    end
+    return redis.call("ZRANGE", board, start, stop, "WITHSCORES")
+end
+
+local function rank_of(board, desc, member)
+    if desc then
+        return redis.call("ZREVRANK", board, member)
+    end
+    return redis.call("ZRANK", board, member)
+end
+
+local function ranked(board, items, first_rank, result)
+    for i = 1, #items, 2 do
+        local member = items[i]
+        result[#result + 1] = member
+        result[#result + 1] = items[i + 1]
+        result[#result + 1] = redis.call("HGET", board .. ":data", member)
+        result[#result + 1] = first_rank + (i - 1) / 2
+    end
+    return result
+end
+
+local function remove(leaderboard, member)
+    local cluster = redis.call("HGET", leaderboard .. ":accounts", member)
+    if cluster then
+        local board = leaderboard .. ":" .. cluster
+        redis.call("ZREM", board, member)
+        redis.call("ZREM", board .. ":expire", member)
+        redis.call("HDEL", board .. ":data", member)
+        redis.call("HDEL", leaderboard .. ":accounts", member)
+    end
+end
+"""
+
+# ARGV: now, policy, desc, cluster_id, "{gamespace_id}:{leaderboard_id}", then (member, score, expire_at, data)
+#   for each record
+# returns 1 or 0 for each record, whether it has been changed
+WRITE = PRELUDE + """
+local board = prefix .. ":" .. ARGV[4]
+local policy = ARGV[2]
+local desc = ARGV[3] == "1"
+local changed = {}
+
+prune(board, ARGV[1])
+
+for i = 6, #ARGV, 4 do
+    local member = ARGV[i]
+    local score = tonumber(ARGV[i + 1])
+    local current = redis.call("ZSCORE", board, member)
+    local write = true
+
+    if current then
+        current = tonumber(current)
+        if policy == "best" then
+            write = (desc and score > current) or (not desc and score < current)
+        elseif policy == "increment" then
+            score = score + current
+        end
+    end
+
+    if write then
+        redis.call("ZADD", board, string.format("%.17g", score), member)
+        redis.call("ZADD", board .. ":expire", ARGV[i + 2], member)
+        redis.call("HSET", board .. ":data", member, ARGV[i + 3])
+        redis.call("HSET", prefix .. ":accounts", member, ARGV[4])
+        redis.call("SADD", "rank:account:" .. member, ARGV[5])
+        changed[#changed + 1] = 1
+    else
+        changed[#changed + 1] = 0
+    end
+end
+
+redis.call("SADD", prefix .. ":clusters", ARGV[4])
+return changed
+"""
+
+# ARGV: now, cluster_id, "{gamespace_id}:{leaderboard_id}", token, lock_ttl, then (member, score, expire_at, data)
+#   for each record
+# adds the records that are missing only, as the ones written since the load has started are newer;
+#   returns 0 if the loading lock is not held by the token anymore
+LOAD = PRELUDE + """
+local board = prefix .. ":" .. ARGV[2]
+local now = tonumber(ARGV[1])
+
+if redis.call("GET", board .. ":loading") ~= ARGV[4] then
+    return 0
+end
+
+redis.call("EXPIRE", board .. ":loading", ARGV[5])
+
+for i = 6, #ARGV, 4 do
+    local member = ARGV[i]
+    if tonumber(ARGV[i + 2]) > now and not redis.call("ZSCORE", board, member) then
+        redis.call("ZADD", board, ARGV[i + 1], member)
+        redis.call("ZADD", board .. ":expire", ARGV[i + 2], member)
+        redis.call("HSET", board .. ":data", member, ARGV[i + 3])
+        redis.call("HSET", prefix .. ":accounts", member, ARGV[2])
+        redis.call("SADD", "rank:account:" .. member, ARGV[3])
+    end
+end
+
+redis.call("SADD", prefix .. ":clusters", ARGV[2])
+return 1
+"""
+
+# ARGV: cluster_id, token, "1" if the load has succeeded
+# releases the loading lock (if the token still holds it), and marks the cluster loaded upon success
+LOADED = PRELUDE + """
+local board = prefix .. ":" .. ARGV[1]
+
+if redis.call("GET", board .. ":loading") == ARGV[2] then
+    redis.call("DEL", board .. ":loading")
+    if ARGV[3] == "1" then
+        redis.call("SET", board .. ":loaded", "1")
+        redis.call("SADD", prefix .. ":clusters", ARGV[1])
+    end
+end
+
+return 1
+"""
+
+# ARGV: now, desc, cluster_id, offset, limit (-1 for all of them)
+TOP = PRELUDE + """
+local board = prefix .. ":" .. ARGV[3]
+local start = tonumber(ARGV[4])
+local limit = tonumber(ARGV[5])
+local stop = -1
+
+if limit >= 0 then
+    stop = start + limit - 1
+end
+
+prune(board, ARGV[1])
+return ranked(board, range(board, ARGV[2] == "1", start, stop), start + 1, {})
+"""
+
+# ARGV: now, desc, cluster_id, score, member, limit
+AFTER = PRELUDE + """
+local board = prefix .. ":" .. ARGV[3]
+local desc = ARGV[2] == "1"
+local score = ARGV[4]
+local member = ARGV[5]
+local limit = tonumber(ARGV[6])
+local ties, better, more
+
+prune(board, ARGV[1])
+
+if desc then
+    ties = redis.call("ZREVRANGEBYSCORE", board, score, score)
+    better = redis.call("ZCOUNT", board, "(" .. score, "+inf")
+else
+    ties = redis.call("ZRANGEBYSCORE", board, score, score)
+    better = redis.call("ZCOUNT", board, "-inf", "(" .. score)
+end
+
+local items = {}
+local rank = better
+local first_rank = nil
+
+for _, tie in ipairs(ties) do
+    if #items / 2 >= limit then
+        break
+    end
+    rank = rank + 1
+    if (desc and tie < member) or (not desc and tie > member) then
+        first_rank = first_rank or rank
+        items[#items + 1] = tie
+        items[#items + 1] = score
+    end
+end
+
+first_rank = first_rank or rank + 1
+
+if #items / 2 < limit then
+    if desc then
+        more = redis.call("ZREVRANGEBYSCORE", board, "(" .. score, "-inf",
+            "WITHSCORES", "LIMIT", 0, limit - #items / 2)
+    else
+        more = redis.call("ZRANGEBYSCORE", board, "(" .. score, "+inf",
+            "WITHSCORES", "LIMIT", 0, limit - #items / 2)
+    end
+    for _, item in ipairs(more) do
+        items[#items + 1] = item
+    end
+end
+
+return ranked(board, items, first_rank, {})
+"""
+
+# ARGV: now, desc, cluster_id (empty to look up the account's one), member, limit
+AROUND = PRELUDE + """
+local desc = ARGV[2] == "1"
+local cluster = ARGV[3]
+local member = ARGV[4]
+local limit = tonumber(ARGV[5])
+
+if cluster == "" then
+    cluster = redis.call("HGET", prefix .. ":accounts", member)
+    if not cluster then
+        return false
+    end
+end
+
+local board = prefix .. ":" .. cluster
+prune(board, ARGV[1])
+
+local rank = rank_of(board, desc, member)
+if not rank then
+    return false
+end
+
+local start = math.max(0, rank - math.floor(limit / 2))
+return ranked(board, range(board, desc, start, start + limit - 1), start + 1, {})
+"""
+
+# ARGV: now, cluster_id (empty to look up the account's one), member
+SCORE = PRELUDE + """
+local cluster = ARGV[2]
+local member = ARGV[3]
+
+if cluster == "" then
+    cluster = redis.call("HGET", prefix .. ":accounts", member)
+    if not cluster then
+        return false
+    end
+end
+
+local board = prefix .. ":" .. cluster
+prune(board, ARGV[1])
+
+return redis.call("ZSCORE", board, member)
+"""
+
+# ARGV: now, desc, then members
+# returns (member, score, data, rank, cluster_id) for each member that has a record
+ACCOUNTS = PRELUDE + """
+local desc = ARGV[2] == "1"
+local pruned = {}
+local result = {}
+
+for i = 3, #ARGV do
+    local member = ARGV[i]
+    local cluster = redis.call("HGET", prefix .. ":accounts", member)
+    if cluster then
+        local board = prefix .. ":" .. cluster
+        if not pruned[board] then
+            prune(board, ARGV[1])
+            pruned[board] = true
+        end
+        local score = redis.call("ZSCORE", board, member)
+        if score then
+            result[#result + 1] = member
+            result[#result + 1] = score
+            result[#result + 1] = redis.call("HGET", board .. ":data", member)
+            result[#result + 1] = rank_of(board, desc, member) + 1
+            result[#result + 1] = cluster
+        end
+    end
+end
+
+return result
+"""
+
+# ARGV: member
+DELETE_RECORD = PRELUDE + """
+remove(prefix, ARGV[1])
+return 1
+"""
+
+DELETE_LEADERBOARD = PRELUDE + """
+for _, cluster in ipairs(redis.call("SMEMBERS", prefix .. ":clusters")) do
+    local board = prefix .. ":" .. cluster
+    redis.call("UNLINK", board, board .. ":data", board .. ":expire", board .. ":loaded",
+        board .. ":loading")
+end
+redis.call("UNLINK", prefix .. ":accounts", prefix .. ":clusters")
+return 1
+"""
+
+# ARGV: gamespace_id (empty for every gamespace), then members
+DELETE_ACCOUNTS = PRELUDE + """
+local gamespace = ARGV[1]
+local removed = 0
+
+for i = 2, #ARGV do
+    local member = ARGV[i]
+    local key = "rank:account:" .. member
+    for _, leaderboard in ipairs(redis.call("SMEMBERS", key)) do
+        if gamespace == "" or string.sub(leaderboard, 1, #gamespace + 1) == gamespace .. ":" then
+            remove("rank:" .. leaderboard, member)
+            redis.call("SREM", key, leaderboard)
+            removed = removed + 1
+        end
+    end
+end
+
+return removed
+"""
+
+
+class RedisEngine(StorageEngine):
+    """
+    Keeps the records in Redis sorted sets (one per cluster), so writes and ranks are O(log n),
+        and a page is O(log n + limit). Each operation is a single Lua script, so a single round trip.
+
+    Expired records are pruned (a thousand at a time) by every operation on the cluster.
+
+    If `durable` MySQLEngine is passed, every write goes into MySQL first (write-through), and a cluster
+        that's missing in Redis (say, after a restart without persistence) is loaded from MySQL upon first use.
+        A cluster is checked to be loaded at most once per WARM_TTL seconds per process.
+
+    A cluster is loaded in pages of WARM_BATCH records by a single process at a time, under a lock that
+        expires in WARM_LOCK_TTL seconds unless the load goes on, and is marked loaded once it's complete,
+        so a failed load is retried by the next one to use the cluster. Others wait up to WARM_WAIT seconds.
+    """
+
+    WARM_TTL = 60
+    WARM_BATCH = 1000
+    WARM_LOCK_TTL = 30
+    WARM_WAIT = 10
+    WARM_POLL = 0.1
+
+    SHA = {
+        script: hashlib.sha1(script.encode()).hexdigest()
+        for script in (WRITE, LOAD, LOADED, TOP, AFTER, AROUND, SCORE, ACCOUNTS, DELETE_RECORD, DELETE_LEADERBOARD,
+                       DELETE_ACCOUNTS)
+    }
+
+    def __init__(self, kv, durable=None, concurrency=8):
+        self.kv = kv
+        self.durable = durable
+        self.concurrency = concurrency
+        self.warm = LRUCache(max_size=10000, ttl=RedisEngine.WARM_TTL)
+
+    @staticmethod
+    def __prefix__(gamespace_id, leaderboard_id):
+        return "rank:{0}:{1}".format(int(gamespace_id), int(leaderboard_id))
+
+    @staticmethod
+    def __member__(account_id):
+        return "{0:010d}".format(int(account_id))
+
+    @staticmethod
+    def __desc__(leaderboard):
+        return "1" if leaderboard.sort_order == "desc" else "0"
+
+    @staticmethod
+    def __data__(display_name, profile):
+        return ujson.dumps(display_name, escape_forward_slashes=False) + "\n" + (profile or "{}")
+
+    @staticmethod
+    def __parse_data__(data):
+        """
+        :returns: a (display_name, profile) of a record's data, the profile is left encoded
+        """
+        if not data:
+            return "", "{}"
+        if isinstance(data, bytes):
+            data = data.decode("utf-8")
+        display_name, profile = data.split("\n", 1)
+        return ujson.loads(display_name), profile
+
+    @staticmethod
+    def __records__(result, cluster_id):
+        """
+        Parses a flat list of (member, score, data, rank) into ranked records
+        """
+        records = []
+
+        for i in range(0, len(result), 4):
+            display_name, profile = RedisEngine.__parse_data__(result[i + 2])
+            records.append((int(result[i + 3]), {
+                "account_id": int(result[i]),
+                "display_name": display_name,
+                "score": float(result[i + 1]),
+                "profile": profile,
+                "cluster_id": cluster_id
+            }))
+
+        return records
+
+    async def __eval__(self, script, keys, args):
+        try:
+            async with self.kv.acquire() as db:
+                try:
+                    return await db.evalsha(RedisEngine.SHA[script], keys=keys, args=args)
+                except aioredis.ReplyError as e:
+                    if not str(e).startswith("NOSCRIPT"):
+                        raise
+                    return await db.eval(script, keys=keys, args=args)
+        except (aioredis.RedisError, OSError) as e:
+            raise StorageError("Redis error: " + str(e))
+
+    async def __warm__(self, gamespace_id, leaderboard_id, cluster_id):
+        if self.durable is None:
+            return
+
+        key = (int(gamespace_id), int(leaderboard_id), int(cluster_id))
+
+        if self.warm.get(key) is not LRUCache.MISSING:
+            return
+
+        board = RedisEngine.__prefix__(gamespace_id, leaderboard_id) + ":" + str(cluster_id)
+        token = uuid.uuid4().hex
+        deadline = time.time() + RedisEngine.WARM_WAIT
+
+        while True:
+            try:
+                async with self.kv.acquire() as db:
+                    if await db.exists(board + ":loaded"):
+                        break
+                    locked = await db.set(
+                        board + ":loading", token, expire=RedisEngine.WARM_LOCK_TTL, exist=db.SET_IF_NOT_EXIST)
+            except (aioredis.RedisError, OSError) as e:
+                raise StorageError("Redis error: " + str(e))
+
+            if locked:
+                await self.__load__(gamespace_id, leaderboard_id, cluster_id, token)
+                break
+
+            if time.time() > deadline:
+                raise StorageError("The leaderboard is being loaded, please try again later")
+
+            await asyncio.sleep(RedisEngine.WARM_POLL)
+
+        self.warm.set(key, True)
+
+    async def __load__(self, gamespace_id, leaderboard_id, cluster_id, token):
+        """
+        Loads a cluster from the durable storage, page by page, while holding its loading lock
+        """
+
+        prefix = RedisEngine.__prefix__(gamespace_id, leaderboard_id)
+        loaded = False
+
+        try:
+            after = None
+
+            while True:
+                records = await self.durable.load_records(
+                    gamespace_id, leaderboard_id, cluster_id, after, RedisEngine.WARM_BATCH)
+
+                if records:
+                    args = [time.time(), cluster_id, "{0}:{1}".format(gamespace_id, leaderboard_id),
+                            token, RedisEngine.WARM_LOCK_TTL]
+                    for record in records:
+                        args.extend([
+                            RedisEngine.__member__(record["account_id"]), repr(float(record["score"] or 0)),
+                            float(record["expire_at"]),
+                            RedisEngine.__data__(record["display_name"], record["profile"])])
+
+                    if not await self.__eval__(LOAD, [prefix], args):
+                        raise StorageError("The leaderboard has been loading for too long")
+
+                if len(records) < RedisEngine.WARM_BATCH:
+                    break
+
+                after = records[-1]["account_id"]
+
+            loaded = True
+        finally:
+            await self.__eval__(LOADED, [prefix], [cluster_id, token, "1" if loaded else "0"])
+
+    async def __warm_account__(self, gamespace_id, leaderboard, account_id):
+        """
+        Loads the clusters the account has records in, for when the cluster is not known
+        :returns: whether the account has any records in the durable storage
+        """
+
+        if self.durable is None:
+            return False
+
+        now = time.time()
+        records = await self.durable.load_accounts(gamespace_id, leaderboard.leaderboard_id, [account_id])
+        clusters = set(record["cluster_id"] for record in records if float(record["expire_at"]) > now)
+
+        for cluster_id in clusters:
+            await self.__warm__(gamespace_id, leaderboard.leaderboard_id, cluster_id)
+
+        return bool(clusters)
+
+    async def __write__(self, gamespace_id, leaderboard, cluster_id, records):
+        now = time.time()
+        args = [now, leaderboard.policy, RedisEngine.__desc__(leaderboard), cluster_id,
+                "{0}:{1}".format(gamespace_id, leaderboard.leaderboard_id)]
+
+        for account_id, display_name, score, time_to_live, profile in records:
+            args.extend([
+                RedisEngine.__member__(account_id), repr(float(score)),
+                now + int(time_to_live), RedisEngine.__data__(display_name, profile)])
+
+        return await self.__eval__(
+            WRITE, [RedisEngine.__prefix__(gamespace_id, leaderboard.leaderboard_id)], args)
+
+    async def insert_record(self, gamespace_id, leaderboard, cluster_id, account_id,
+                            display_name, score, time_to_live, profile):
+
+        await self.__warm__(gamespace_id, leaderboard.leaderboard_id, cluster_id)
+
+        if self.durable is not None:
+            await self.durable.insert_record(
+                gamespace_id, leaderboard, cluster_id, account_id,
+                display_name, score, time_to_live, profile)
+
+        changed = await self.__write__(
+            gamespace_id, leaderboard, cluster_id,
+            [(account_id, display_name, score, time_to_live, profile)])
+
+        return bool(changed[0])
+
+    async def write_records(self, gamespace_id, leaderboard, cluster_id, records):
+
+        await self.__warm__(gamespace_id, leaderboard.leaderboard_id, cluster_id)
+
+        if self.durable is not None:
+            await self.durable.write_records(gamespace_id, leaderboard, cluster_id, records)
+
+        await self.__write__(
+            gamespace_id, leaderboard, cluster_id,
+            [(record.account_id, record.display_name, record.score, record.time_to_live, record.profile)
+             for record in records])
+
+    async def list_top(self, gamespace_id, leaderboard, cluster_id, offset, limit, after=None, since=None):
+
+        await self.__warm__(gamespace_id, leaderboard.leaderboard_id, cluster_id)
+
+        prefix = RedisEngine.__prefix__(gamespace_id, leaderboard.leaderboard_id)
+
+        if after is not None:
+            score, account_id, rank = after
+            result = await self.__eval__(AFTER, [prefix], [
+                time.time(), RedisEngine.__desc__(leaderboard), cluster_id,
+                repr(float(score)), RedisEngine.__member__(account_id), int(limit)])
+        else:
+            result = await self.__eval__(TOP, [prefix], [
+                time.time(), RedisEngine.__desc__(leaderboard), cluster_id, int(offset), int(limit)])
+
+        return RedisEngine.__records__(result, cluster_id)
+
+    async def list_around(self, gamespace_id, leaderboard, cluster_id, account_id, offset, limit, since=None):
+
+        offset = int(offset)
+        limit = int(limit)
+
+        if cluster_id is not None:
+            await self.__warm__(gamespace_id, leaderboard.leaderboard_id, cluster_id)
+        elif not leaderboard.clustered:
+            await self.__warm__(gamespace_id, leaderboard.leaderboard_id, 0)
+
+        async def around():
+            return await self.__eval__(
+                AROUND, [RedisEngine.__prefix__(gamespace_id, leaderboard.leaderboard_id)], [
+                    time.time(), RedisEngine.__desc__(leaderboard),
+                    "" if cluster_id is None else cluster_id,
+                    RedisEngine.__member__(account_id), limit])
+
+        result = await around()
+
+        # the account's cluster may be not loaded yet
+        if result is None and cluster_id is None and leaderboard.clustered and \
+                await self.__warm_account__(gamespace_id, leaderboard, account_id):
+            result = await around()
+
+        if result is None:
+            return None
+
+        return RedisEngine.__records__(result, cluster_id)[offset:offset + limit]
+
+    async def get_score(self, gamespace_id, leaderboard, cluster_id, account_id):
+
+        if cluster_id is not None:
+            await self.__warm__(gamespace_id, leaderboard.leaderboard_id, cluster_id)
+        elif not leaderboard.clustered:
+            await self.__warm__(gamespace_id, leaderboard.leaderboard_id, 0)
+
+        async def score_of():
+            return await self.__eval__(
+                SCORE, [RedisEngine.__prefix__(gamespace_id, leaderboard.leaderboard_id)], [
+                    time.time(), "" if cluster_id is None else cluster_id,
+                    RedisEngine.__member__(account_id)])
+
+        score = await score_of()
+
+        # the account's cluster may be not loaded yet
+        if score is None and cluster_id is None and leaderboard.clustered and \
+                await self.__warm_account__(gamespace_id, leaderboard, account_id):
+            score = await score_of()
+
+        return None if score is None else float(score)
+
+    async def list_accounts(self, gamespace_id, leaderboard, account_ids, offset, limit, since=None):
+        """
+        Please note that on a clustered leaderboard, only the clusters already loaded from
+            the durable storage are looked in.
+        """
+
+        offset = int(offset)
+        limit = int(limit)
+
+        if not leaderboard.clustered:
+            await self.__warm__(gamespace_id, leaderboard.leaderboard_id, 0)
+
+        if not account_ids:
+            return []
+
+        result = await self.__eval__(
+            ACCOUNTS, [RedisEngine.__prefix__(gamespace_id, leaderboard.leaderboard_id)],
+            [time.time(), RedisEngine.__desc__(leaderboard)] +
+            [RedisEngine.__member__(account_id) for account_id in account_ids])
+
+        records = []
+
+        for i in range(0, len(result), 5):
+            display_name, profile = RedisEngine.__parse_data__(result[i + 2])
+            records.append((int(result[i + 3]), {
+                "account_id": int(result[i]),
+                "display_name": display_name,
+                "score": float(result[i + 1]),
+                "profile": profile,
+                "cluster_id": int(result[i + 4])
+            }))
+
+        records.sort(
+            key=lambda record: (record[1]["score"], record[1]["account_id"]),
+            reverse=leaderboard.sort_order == "desc")
+
+        return records[offset:offset + limit]
+
+    async def list_clusters(self, gamespace_id, leaderboard, cluster_ids, limit, since=None):
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def list_cluster(cluster_id):
+            async with semaphore:
+                return cluster_id, await self.list_top(gamespace_id, leaderboard, cluster_id, 0, limit)
+
+        clusters = await asyncio.gather(*[
+            list_cluster(cluster_id)
+            for cluster_id in cluster_ids
+        ])
+
+        return {
+            cluster_id: records
+            for cluster_id, records in clusters
+            if records
+        }
+
+    async def delete_record(self, gamespace_id, leaderboard, account_id):
+
+        if self.durable is not None:
+            await self.durable.delete_record(gamespace_id, leaderboard, account_id)
+
+        await self.__eval__(
+            DELETE_RECORD, [RedisEngine.__prefix__(gamespace_id, leaderboard.leaderboard_id)],
+            [RedisEngine.__member__(account_id)])
+
+    async def delete_leaderboard(self, gamespace_id, leaderboard_id):
+
+        if self.durable is not None:
+            await self.durable.delete_leaderboard(gamespace_id, leaderboard_id)
+
+        self.warm.pop_if(lambda key, value: key[:2] == (int(gamespace_id), int(leaderboard_id)))
+
+        await self.__eval__(
+            DELETE_LEADERBOARD, [RedisEngine.__prefix__(gamespace_id, leaderboard_id)], [])
+
+    async def delete_accounts(self, gamespace_id, account_ids):
+        """
+        Records in the durable storage are left to the MySQL engine, which is always in use.
+        """
+
+        if not account_ids:
+            return 0
+
+        return await self.__eval__(
+            DELETE_ACCOUNTS, ["rank:account"],
+            ["" if gamespace_id is None else int(gamespace_id)] +
+            [RedisEngine.__member__(account_id) for account_id in account_ids])
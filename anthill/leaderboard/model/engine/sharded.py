@@ -0,0 +1,120 @@
+from . import StorageEngine, StorageError
+
+import asyncio
+
+
+class ShardedEngine(StorageEngine):
+    """
+    Routes every leaderboard to the MySQLEngine of the shard the leaderboard is kept in (see RecordShards),
+        as of `leaderboard.shard`.
+
+    A leaderboard that's being moved (see ShardMoves) has `leaderboard.shard_mirror` set: every write goes
+        into its shard first, then the resulting records are read back and copied into the mirror
+        as they are, so the mirror ends up with the same records no matter the policy.
+        Reads are always served by the shard.
+
+    Operations that only know a leaderboard id (or none at all) are scattered over every shard concurrently,
+        and the results are gathered.
+    """
+
+    # records are kept in the `records` table of every shard
+    table = "records"
+
+    def __init__(self, engines):
+        """
+        :param engines: a dict of shard name -> MySQLEngine of that shard
+        """
+        self.engines = engines
+
+    def get(self, shard):
+        try:
+            return self.engines[shard]
+        except KeyError:
+            raise StorageError("Shard '{0}' is not configured".format(shard))
+
+    def __mirror__(self, leaderboard):
+        if leaderboard.shard_mirror is None:
+            return None
+        return self.get(leaderboard.shard_mirror)
+
+    async def __scatter__(self, call):
+        """
+        :param call: a function accepting an engine, returning a coroutine
+        :returns: a list of results of every shard
+        """
+        return await asyncio.gather(*[
+            call(engine)
+            for engine in self.engines.values()
+        ])
+
+    async def __copy_to_mirror__(self, gamespace_id, leaderboard, account_ids):
+        mirror = self.__mirror__(leaderboard)
+
+        if mirror is None:
+            return
+
+        records = await self.get(leaderboard.shard).load_accounts(
+            gamespace_id, leaderboard.leaderboard_id, account_ids)
+
+        await mirror.copy_records(gamespace_id, leaderboard.leaderboard_id, records, overwrite=True)
+
+    async def started(self):
+        await self.__scatter__(lambda engine: engine.started())
+
+    async def stopped(self):
+        await self.__scatter__(lambda engine: engine.stopped())
+
+    async def insert_record(self, gamespace_id, leaderboard, cluster_id, account_id,
+                            display_name, score, time_to_live, profile):
+
+        changed = await self.get(leaderboard.shard).insert_record(
+            gamespace_id, leaderboard, cluster_id, account_id,
+            display_name, score, time_to_live, profile)
+
+        if changed:
+            await self.__copy_to_mirror__(gamespace_id, leaderboard, [account_id])
+
+        return changed
+
+    async def write_records(self, gamespace_id, leaderboard, cluster_id, records):
+
+        await self.get(leaderboard.shard).write_records(gamespace_id, leaderboard, cluster_id, records)
+        await self.__copy_to_mirror__(gamespace_id, leaderboard, [record.account_id for record in records])
+
+    async def list_top(self, gamespace_id, leaderboard, cluster_id, offset, limit, after=None, since=None):
+        return await self.get(leaderboard.shard).list_top(
+            gamespace_id, leaderboard, cluster_id, offset, limit, after=after, since=since)
+
+    async def list_around(self, gamespace_id, leaderboard, cluster_id, account_id, offset, limit, since=None):
+        return await self.get(leaderboard.shard).list_around(
+            gamespace_id, leaderboard, cluster_id, account_id, offset, limit, since=since)
+
+    async def get_score(self, gamespace_id, leaderboard, cluster_id, account_id):
+        return await self.get(leaderboard.shard).get_score(
+            gamespace_id, leaderboard, cluster_id, account_id)
+
+    async def list_accounts(self, gamespace_id, leaderboard, account_ids, offset, limit, since=None):
+        return await self.get(leaderboard.shard).list_accounts(
+            gamespace_id, leaderboard, account_ids, offset, limit, since=since)
+
+    async def list_clusters(self, gamespace_id, leaderboard, cluster_ids, limit, since=None):
+        return await self.get(leaderboard.shard).list_clusters(
+            gamespace_id, leaderboard, cluster_ids, limit, since=since)
+
+    async def records_expired(self, gamespace_id, leaderboard_id, cluster_id):
+        await self.__scatter__(lambda engine: engine.records_expired(gamespace_id, leaderboard_id, cluster_id))
+
+    async def delete_record(self, gamespace_id, leaderboard, account_id):
+        await self.get(leaderboard.shard).delete_record(gamespace_id, leaderboard, account_id)
+
+        mirror = self.__mirror__(leaderboard)
+        if mirror is not None:
+            await mirror.delete_record(gamespace_id, leaderboard, account_id)
+
+    async def delete_leaderboard(self, gamespace_id, leaderboard_id):
+        # a leaderboard may have been mirrored into another shard (by an interrupted move), so every shard is asked
+        await self.__scatter__(lambda engine: engine.delete_leaderboard(gamespace_id, leaderboard_id))
+
+    async def delete_accounts(self, gamespace_id, account_ids):
+        deleted = await self.__scatter__(lambda engine: engine.delete_accounts(gamespace_id, account_ids))
+        return sum(count or 0 for count in deleted)
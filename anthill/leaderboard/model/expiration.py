@@ -0,0 +1,150 @@
+from tornado.ioloop import PeriodicCallback, IOLoop
+
+import asyncio
+import logging
+import time
+
+
+class RecordsExpiration(object):
+    """
+    Deletes expired records, replacing the `records_expiration` event that used to delete them all at once
+        with a full scan of the `records` table.
+
+    Every `interval` seconds, expired records are found with the `expire_at` index, and deleted
+        by primary key, `batch_size` records at a time, so each delete only locks the records it deletes.
+    Chunks are paced to delete at most `rate` records per second, until there's nothing left to expire.
+
+    Several instances of the service may run at the same time, so only the one holding a lock expires records.
+    Each shard (see RecordShards) has its own expiration, with a lock of its own.
+    """
+
+    LOCK_NAME = "leaderboard_records_expiration"
+
+    def __init__(self, db, on_expired, interval, batch_size, rate, lock_name=LOCK_NAME):
+        """
+        :param on_expired: a coroutine function accepting a set of (gamespace_id, leaderboard_id, cluster_id)
+            records have been expired in
+        :param lock_name: shards may be databases of the same server, so each needs a lock name of its own
+        """
+        self.db = db
+        self.lock_name = lock_name
+        self.on_expired = on_expired
+        self.interval = interval
+        self.batch_size = batch_size
+        self.rate = rate
+
+        self.periodic = None
+        self.running = False
+
+        self.expired = 0
+        self.chunks = 0
+        self.runs = 0
+        self.failed = 0
+        # seconds the oldest expired record still exists for, as of the end of the last run
+        self.lag = 0
+        self.last_run = None
+
+    def start(self):
+        self.periodic = PeriodicCallback(
+            lambda: IOLoop.current().spawn_callback(self.run), self.interval * 1000)
+        self.periodic.start()
+
+    def stop(self):
+        if self.periodic is not None:
+            self.periodic.stop()
+            self.periodic = None
+
+    def stats(self):
+        return {
+            "expired": self.expired,
+            "chunks": self.chunks,
+            "runs": self.runs,
+            "failed": self.failed,
+            "lag": self.lag,
+            "last_run": self.last_run
+        }
+
+    async def run(self):
+        if self.running:
+            return
+
+        self.running = True
+
+        # noinspection PyBroadException
+        try:
+            async with self.db.acquire() as db:
+                locked = await db.get(
+                    """
+                        SELECT GET_LOCK(%s, 0) AS `locked`;
+                    """, self.lock_name)
+
+                if not locked or not locked["locked"]:
+                    return
+
+                try:
+                    await self.__expire__(db)
+                    self.lag = await self.__lag__(db)
+                finally:
+                    await db.get(
+                        """
+                            SELECT RELEASE_LOCK(%s);
+                        """, self.lock_name)
+
+            self.runs += 1
+            self.last_run = int(time.time())
+        except Exception:
+            logging.exception("Failed to expire records")
+            self.failed += 1
+        finally:
+            self.running = False
+
+    async def __expire__(self, db):
+        pause = float(self.batch_size) / self.rate
+
+        while self.periodic is not None:
+            records = await db.query(
+                """
+                    SELECT `record_id`, `gamespace_id`, `leaderboard_id`, `cluster_id`
+                    FROM `records`
+                    WHERE `expire_at` < NOW()
+                    ORDER BY `expire_at`, `record_id`
+                    LIMIT %s;
+                """, self.batch_size)
+
+            if not records:
+                return
+
+            # a record may have been posted again since, so expire_at is checked once more
+            deleted = await db.execute(
+                """
+                    DELETE FROM `records`
+                    WHERE `record_id` IN %s AND `expire_at` < NOW();
+                """, sorted(record["record_id"] for record in records))
+
+            self.expired += deleted
+            self.chunks += 1
+
+            if deleted:
+                # noinspection PyBroadException
+                try:
+                    await self.on_expired({
+                        (record["gamespace_id"], record["leaderboard_id"], record["cluster_id"])
+                        for record in records
+                    })
+                except Exception:
+                    logging.exception("Failed to process expired records")
+
+            if len(records) < self.batch_size:
+                return
+
+            await asyncio.sleep(pause)
+
+    @staticmethod
+    async def __lag__(db):
+        oldest = await db.get(
+            """
+                SELECT TIMESTAMPDIFF(SECOND, MIN(`expire_at`), NOW()) AS `lag`
+                FROM `records`
+                WHERE `expire_at` < NOW();
+            """)
+        return int((oldest or {}).get("lag") or 0)
@@ -1,35 +1,159 @@
+from tornado.ioloop import IOLoop
+
 from anthill.common.model import Model
 from anthill.common.database import DatabaseError
 from anthill.common.cluster import Cluster, NoClusterError, ClusterError
 from anthill.common.options import options
 
+from . rank import RankIndexes
+from . cache import LRUCache, SharedVersions
+from . migrations import SchemaMigrations, explain_hot_queries
+from . writebehind import WriteBehindBuffer, WriteBehindBoard, WriteBehindFull, PendingRecord
+from . topcache import TopCache
+from . expiration import RecordsExpiration
+from . singleflight import SingleFlight
+from . metrics import Metrics, timed
+from . sketch import ScoreSketch, ScoreSketches
+from . snapshot import LeaderboardSnapshots, SnapshotError
+from . deletion import AccountsDeletion, AccountsDeletionError
+from . periods import LeaderboardPeriod, PeriodRotation, PERIODS, PERIOD_NONE, PERIOD_SEPARATOR, MAX_RESET
+from . shards import RecordShards, ShardMoves, ShardError, SHARD_MAIN
+from . replicas import ReplicaPool, RecentWrites
+from . engine import StorageError, encode_profile, POLICY_LATEST, POLICY_BEST, POLICY_INCREMENT, POLICIES
+from . engine.mysql import MySQLEngine
+from . engine.sharded import ShardedEngine
+
+from collections import OrderedDict
+
+import asyncio
+import base64
+import binascii
+import calendar
+import heapq
+import itertools
 import logging
+import math
+import time
 import ujson
 
 
 class LeaderboardAdapter(object):
     def __init__(self, data):
         self.leaderboard_id = data.get("leaderboard_id")
+        self.name = data.get("leaderboard_name")
+        self.sort_order = data.get("leaderboard_sort_order")
+        self.policy = data.get("leaderboard_policy") or LeaderboardsModel.POLICY_LATEST
+        self.period = data.get("leaderboard_period") or PERIOD_NONE
+        self.period_reset = data.get("leaderboard_period_reset") or 0
+        self.clustered = LeaderboardsModel.is_clustered(self.name)
+        # a periodic leaderboard keeps no records itself, each period of it is a leaderboard, see LeaderboardPeriod
+        self.periodic = self.period != PERIOD_NONE
+        # set on the leaderboards of the periods, to the periodic leaderboard the period belongs to
+        self.parent_id = data.get("leaderboard_parent_id")
+        self.is_period = self.parent_id is not None
+        # records of the mysql storage engine are kept there, see RecordShards
+        self.shard = data.get("leaderboard_shard") or SHARD_MAIN
+        self.shard_mirror = data.get("leaderboard_shard_mirror")
+        # a unix timestamp a period expires at, along with its records, see PeriodRotation
+        self.expire_at = data.get("leaderboard_expire_at")
 
 
 class RecordAdapter(object):
+    """
+    A ranked record. The profile is kept as the JSON text it's stored as, and is only
+        decoded if the record is dumped as a dict.
+    """
+
+    __slots__ = ("account", "cluster_id", "score", "name", "profile", "rank")
+
     def __init__(self, data, rank):
         self.account = data.get("account_id")
         self.cluster_id = data.get("cluster_id")
         self.score = data.get("score")
         self.name = data.get("display_name")
-        self.profile = data.get("profile", {})
+        self.profile = data.get("profile") or "{}"
         self.rank = rank
 
     def dump(self):
+        profile = self.profile
         return {
             "rank": self.rank,
             "score": self.score,
             "account": self.account,
             "display_name": self.name,
-            "profile": self.profile
+            "profile": ujson.loads(profile) if isinstance(profile, str) else profile
         }
 
+    def dump_json(self):
+        """
+        Same as ujson.dumps(self.dump()), except the profile is put in as is, without decoding it first
+        """
+        profile = self.profile
+        if not isinstance(profile, str):
+            profile = encode_profile(profile)
+        return '{"rank":%s,"score":%s,"account":%s,"display_name":%s,"profile":%s}' % (
+            ujson.dumps(self.rank), ujson.dumps(self.score), ujson.dumps(self.account),
+            ujson.dumps(self.name, escape_forward_slashes=False), profile)
+
+
+class RecordPage(object):
+    """
+    A page of ranked records, as returned by a storage engine: a list of (rank, record) tuples.
+    Records are turned into RecordAdapter one at a time upon iteration, so a page can be dumped
+        without ever having a list of adapters, or of dumped records, in memory.
+    """
+
+    __slots__ = ("items", "factory")
+
+    def __init__(self, items, factory=None):
+        self.items = items
+        self.factory = factory or RecordPage.__adapter__
+
+    @staticmethod
+    def __adapter__(item):
+        rank, record = item
+        return RecordAdapter(record, rank)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        factory = self.factory
+        for item in self.items:
+            yield factory(item)
+
+    def __getitem__(self, index):
+        return self.factory(self.items[index])
+
+
+class LeaderboardCursor(object):
+    """
+    An opaque position in a ranked leaderboard: the last record seen, and its rank.
+    Allows to continue listing a leaderboard with a seek instead of an offset, so each page costs the same.
+    """
+
+    def __init__(self, score, account_id, rank):
+        self.score = score
+        self.account_id = account_id
+        self.rank = rank
+
+    @staticmethod
+    def after(record):
+        return LeaderboardCursor(record.score, record.account, record.rank)
+
+    def encode(self):
+        data = ujson.dumps([self.score, self.account_id, self.rank])
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+    @staticmethod
+    def decode(value):
+        try:
+            data = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+            score, account_id, rank = ujson.loads(data)
+            return LeaderboardCursor(float(score), int(account_id), int(rank))
+        except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+            raise LeaderboardError(400, "Corrupted cursor")
+
 
 class LeaderboardError(Exception):
     def __init__(self, code, message):
@@ -50,89 +174,761 @@ class LeaderboardsModel(Model):
     """
     Leaderboard model. Manages leaderboards itself, and user records in such leaderboards.
 
-    Please note that MySQL 5.1 Events feature is used (please see /sql/records_expiration.sql).
-    https://dev.mysql.com/doc/refman/5.7/en/event-scheduler.html
+    Leaderboards (and the clusters) are always kept in MySQL, while the records are kept by a storage engine
+        (see /model/engine), selected per gamespace or per leaderboard name with `storage_engine*` options.
+
+    Expired records are deleted by the service itself, see RecordsExpiration.
+
+    Records of periodic leaderboards (see LeaderboardPeriod) are kept in the `period_records` table instead,
+        which is partitioned by the day a period expires on, so the records of expired periods are dropped
+        with their partitions, see PeriodRotation.
+
+    Records of the mysql storage engine may be split over several databases, a leaderboard at a time,
+        see RecordShards. Ranked reads of them may be served by read replicas, see ReplicaPool.
 
     """
 
     LEADERBOARD_CLUSTERED_TRIGGER = "@"
 
+    POLICY_LATEST = POLICY_LATEST
+    POLICY_BEST = POLICY_BEST
+    POLICY_INCREMENT = POLICY_INCREMENT
+
+    POLICIES = POLICIES
+
+    ENGINE_MYSQL = "mysql"
+    ENGINE_REDIS = "redis"
+
+    ENGINES = [ENGINE_MYSQL, ENGINE_REDIS]
+
+    # not selectable with the options, the periods of periodic leaderboards always go there
+    ENGINE_PERIODS = "periods"
+
+    # as of `leaderboard_name` column
+    MAX_NAME_LENGTH = 64
+
+    # what a LeaderboardAdapter is made of
+    LEADERBOARD_COLUMNS = """
+        `leaderboard_id`, `leaderboard_name`, `leaderboard_sort_order`, `leaderboard_policy`,
+        `leaderboard_period`, `leaderboard_period_reset`, `leaderboard_parent_id`,
+        `leaderboard_shard`, `leaderboard_shard_mirror`,
+        UNIX_TIMESTAMP(`leaderboard_expire_at`) AS `leaderboard_expire_at`
+    """
+
+    # gamespaces (and limits) the largest leaderboards are kept for
+    LARGEST_CACHE_SIZE = 256
+
     @staticmethod
     def is_clustered(leaderboard_name):
         return leaderboard_name.startswith(LeaderboardsModel.LEADERBOARD_CLUSTERED_TRIGGER)
 
-    def __init__(self, db):
+    @staticmethod
+    def parse_engines(value):
+        """
+        Parses a storage engine selection option, like "1:redis,5:redis", or "daily:redis,@weekly:redis"
+        """
+        result = {}
+        for item in filter(None, (value or "").split(",")):
+            name, engine = item.rsplit(":", 1)
+            engine = engine.strip()
+            if engine not in LeaderboardsModel.ENGINES:
+                raise ValueError("Unknown storage engine: " + engine)
+            result[name.strip()] = engine
+        return result
+
+    @staticmethod
+    def engines_used():
+        """
+        :returns: a set of storage engines the options refer to
+        """
+        return {options.storage_engine} | \
+            set(LeaderboardsModel.parse_engines(options.storage_engine_gamespaces).values()) | \
+            set(LeaderboardsModel.parse_engines(options.storage_engine_leaderboards).values())
+
+    def __init__(self, db, cache=None, ranking=None, metrics=None, shards=None, replicas=None):
+        """
+        :param cache: a key/value storage shared between processes, for the top pages cache,
+            for the recent writes (see RecentWrites), and for the versions of the resolved leaderboards
+        :param ranking: a key/value storage for the redis storage engine
+        :param metrics: a Metrics to observe the operations with, see MeasuredDatabase
+        :param shards: a dict of shard name -> Database, of the databases to split the records over
+            besides the main one, see RecordShards
+        :param replicas: a dict of shard name -> a dict of replica name -> Database, of the read replicas
+            of the shards that have any, see ReplicaPool
+        """
         self.db = db
+        self.metrics = metrics or Metrics()
         self.cluster = Cluster(db, "leaderboard_clusters", "leaderboard_cluster_accounts")
         self.cluster_size = options.cluster_size
 
+        if options.rank_index:
+            rank_indexes = RankIndexes(
+                max_boards=options.rank_index_max_boards,
+                max_records=options.rank_index_max_records,
+                ttl=options.rank_index_ttl,
+                too_big_ttl=options.rank_index_too_big_ttl)
+        else:
+            rank_indexes = None
+
+        self.shards = RecordShards(
+            db, shards,
+            placement=[name.strip() for name in options.records_shards_placement.split(",") if name.strip()] or None)
+
+        # shard name -> ReplicaPool, of the shards that have read replicas
+        self.replicas = {}
+
+        for name, shard_replicas in (replicas or {}).items():
+            if name not in self.shards.databases:
+                raise ValueError("Replicas of shard '{0}' that is not configured".format(name))
+
+            self.replicas[name] = ReplicaPool(
+                self.shards.databases[name], shard_replicas,
+                interval=options.replica_lag_interval,
+                max_lag=options.replica_max_lag)
+
+        sharded = ShardedEngine({
+            name: MySQLEngine(
+                shard_db, rank_indexes=rank_indexes, concurrency=options.clusters_concurrency,
+                replicas=self.replicas.get(name))
+            for name, shard_db in self.shards.databases.items()
+        })
+
+        self.engines = {
+            LeaderboardsModel.ENGINE_MYSQL: sharded
+        }
+
+        if ranking is not None:
+            from . engine.redis import RedisEngine
+
+            self.engines[LeaderboardsModel.ENGINE_REDIS] = RedisEngine(
+                ranking, durable=MySQLEngine(db) if options.storage_engine_write_through else None,
+                concurrency=options.clusters_concurrency)
+
+        self.engines[LeaderboardsModel.ENGINE_PERIODS] = MySQLEngine(
+            db, concurrency=options.clusters_concurrency, table=PeriodRotation.TABLE,
+            partition_of=PeriodRotation.partition_of,
+            replicas=self.replicas.get(SHARD_MAIN))
+
+        self.default_engine = options.storage_engine
+        self.gamespace_engines = LeaderboardsModel.parse_engines(options.storage_engine_gamespaces)
+        self.leaderboard_engines = LeaderboardsModel.parse_engines(options.storage_engine_leaderboards)
+
+        for engine in LeaderboardsModel.engines_used():
+            if engine not in self.engines:
+                raise ValueError("Storage engine '{0}' is not configured".format(engine))
+
+        # (gamespace_id, limit) -> a list of the largest leaderboards, see list_largest_leaderboards
+        self.largest_cache = LRUCache(
+            max_size=LeaderboardsModel.LARGEST_CACHE_SIZE,
+            ttl=options.largest_leaderboards_cache_ttl)
+
+        # (gamespace_id, leaderboard_name, sort_order, version) -> LeaderboardAdapter, or None if there's no such
+        self.leaderboards_cache = LRUCache(
+            max_size=options.leaderboard_cache_size,
+            ttl=options.leaderboard_cache_ttl)
+
+        # gamespace_id -> a version of its leaderboards, bumped upon deletion, so a leaderboard deleted
+        #   by an instance is not resolved by the others from their memory
+        self.leaderboards_versions = SharedVersions(
+            cache if options.leaderboard_cache_shared else None, "lb:leaderboards",
+            max_keys=options.leaderboard_cache_size,
+            ttl=options.leaderboard_cache_version_ttl)
+
+        # (gamespace_id, account_id, leaderboard_id) -> cluster_id, of clustered leaderboards
+        self.clusters_cache = LRUCache(
+            max_size=options.cluster_cache_size,
+            ttl=options.cluster_cache_ttl)
+
+        # accounts that have just written, for the read-your-writes
+        if self.replicas:
+            self.recent_writes = RecentWrites(
+                cache if options.read_your_writes_shared else None,
+                max_accounts=options.read_your_writes_max_accounts,
+                window=options.read_your_writes_window)
+        else:
+            self.recent_writes = None
+
+        if options.write_behind:
+            self.write_behind = WriteBehindBuffer(
+                self.__write_pending_records__,
+                interval=options.write_behind_interval,
+                batch_size=options.write_behind_batch_size,
+                max_pending=options.write_behind_max_pending,
+                max_retries=options.write_behind_max_retries)
+        else:
+            self.write_behind = None
+
+        if options.top_cache:
+            self.top_cache = TopCache(
+                cache,
+                max_pages=options.top_cache_size,
+                ttl=options.top_cache_ttl,
+                staleness=options.top_cache_staleness,
+                leaderboard_staleness=TopCache.parse_staleness(options.top_cache_leaderboards))
+        else:
+            self.top_cache = None
+
+        self.score_sketches = ScoreSketches(
+            max_boards=options.score_sketch_max_boards,
+            ttl=options.score_sketch_ttl)
+
+        # concurrent identical reads, see SingleFlight
+        self.reads = SingleFlight() if options.read_coalescing else None
+
+        # shard name -> RecordsExpiration of the shard, records of the periods expire with them, see PeriodRotation
+        self.expirations = {}
+
+        if options.records_expiration:
+            for name, shard_db in self.shards.databases.items():
+                self.expirations[name] = RecordsExpiration(
+                    shard_db, self.__records_expired__,
+                    interval=options.records_expiration_interval,
+                    batch_size=options.records_expiration_batch_size,
+                    rate=options.records_expiration_rate,
+                    lock_name=RecordsExpiration.LOCK_NAME if name == SHARD_MAIN else
+                    RecordsExpiration.LOCK_NAME + "_" + name)
+
+        self.deletion = AccountsDeletion(
+            db, self.__delete_accounts_chunk__, self.__accounts_deleted__,
+            interval=options.accounts_deletion_interval,
+            chunk_size=options.accounts_deletion_chunk_size,
+            rate=options.accounts_deletion_rate)
+
+        self.rotation = PeriodRotation(
+            db, self.__periods_dropped__,
+            interval=options.period_rotation_interval,
+            partition_days=options.period_partition_days)
+
+        self.snapshots = LeaderboardSnapshots(
+            db,
+            batch_size=options.snapshot_batch_size,
+            ttl=options.snapshot_ttl,
+            keep=options.snapshots_max_per_leaderboard,
+            cleanup_interval=options.snapshots_cleanup_interval)
+
+        # a change of a shard reaches every instance once the cached leaderboards (and pending records) are renewed
+        self.moves = ShardMoves(
+            db, sharded, self.__leaderboard_changed__,
+            interval=options.shard_move_interval,
+            settle=options.leaderboard_cache_ttl + options.write_behind_interval / 1000.0 + 1,
+            batch_size=options.shard_move_batch_size,
+            rate=options.shard_move_rate)
+
+    async def started(self, application):
+        await super(LeaderboardsModel, self).started(application)
+
+        await SchemaMigrations(self.db).migrate()
+
+        try:
+            await self.shards.setup(application.module_path)
+        except ShardError as e:
+            raise LeaderboardError(500, e.message)
+
+        # before anything is written, so the partition periods are written into exists already
+        try:
+            await self.rotation.seal()
+        except DatabaseError as e:
+            raise LeaderboardError(500, "Failed to add a partition of periods: " + e.args[1])
+
+        for query, sort_order in await self.explain_queries():
+            logging.warning("Query '{0}' ({1}) is not served by an index, please check the schema".format(
+                query, sort_order))
+
+        for engine in self.engines.values():
+            await engine.started()
+
+        if self.write_behind is not None:
+            self.write_behind.start()
+
+    async def stopped(self):
+        for expiration in self.expirations.values():
+            expiration.stop()
+
+        self.snapshots.stop()
+        self.deletion.stop()
+        self.moves.stop()
+        self.rotation.stop()
+
+        for pool in self.replicas.values():
+            pool.stop()
+
+        if self.write_behind is not None:
+            await self.write_behind.stop()
+
+        for engine in self.engines.values():
+            await engine.stopped()
+
+        await super(LeaderboardsModel, self).stopped()
+
     def get_setup_db(self):
         return self.db
 
     def get_setup_tables(self):
-        return ["leaderboards", "records", "leaderboard_clusters", "leaderboard_cluster_accounts"]
-
-    def get_setup_events(self):
-        return ["records_expiration"]
+        return ["leaderboard_schema", "leaderboards", "records", "period_records",
+                "leaderboard_clusters", "leaderboard_cluster_accounts",
+                "leaderboard_snapshots", "leaderboard_snapshot_records", "leaderboard_deletion_jobs",
+                "leaderboard_shard_moves", "leaderboard_heartbeat"]
 
     def has_delete_account_event(self):
         return True
 
+    def __engine__(self, gamespace_id, leaderboard):
+        """
+        :returns: a storage engine for a leaderboard: the one configured for its name, if any,
+            otherwise the one configured for the gamespace, otherwise the default one
+        """
+        if leaderboard.is_period:
+            return self.engines[LeaderboardsModel.ENGINE_PERIODS]
+
+        engine = self.leaderboard_engines.get(leaderboard.name) or \
+            self.gamespace_engines.get(str(gamespace_id)) or \
+            self.default_engine
+        return self.engines[engine]
+
+    async def explain_queries(self):
+        """
+        :returns: a list of (query name, sort order) of the hot read queries that the database
+            could not serve from an index in the order requested
+        """
+        async with self.db.acquire() as db:
+            try:
+                return await explain_hot_queries(db)
+            except DatabaseError as e:
+                raise LeaderboardError(500, "Failed to explain queries: " + e.args[1])
+
+    # server-wide counters of rows read by the database, to compare with the rows the service got back
+    DATABASE_STATUS = ["Innodb_rows_read", "Handler_read_next", "Handler_read_rnd_next", "Select_scan"]
+
+    async def get_metrics(self):
+        """
+        :returns: metrics of this process: operation latencies, rows returned, cache hit ratios,
+            and the rows the database has read (since it has been started, by anybody)
+        """
+
+        caches = {
+            "leaderboards": self.leaderboards_cache.stats(),
+            "clusters": self.clusters_cache.stats()
+        }
+
+        if self.top_cache is not None:
+            caches["top_pages"] = self.top_cache.pages.stats()
+            caches["top_versions"] = self.top_cache.versions.stats()
+
+        result = self.metrics.dump()
+        result["caches"] = caches
+
+        if self.reads is not None:
+            result["read_coalescing"] = self.reads.stats()
+
+        try:
+            status = await self.db.query(
+                """
+                    SHOW GLOBAL STATUS WHERE `Variable_name` IN %s;
+                """, LeaderboardsModel.DATABASE_STATUS)
+        except DatabaseError as e:
+            raise LeaderboardError(500, "Failed to get database status: " + e.args[1])
+
+        result["database"] = {
+            row["Variable_name"]: int(row["Value"])
+            for row in status
+        }
+
+        return result
+
+    async def list_largest_leaderboards(self, gamespace_id, limit=20):
+        """
+        :returns: a list of leaderboards of a gamespace with the most records, as dicts
+            with `leaderboard_id`, `leaderboard_name`, `leaderboard_sort_order` and `records`.
+            Please note this counts every record of the gamespace (from the `leaderboard_rank` index),
+            in every shard and of the periods (concurrently, on read replicas if any), so the result
+            is kept for options.largest_leaderboards_cache_ttl seconds.
+        """
+
+        limit = int(limit)
+        key = (int(gamespace_id), limit)
+
+        largest = self.largest_cache.get(key)
+        if largest is not LRUCache.MISSING:
+            return largest
+
+        async def count(shard_db, table):
+            return await shard_db.query(
+                """
+                    SELECT `leaderboard_id`, COUNT(*) AS `records`
+                    FROM `{0}`
+                    WHERE `gamespace_id`=%s
+                    GROUP BY `leaderboard_id`
+                    ORDER BY `records` DESC
+                    LIMIT %s;
+                """.format(table), gamespace_id, limit)
+
+        def reader(name):
+            pool = self.replicas.get(name)
+            return self.shards.databases[name] if pool is None else pool.reader()
+
+        try:
+            counts = await asyncio.gather(*([
+                count(reader(name), "records")
+                for name in self.shards.databases.keys()
+            ] + [
+                count(reader(SHARD_MAIN), PeriodRotation.TABLE)
+            ]))
+        except DatabaseError as e:
+            raise LeaderboardError(500, "Failed to list leaderboards: " + e.args[1])
+
+        # a leaderboard being moved has its records in two shards
+        records = {}
+        for row in itertools.chain(*counts):
+            records[row["leaderboard_id"]] = max(records.get(row["leaderboard_id"], 0), row["records"])
+
+        largest = heapq.nlargest(limit, records.items(), key=lambda item: item[1])
+
+        if not largest:
+            self.largest_cache.set(key, [])
+            return []
+
+        try:
+            leaderboards = await self.db.query(
+                """
+                    SELECT `leaderboard_id`, `leaderboard_name`, `leaderboard_sort_order`
+                    FROM `leaderboards`
+                    WHERE `gamespace_id`=%s AND `leaderboard_id` IN %s;
+                """, gamespace_id, [leaderboard_id for leaderboard_id, count in largest])
+        except DatabaseError as e:
+            raise LeaderboardError(500, "Failed to list leaderboards: " + e.args[1])
+
+        leaderboards = {
+            leaderboard["leaderboard_id"]: leaderboard
+            for leaderboard in leaderboards
+        }
+
+        largest = [
+            dict(leaderboards[leaderboard_id], records=count)
+            for leaderboard_id, count in largest
+            if leaderboard_id in leaderboards
+        ]
+
+        self.largest_cache.set(key, largest)
+        return largest
+
+    async def list_cluster_counts(self, gamespace_id):
+        """
+        :returns: a list of clustered leaderboards of a gamespace, as dicts with `leaderboard_id`,
+            `leaderboard_name`, `leaderboard_sort_order` and `clusters`, the most clusters first
+        """
+
+        try:
+            return await self.db.query(
+                """
+                    SELECT `l`.`leaderboard_id`, `l`.`leaderboard_name`, `l`.`leaderboard_sort_order`,
+                        COUNT(*) AS `clusters`
+                    FROM `leaderboard_clusters` AS `c`
+                    INNER JOIN `leaderboards` AS `l` ON `l`.`leaderboard_id`=`c`.`cluster_data`
+                    WHERE `c`.`gamespace_id`=%s
+                    GROUP BY `l`.`leaderboard_id`
+                    ORDER BY `clusters` DESC;
+                """, gamespace_id)
+        except DatabaseError as e:
+            raise LeaderboardError(500, "Failed to count clusters: " + e.args[1])
+
+    async def list_misplaced_leaderboards(self, gamespace_id):
+        """
+        Lists leaderboards of a gamespace kept in a shard other than the one they would be placed on now,
+            say, after a shard has been added (see RecordShards), to be moved with move_leaderboard
+        :returns: a list of dicts with `leaderboard_id`, `leaderboard_name`, `leaderboard_sort_order`,
+            `shard` and `placement`
+        """
+
+        try:
+            leaderboards = await self.db.query(
+                """
+                    SELECT `leaderboard_id`, `leaderboard_name`, `leaderboard_sort_order`, `leaderboard_shard`
+                    FROM `leaderboards`
+                    WHERE `gamespace_id`=%s AND `leaderboard_period`='none' AND `leaderboard_parent_id` IS NULL;
+                """, gamespace_id)
+        except DatabaseError as e:
+            raise LeaderboardError(500, "Failed to list leaderboards: " + e.args[1])
+
+        sharded = self.engines[LeaderboardsModel.ENGINE_MYSQL]
+        result = []
+
+        for leaderboard in leaderboards:
+            name = leaderboard["leaderboard_name"]
+            if self.__engine__(gamespace_id, LeaderboardAdapter(leaderboard)) is not sharded:
+                continue
+
+            shard = leaderboard.pop("leaderboard_shard") or SHARD_MAIN
+            placement = self.shards.place(gamespace_id, name, leaderboard["leaderboard_sort_order"])
+
+            if shard != placement:
+                result.append(dict(leaderboard, shard=shard, placement=placement))
+
+        return result
+
+    async def move_leaderboard(self, gamespace_id, leaderboard_name, sort_order, shard):
+        """
+        Moves records of a leaderboard into another shard, while the leaderboard is in use, see ShardMoves.
+        The move takes as long as copying the records takes, plus three times `leaderboard_cache_ttl`,
+            so it's run in background, see get_shard_moves_stats of the internal handler for how far it went.
+        :returns: an id of the move
+        """
+
+        leaderboard = await self.find_leaderboard(
+            gamespace_id, leaderboard_name,
+            sort_order)
+
+        if leaderboard.periodic or leaderboard.is_period:
+            raise LeaderboardError(400, "Periods are always kept in the main database")
+
+        if self.__engine__(gamespace_id, leaderboard) is not self.engines[LeaderboardsModel.ENGINE_MYSQL]:
+            raise LeaderboardError(400, "Records of the leaderboard are not kept by the mysql storage engine")
+
+        if shard not in self.shards.databases:
+            raise LeaderboardError(400, "Shard should be one of: " + ", ".join(self.shards.names()))
+
+        # a move is stored first, so if the process is stopped meanwhile, the move is resumed
+        try:
+            move_id = await self.moves.create(gamespace_id, leaderboard.leaderboard_id, shard)
+        except ShardError as e:
+            raise LeaderboardError(e.code, e.message)
+
+        IOLoop.current().spawn_callback(self.__move_leaderboard__, move_id)
+
+        return move_id
+
+    async def __move_leaderboard__(self, move_id):
+        try:
+            await self.moves.run(move_id)
+        except ShardError as e:
+            # unless it can't be done at all, the move is resumed later, see ShardMoves.resume
+            logging.error("Failed to run shard move {0}: {1}".format(move_id, e.message))
+
+    async def __get_cluster__(self, gamespace_id, account_id, leaderboard_id, auto_create):
+        """
+        A cluster the account is in, on a clustered leaderboard. Assignments almost never change,
+            so they're kept in memory, see `cluster_cache_*` options.
+        :raises NoClusterError: if the account is in no cluster, and auto_create is False
+        """
+
+        cache_key = (int(gamespace_id), int(account_id), int(leaderboard_id))
+        cluster_id = self.clusters_cache.get(cache_key)
+
+        if cluster_id is not LRUCache.MISSING:
+            return cluster_id
+
+        cluster_id = await self.cluster.get_cluster(
+            gamespace_id, account_id, leaderboard_id,
+            cluster_size=self.cluster_size, auto_create=auto_create)
+
+        self.clusters_cache.set(cache_key, cluster_id)
+        return cluster_id
+
+    def __records_source__(self, gamespace_id, leaderboard):
+        """
+        :returns: a (database, table) the records of a leaderboard are kept in, or written through to
+        """
+        if leaderboard.is_period:
+            return self.db, PeriodRotation.TABLE
+
+        if self.__engine__(gamespace_id, leaderboard) is not self.engines[LeaderboardsModel.ENGINE_MYSQL]:
+            return self.db, "records"
+
+        try:
+            return self.shards.database(leaderboard.shard), "records"
+        except ShardError as e:
+            raise LeaderboardError(500, e.message)
+
+    def __leaderboard_changed__(self, gamespace_id, leaderboard_id):
+        """
+        Forgets a leaderboard cached, so it's looked up again, see ShardMoves
+        """
+        self.leaderboards_cache.pop_if(
+            lambda key, leaderboard: key[0] == int(gamespace_id) and
+            leaderboard is not None and leaderboard.leaderboard_id == int(leaderboard_id))
+
+    async def __written__(self, gamespace_id, account_ids):
+        """
+        Remembers the accounts have just written, so they read their writes, see __since__
+        """
+        if self.recent_writes is not None:
+            await self.recent_writes.written(gamespace_id, account_ids)
+
+    async def __since__(self, gamespace_id, account_ids):
+        """
+        :returns: a unix time of the latest write of the accounts, if any of them has written recently
+            (see `read_your_writes_window`), so the read is served by a replica that has it (see ReplicaPool),
+            otherwise None. Please note the writes made by other instances of the service are only known
+            with `read_your_writes_shared`, see RecentWrites.
+        """
+        if self.recent_writes is None:
+            return None
+
+        return await self.recent_writes.since(gamespace_id, account_ids)
+
+    async def __invalidate_top__(self, gamespace_id, leaderboard_id):
+        if self.top_cache is not None:
+            await self.top_cache.invalidate_leaderboard(gamespace_id, leaderboard_id)
+
+    async def __records_expired__(self, clusters):
+        """
+        Drops expired records from the rank indexes, and pages of the top cache they are in
+        """
+        for gamespace_id, leaderboard_id, cluster_id in clusters:
+            for engine in self.engines.values():
+                await engine.records_expired(gamespace_id, leaderboard_id, cluster_id)
+
+        for gamespace_id, leaderboard_id in {(cluster[0], cluster[1]) for cluster in clusters}:
+            await self.__invalidate_top__(gamespace_id, leaderboard_id)
+
     async def accounts_deleted(self, gamespace, accounts, gamespace_only):
 
-        if gamespace_only:
-            async with self.db.acquire() as db:
-                await db.execute("""
-                    DELETE 
-                    FROM `leaderboard_cluster_accounts`
-                    WHERE `gamespace_id`=%s AND `account_id` IN %s;
-                """, gamespace, accounts)
-                await db.execute("""
-                    DELETE 
-                    FROM `records`
-                    WHERE `gamespace_id`=%s AND `account_id` IN %s;
-                """, gamespace, accounts)
+        gamespace_id = gamespace if gamespace_only else None
+
+        if not accounts:
+            return
+
+        account_ids = set(int(account_id) for account_id in accounts)
+        self.clusters_cache.pop_if(
+            lambda key, cluster_id: key[1] in account_ids and (gamespace_id is None or key[0] == int(gamespace_id)))
+
+        # a job is stored first, so if the process is stopped meanwhile, the deletion is resumed
+        try:
+            job_id = await self.deletion.create(gamespace_id, accounts)
+        except AccountsDeletionError as e:
+            raise LeaderboardError(500, e.message)
+
+        # deleting may take a while, so nobody waits for it
+        IOLoop.current().spawn_callback(self.__delete_accounts__, job_id, len(accounts))
+
+        return job_id
+
+    async def __delete_accounts__(self, job_id, accounts):
+        try:
+            deleted = await self.deletion.run(job_id)
+        except AccountsDeletionError as e:
+            # the job is resumed later, see AccountsDeletion.resume
+            logging.error("Failed to delete accounts of job {0}: {1}".format(job_id, e.message))
+            return
+
+        if deleted is not None:
+            logging.info("Deleted {0} accounts: {1}".format(accounts, ", ".join(
+                "{0} from {1}".format(count, table) for table, count in sorted(deleted.items()))))
+
+    async def __accounts_deleted__(self, gamespace_id):
+        """
+        Called once a job of accounts deletion is done (see AccountsDeletion),
+            pages (and sketches) may have been built while the records were being deleted
+        """
+        if self.top_cache is not None:
+            await self.top_cache.invalidate_gamespace(gamespace_id)
+        self.score_sketches.outdate(gamespace_id)
+
+    async def __delete_accounts_chunk__(self, gamespace_id, accounts):
+        """
+        Deletes everything of a chunk of accounts, see AccountsDeletion
+        :returns: a dict of table -> rows deleted
+        """
+
+        deleted = {}
+
+        if gamespace_id is not None:
+            query = """
+                DELETE
+                FROM `leaderboard_cluster_accounts`
+                WHERE `account_id` IN %s AND `gamespace_id`=%s
+                LIMIT %s;
+            """
+            args = [accounts, gamespace_id]
         else:
-            async with self.db.acquire() as db:
-                await db.execute("""
-                    DELETE 
-                    FROM `leaderboard_cluster_accounts`
-                    WHERE `account_id` IN %s;
-                """, accounts)
-                await db.execute("""
-                    DELETE 
-                    FROM `records`
-                    WHERE `account_id` IN %s;
-                """, accounts)
+            query = """
+                DELETE
+                FROM `leaderboard_cluster_accounts`
+                WHERE `account_id` IN %s
+                LIMIT %s;
+            """
+            args = [accounts]
+
+        count = 0
+        try:
+            while True:
+                removed = await self.db.execute(query, *(args + [MySQLEngine.DELETE_BATCH_SIZE]))
+                count += removed
+                if removed < MySQLEngine.DELETE_BATCH_SIZE:
+                    break
+        except DatabaseError as e:
+            raise AccountsDeletionError("Failed to delete cluster accounts: " + e.args[1])
+
+        deleted["leaderboard_cluster_accounts"] = count
+
+        for name, engine in self.engines.items():
+            try:
+                count = await engine.delete_accounts(gamespace_id, accounts)
+            except StorageError as e:
+                raise AccountsDeletionError(e.message)
+            deleted[engine.table if isinstance(engine, (MySQLEngine, ShardedEngine)) else name] = count or 0
+
+        try:
+            deleted["leaderboard_snapshot_records"] = await self.snapshots.delete_accounts(gamespace_id, accounts)
+        except SnapshotError as e:
+            raise AccountsDeletionError(e.message)
+
+        return deleted
 
     async def delete_entry(self, leaderboard_name, gamespace_id, account_id, sort_order):
-        async with self.db.acquire() as db:
+        leaderboard = await self.find_leaderboard(
+            gamespace_id, leaderboard_name,
+            sort_order)
 
-            leaderboard = await self.find_leaderboard(
-                gamespace_id, leaderboard_name,
-                sort_order, db=db)
+        engine = self.__engine__(gamespace_id, leaderboard)
+        sketched = self.score_sketches.loaded(gamespace_id, leaderboard.leaderboard_id)
 
-            await db.execute(
-                """
-                    DELETE FROM `records`
-                    WHERE `leaderboard_id`=%s AND `account_id`=%s AND `gamespace_id`=%s;
-                """, leaderboard.leaderboard_id, account_id, gamespace_id)
+        try:
+            previous = await engine.get_score(gamespace_id, leaderboard, None, account_id) if sketched else None
+            await engine.delete_record(gamespace_id, leaderboard, account_id)
+        except StorageError as e:
+            raise LeaderboardError(500, e.message)
 
-            if LeaderboardsModel.is_clustered(leaderboard_name):
-                try:
-                    await self.cluster.leave_cluster(gamespace_id, account_id, leaderboard.leaderboard_id)
-                except ClusterError as e:
-                    raise LeaderboardError(500, e.message)
+        if previous is not None:
+            self.score_sketches.replace(gamespace_id, leaderboard.leaderboard_id, previous, None)
+
+        await self.__written__(gamespace_id, [account_id])
+        await self.__invalidate_top__(gamespace_id, leaderboard.leaderboard_id)
+
+        if LeaderboardsModel.is_clustered(leaderboard_name):
+            try:
+                await self.cluster.leave_cluster(gamespace_id, account_id, leaderboard.leaderboard_id)
+            except ClusterError as e:
+                raise LeaderboardError(500, e.message)
+            finally:
+                self.clusters_cache.pop((int(gamespace_id), int(account_id), leaderboard.leaderboard_id))
 
     async def delete_leaderboard(self, leaderboard_id, gamespace_id):
 
-        async with self.db.acquire() as db:
-            await db.execute(
-                """
-                    DELETE FROM `records`
-                    WHERE `leaderboard_id` = %s AND `gamespace_id` = %s;
-                """, leaderboard_id, gamespace_id)
+        periods = await self.db.query(
+            """
+                SELECT `leaderboard_id`
+                FROM `leaderboards`
+                WHERE `leaderboard_parent_id`=%s AND `gamespace_id`=%s;
+            """, leaderboard_id, gamespace_id)
 
+        for period in periods:
+            await self.delete_leaderboard(period["leaderboard_id"], gamespace_id)
+
+        self.__leaderboard_changed__(gamespace_id, leaderboard_id)
+
+        self.score_sketches.drop(gamespace_id, leaderboard_id)
+
+        self.clusters_cache.pop_if(
+            lambda key, cluster_id: key[0] == int(gamespace_id) and key[2] == int(leaderboard_id))
+
+        # the name of the leaderboard is not known here, so every engine is asked
+        for engine in self.engines.values():
+            try:
+                await engine.delete_leaderboard(gamespace_id, leaderboard_id)
+            except StorageError as e:
+                raise LeaderboardError(500, e.message)
+
+        async with self.db.acquire() as db:
             await db.execute(
                 """
                     DELETE FROM `leaderboards`
@@ -142,93 +938,309 @@ class LeaderboardsModel(Model):
             await self.cluster.delete_clusters_db(
                 gamespace_id, leaderboard_id, db=db)
 
+        # the other instances forget the leaderboards of the gamespace
+        await self.leaderboards_versions.bump(int(gamespace_id))
+
+        await self.__invalidate_top__(gamespace_id, leaderboard_id)
+
+        try:
+            await self.snapshots.delete_leaderboard(gamespace_id, leaderboard_id)
+        except SnapshotError as e:
+            raise LeaderboardError(e.code, e.message)
+
+    async def __periods_dropped__(self, periods):
+        """
+        Deletes the periods whose records have been dropped along with their partition
+        """
+        for gamespace_id, leaderboard_id in periods:
+            await self.delete_leaderboard(leaderboard_id, gamespace_id)
+
+    async def __period_leaderboard__(self, gamespace_id, leaderboard, previous=False, db=None):
+        """
+        :returns: a leaderboard of the current (or previous) period of a periodic leaderboard.
+            A leaderboard of the current period is created if there's none yet.
+        """
+
+        period = LeaderboardPeriod.get(leaderboard.period, leaderboard.period_reset, previous=previous)
+        period_name = period.name(leaderboard.name)
+
+        try:
+            found = await self.find_leaderboard(gamespace_id, period_name, leaderboard.sort_order, db=db)
+        except LeaderboardNotFound:
+            if previous:
+                raise
+        else:
+            # a leaderboard named like that may have been created before the periods were
+            if found.parent_id != leaderboard.leaderboard_id:
+                raise LeaderboardError(409, "Leaderboard '{0}' is not a period of '{1}'".format(
+                    period_name, leaderboard.name))
+            return found
+
+        # kept until the period after it ends, so it can be read as the previous one meanwhile
+        expire_at = period.following(leaderboard.period, leaderboard.period_reset).end
+
+        expire_at = calendar.timegm(expire_at.timetuple())
+
+        try:
+            # so the period never goes into the partition being split, see PeriodRotation
+            await self.rotation.seal(PeriodRotation.expire_day(expire_at))
+
+            return await self.__create_leaderboard__(
+                gamespace_id, period_name, leaderboard.sort_order, leaderboard.policy, db or self.db,
+                parent_id=leaderboard.leaderboard_id, expire_at=expire_at)
+        except DatabaseError as e:
+            raise LeaderboardError(500, "Failed to create a period: " + e.args[1])
+
+    async def resolve_period(self, gamespace_id, leaderboard_name, sort_order, previous=False):
+        """
+        :param previous: resolve the previous period instead of the current one
+        :returns: a name of the leaderboard of the current (or previous) period if the leaderboard is periodic,
+            otherwise the name of the leaderboard itself
+        """
+
+        leaderboard = await self.find_leaderboard(
+            gamespace_id, leaderboard_name,
+            sort_order)
+
+        if leaderboard.is_period:
+            return leaderboard_name
+
+        if not leaderboard.periodic:
+            if previous:
+                raise LeaderboardError(400, "Leaderboard '{0}' is not periodic".format(leaderboard_name))
+            return leaderboard_name
+
+        period = await self.__period_leaderboard__(gamespace_id, leaderboard, previous=previous)
+        return period.name
+
+    @timed("find_leaderboard")
     async def find_leaderboard(self, gamespace_id, leaderboard_name, sort_order, db=None):
 
-        leaderboard = await (db or self.db).get(
-            """
-                SELECT `leaderboard_id`, `leaderboard_name`
-                FROM `leaderboards`
-                WHERE `leaderboard_name` = %s AND `gamespace_id` = %s AND `leaderboard_sort_order` = %s
-                LIMIT 1;
-            """, leaderboard_name, gamespace_id, sort_order)
+        cache_key = (int(gamespace_id), leaderboard_name, sort_order,
+                     await self.leaderboards_versions.get(int(gamespace_id)))
+        leaderboard = self.leaderboards_cache.get(cache_key)
+
+        if leaderboard is LRUCache.MISSING:
+            async def lookup():
+                found = await (db or self.db).get(
+                    """
+                        SELECT {0}
+                        FROM `leaderboards`
+                        WHERE `gamespace_id` = %s AND `leaderboard_name` = %s AND `leaderboard_sort_order` = %s
+                        LIMIT 1;
+                    """.format(LeaderboardsModel.LEADERBOARD_COLUMNS), gamespace_id, leaderboard_name, sort_order)
+
+                if found is None:
+                    # a leaderboard is created upon first post, so remember its absence only for a short while
+                    self.leaderboards_cache.set(cache_key, None, ttl=options.leaderboard_cache_negative_ttl)
+                    return None
+
+                found = LeaderboardAdapter(found)
+                self.leaderboards_cache.set(cache_key, found)
+                return found
+
+            if self.reads is None:
+                leaderboard = await lookup()
+            else:
+                leaderboard = await self.reads.run(("leaderboard",) + cache_key, lookup)
 
         if leaderboard is None:
             raise LeaderboardNotFound(leaderboard_name)
 
-        return LeaderboardAdapter(leaderboard)
+        return leaderboard
 
-    async def list_around_me_records(self, user_id, leaderboard_name, gamespace_id, sort_order, offset, limit):
+    async def __load_score_sketch__(self, gamespace_id, leaderboard):
+        """
+        Counts the records of a leaderboard in buckets of ScoreSketch, in the database, so only
+            the counts come back. That's a scan of the leaderboard's part of the `leaderboard_rank` index.
+        """
 
-        limit = int(limit)
-        async with self.db.acquire() as db:
-            brd = await self.find_leaderboard(
-                gamespace_id, leaderboard_name,
-                sort_order, db=db)
+        bucket, args = ScoreSketch.bucket_sql()
+        db, table = self.__records_source__(gamespace_id, leaderboard)
 
-            user_score = await db.get(
+        try:
+            buckets = await db.query(
                 """
-                    SELECT `score`
-                    FROM `records`
-                    WHERE `leaderboard_id`=%s AND `account_id`=%s AND `gamespace_id`=%s;
-                """, brd.leaderboard_id, user_id, gamespace_id)
+                    SELECT {0} AS `bucket`, COUNT(*) AS `count`
+                    FROM `{1}`
+                    WHERE `gamespace_id`=%s AND `leaderboard_id`=%s AND `score` IS NOT NULL
+                    GROUP BY `bucket`;
+                """.format(bucket, table), *(args + [gamespace_id, leaderboard.leaderboard_id]))
+        except DatabaseError as e:
+            raise LeaderboardError(500, "Failed to count scores: " + e.args[1])
+
+        return [(row["bucket"], row["count"]) for row in buckets]
+
+    @timed("get_percentile")
+    async def get_percentile(self, gamespace_id, leaderboard_name, sort_order, account_id=None, score=None):
+        """
+        Estimates how high a score is in a leaderboard, from a ScoreSketch kept in memory.
+        On a clustered leaderboard, the score is compared with every cluster's records.
+
+        :param score: a score to estimate for, otherwise the score of the account's record is
+        :returns: a dict with `score`, `rank`, `top` (a percent of records the score is within, say,
+            3.2 for the top 3.2%), `total`, and `error`, both in ranks and in percents (`rank_error` and `top_error`):
+            the estimate is off by that much at most (as of when the sketch was built, see ScoreSketches)
+        """
+
+        leaderboard = await self.find_leaderboard(
+            gamespace_id, leaderboard_name,
+            sort_order)
+
+        if score is None:
+            try:
+                score = await self.__engine__(gamespace_id, leaderboard).get_score(
+                    gamespace_id, leaderboard, None if leaderboard.clustered else 0, account_id)
+            except StorageError as e:
+                raise LeaderboardError(500, e.message)
+
+            if score is None:
+                raise LeaderboardError(404, "No record of the account")
+        else:
+            try:
+                score = float(score)
+            except (TypeError, ValueError):
+                raise LeaderboardError(400, "Score should be a number")
 
-            if not user_score:
-                return None
+            if not math.isfinite(score):
+                raise LeaderboardError(400, "Score should be a finite number")
 
-            user_score = user_score["score"]
+        sketch = await self.score_sketches.get(
+            gamespace_id, leaderboard.leaderboard_id,
+            lambda: self.__load_score_sketch__(gamespace_id, leaderboard))
 
-            records = await db.query(
-                """
-                    (SELECT `account_id`, `display_name`, `score`, `profile`
-                        FROM `records`
-                        WHERE `leaderboard_id`=%s AND `gamespace_id`=%s AND `score`<%s
-                        ORDER BY `score` DESC
-                        LIMIT %s)
-                    UNION
-                    (SELECT `account_id`, `display_name`, `score`, `profile`
-                        FROM `records`
-                        WHERE `leaderboard_id`=%s AND `gamespace_id`=%s AND `score` >= %s
-                        ORDER BY `score` ASC
-                        LIMIT %s)
-                    ORDER BY `score` {0} LIMIT %s, %s;
-                """.format(sort_order.upper()),
-
-                brd.leaderboard_id,
-                gamespace_id,
-                user_score,
-                limit / 2,
-
-                brd.leaderboard_id,
-                gamespace_id,
-                user_score,
-                limit / 2,
-
-                offset,
-                limit)
-
-            return list(map(RecordAdapter, records))
+        rank, error, total = sketch.estimate(score, leaderboard.sort_order)
+
+        return {
+            "score": score,
+            "rank": rank,
+            "rank_error": error,
+            "total": total,
+            "top": rank * 100.0 / total if total else 0.0,
+            "top_error": error * 100.0 / total if total else 0.0
+        }
+
+    @timed("list_around_me_records")
+    async def list_around_me_records(self, user_id, leaderboard_name, gamespace_id, sort_order, offset, limit):
+
+        leaderboard = await self.find_leaderboard(
+            gamespace_id, leaderboard_name,
+            sort_order)
+
+        self.metrics.activity.read(gamespace_id, leaderboard.leaderboard_id, leaderboard.name)
+
+        try:
+            # on a clustered leaderboard, the cluster of the user's record is looked in
+            records = await self.__engine__(gamespace_id, leaderboard).list_around(
+                gamespace_id, leaderboard, None if leaderboard.clustered else 0,
+                user_id, offset, limit, since=await self.__since__(gamespace_id, [user_id]))
+        except StorageError as e:
+            raise LeaderboardError(500, e.message)
+
+        if records is None:
+            return None
 
+        return RecordPage(records)
+
+    @timed("list_friends_records")
     async def list_friends_records(self, friends_ids, leaderboard_name, gamespace_id, sort_order, offset, limit):
+        """
+        Friend lists bigger than options.friends_chunk_size are looked up in chunks, so no query
+            gets an unbounded list of accounts. Each chunk's best `offset + limit` records are merged in score order.
+        """
 
-        async with self.db.acquire() as db:
-            leaderboard = await self.find_leaderboard(
-                gamespace_id, leaderboard_name,
-                sort_order, db=db)
+        leaderboard = await self.find_leaderboard(
+            gamespace_id, leaderboard_name,
+            sort_order)
 
-            records = await db.query(
-                """
-                    SELECT `account_id`, `display_name`, `score`, `profile`
-                    FROM `records`
-                    WHERE `leaderboard_id`=%s AND `gamespace_id`=%s AND `account_id` IN %s
-                    ORDER BY `score` {0}
-                    LIMIT %s, %s;
-                """.format(sort_order.upper()),
-                leaderboard.leaderboard_id, gamespace_id, friends_ids, offset, limit)
+        self.metrics.activity.read(gamespace_id, leaderboard.leaderboard_id, leaderboard.name)
+
+        # each friend is ranked within the cluster it belongs to
+        records = await self.__list_accounts__(gamespace_id, leaderboard, friends_ids, offset, limit)
+
+        return RecordPage(records)
 
-            return list(map(RecordAdapter, records))
+    async def __list_accounts__(self, gamespace_id, leaderboard, account_ids, offset, limit):
+        """
+        Ranks records of the accounts given, all at once (see StorageEngine.list_accounts).
+        Lists bigger than options.friends_chunk_size are looked up in chunks, so no query
+            gets an unbounded list of accounts. The chunks are looked up concurrently, options.clusters_concurrency
+            at most at a time, and each chunk's best `offset + limit` records are merged in score order.
+        """
+
+        offset = int(offset)
+        limit = int(limit)
+        chunk_size = options.friends_chunk_size
+        engine = self.__engine__(gamespace_id, leaderboard)
+
+        # any of the accounts may have just written
+        since = await self.__since__(gamespace_id, account_ids)
+
+        try:
+            if len(account_ids) <= chunk_size:
+                return await engine.list_accounts(
+                    gamespace_id, leaderboard, account_ids, offset, limit, since=since)
+
+            semaphore = asyncio.Semaphore(options.clusters_concurrency)
+
+            async def list_chunk(chunk):
+                async with semaphore:
+                    return await engine.list_accounts(gamespace_id, leaderboard, chunk, 0, offset + limit, since=since)
+
+            chunks = await asyncio.gather(*[
+                list_chunk(account_ids[i:i + chunk_size])
+                for i in range(0, len(account_ids), chunk_size)
+            ])
+        except StorageError as e:
+            raise LeaderboardError(500, e.message)
+
+        return list(itertools.islice(heapq.merge(
+            *chunks,
+            key=lambda record: (record[1]["score"], record[1]["account_id"]),
+            reverse=leaderboard.sort_order == "desc"), offset, offset + limit))
+
+    @timed("list_accounts_ranks")
+    async def list_accounts_ranks(self, gamespace_id, leaderboard_name, sort_order, account_ids):
+        """
+        Ranks of many accounts at once, say, of the members of a guild, with as many queries as there are chunks
+            of accounts (see __list_accounts__), each ranking the whole chunk with counts over
+            the `leaderboard_rank` index (or with the rank index, or a single script of the redis storage engine).
+        On a clustered leaderboard, each account is ranked within its cluster.
+
+        :returns: a (RecordPage of the accounts that have a record, best first, a list of accounts that have none)
+        """
+
+        try:
+            account_ids = list(OrderedDict.fromkeys(int(account_id) for account_id in account_ids))
+        except (TypeError, ValueError):
+            raise LeaderboardError(400, "Accounts should be a list of account ids")
+
+        if len(account_ids) > options.ranks_max_accounts:
+            raise LeaderboardError(400, "Too many accounts, {0} at most".format(options.ranks_max_accounts))
+
+        leaderboard = await self.find_leaderboard(
+            gamespace_id, leaderboard_name,
+            sort_order)
+
+        self.metrics.activity.read(gamespace_id, leaderboard.leaderboard_id, leaderboard.name)
+
+        if not account_ids:
+            return RecordPage([]), []
+
+        records = await self.__list_accounts__(gamespace_id, leaderboard, account_ids, 0, len(account_ids))
+
+        found = set(int(record["account_id"]) for rank, record in records)
+
+        return RecordPage(records), [account_id for account_id in account_ids if account_id not in found]
 
     # noinspection PyBroadException
-    async def list_top_all_clusters(self, leaderboard_name, gamespace_id, sort_order):
+    @timed("list_top_all_clusters")
+    async def list_top_all_clusters(self, leaderboard_name, gamespace_id, sort_order, limit=None):
+        """
+        :param limit: amount of top records of each cluster, options.clusters_top_limit by default
+        """
+
+        limit = int(limit or options.clusters_top_limit)
 
         async with self.db.acquire() as db:
             leaderboard = await self.find_leaderboard(
@@ -236,8 +1248,9 @@ class LeaderboardsModel(Model):
                 sort_order, db=db)
 
             if not LeaderboardsModel.is_clustered(leaderboard_name):
+                self.metrics.activity.read(gamespace_id, leaderboard.leaderboard_id, leaderboard.name)
                 data = await self.__list_top_records_cluster__(
-                    leaderboard.leaderboard_id, gamespace_id, 0, sort_order, 0, 1000)
+                    leaderboard, gamespace_id, 0, 0, limit)
 
                 return {
                     0: data
@@ -248,131 +1261,476 @@ class LeaderboardsModel(Model):
 
             try:
                 data = await self.list_top_records_clusters(
-                    leaderboard.leaderboard_id, gamespace_id,
-                    cluster_ids, sort_order)
+                    leaderboard, gamespace_id, cluster_ids, limit)
             except Exception:
                 logging.exception("Error during requesting top clusters")
                 return
 
             return data
 
-    async def __list_top_records_cluster__(self, leaderboard_id, gamespace_id, cluster_id, sort_order, offset, limit):
-        async with self.db.acquire() as db:
-            try:
-                records = await db.query(
-                    """
-                        SELECT `account_id`, `display_name`, `score`, `profile`
-                        FROM `records`
-                        WHERE `gamespace_id`=%s AND `leaderboard_id`=%s AND `cluster_id`=%s
-                        ORDER BY score {0}
-                        LIMIT %s, %s;
-                    """.format(sort_order.upper()),
-                    gamespace_id, leaderboard_id, cluster_id, int(offset), int(limit))
-            except DatabaseError as e:
-                raise LeaderboardError(500, "Failed to get top records: " + e.args[1])
-            else:
+    @timed("list_top_clusters_page")
+    async def list_top_clusters_page(self, leaderboard_name, gamespace_id, sort_order,
+                                     after_cluster_id=0, clusters=None, limit=None):
+        """
+        Lists top records of a page of clusters of a clustered leaderboard, so all of the clusters can be walked
+            through in bounded memory, say, to give out rewards at the end of a season.
+
+        :param after_cluster_id: the `next` of the previous page, zero for the first page
+        :param clusters: amount of clusters in a page, options.clusters_page_size by default
+        :param limit: amount of top records of each cluster, options.clusters_top_limit by default
+        :returns: a tuple of (dict of cluster_id -> RecordPage, the cluster id to request the next page after,
+            or None if that was the last page)
+        """
+
+        clusters = int(clusters or options.clusters_page_size)
+        limit = int(limit or options.clusters_top_limit)
+
+        leaderboard = await self.find_leaderboard(
+            gamespace_id, leaderboard_name,
+            sort_order)
+
+        if not LeaderboardsModel.is_clustered(leaderboard_name):
+            raise LeaderboardError(400, "Leaderboard is not clustered")
+
+        try:
+            # `cluster_data` index has the primary key appended, so that's a range of it
+            cluster_ids = await self.db.query(
+                """
+                    SELECT `cluster_id`
+                    FROM `leaderboard_clusters`
+                    WHERE `gamespace_id`=%s AND `cluster_data`=%s AND `cluster_id` > %s
+                    ORDER BY `cluster_id` ASC
+                    LIMIT %s;
+                """, gamespace_id, leaderboard.leaderboard_id, int(after_cluster_id), clusters)
+        except DatabaseError as e:
+            raise LeaderboardError(500, "Failed to list clusters: " + e.args[1])
+
+        cluster_ids = [cluster["cluster_id"] for cluster in cluster_ids]
+
+        if not cluster_ids:
+            return {}, None
+
+        data = await self.list_top_records_clusters(
+            leaderboard, gamespace_id, cluster_ids, limit)
+
+        return data, cluster_ids[-1] if len(cluster_ids) >= clusters else None
+
+    async def __list_top_records_cluster__(self, leaderboard, gamespace_id, cluster_id,
+                                           offset, limit, cursor=None, since=None):
+        """
+        Lists a page of a leaderboard cluster, either at an offset, or after a LeaderboardCursor if passed.
+        """
+
+        after = None if cursor is None else (cursor.score, cursor.account_id, cursor.rank)
 
-                result = [
-                    RecordAdapter(data, index)
-                    for index, data in enumerate(records, start=1)
-                ]
+        try:
+            records = await self.__engine__(gamespace_id, leaderboard).list_top(
+                gamespace_id, leaderboard, cluster_id, offset, limit, after=after, since=since)
+        except StorageError as e:
+            raise LeaderboardError(500, e.message)
 
-                return result
+        return RecordPage(records)
 
-    async def list_top_records_clusters(self, leaderboard_id, gamespace_id, cluster_ids, sort_order):
+    async def __list_top_records_cached__(self, leaderboard, gamespace_id, cluster_id,
+                                          offset, limit, cursor=None, since=None):
+        """
+        Same as __list_top_records_cluster__, but served from the top pages cache, if enabled.
+        Concurrent reads of the same page share a single read, if read coalescing is enabled.
+        A read that has to see recent writes (see __since__) is never shared, nor cached.
+        """
+
+        self.metrics.activity.read(gamespace_id, leaderboard.leaderboard_id, leaderboard.name)
+
+        if since is not None:
+            return await self.__list_top_records_cluster__(
+                leaderboard, gamespace_id, cluster_id,
+                offset, limit, cursor=cursor, since=since)
+
+        if cursor is not None:
+            page = "cursor:{0}:{1}".format(cursor.encode(), int(limit))
+        else:
+            page = "offset:{0}:{1}".format(int(offset), int(limit))
+
+        async def fetch():
+            records = await self.__list_top_records_cluster__(
+                leaderboard, gamespace_id, cluster_id,
+                offset, limit, cursor=cursor)
+
+            return [
+                [record.rank, record.account, record.name, record.score, record.profile]
+                for record in records
+            ]
+
+        def adapter(item):
+            rank, account_id, display_name, score, profile = item
+            return RecordAdapter({
+                "account_id": account_id,
+                "display_name": display_name,
+                "score": score,
+                "profile": profile,
+                "cluster_id": cluster_id
+            }, rank)
+
+        async def read():
+            if self.top_cache is None:
+                return await self.__list_top_records_cluster__(
+                    leaderboard, gamespace_id, cluster_id,
+                    offset, limit, cursor=cursor)
+
+            records = await self.top_cache.get(
+                gamespace_id, leaderboard.leaderboard_id, leaderboard.name,
+                cluster_id, leaderboard.sort_order, page, fetch)
+
+            return RecordPage(records, adapter)
+
+        if self.reads is None:
+            return await read()
+
+        # a RecordPage is never changed, so it can be shared
+        return await self.reads.run(
+            ("top", int(gamespace_id), leaderboard.leaderboard_id, int(cluster_id), leaderboard.sort_order, page),
+            read)
+
+    @timed("list_top_records_clusters")
+    async def list_top_records_clusters(self, leaderboard, gamespace_id, cluster_ids, limit):
 
         if not cluster_ids:
             raise LeaderboardError(400, "Empty cluster_ids")
 
-        async with self.db.acquire() as db:
+        self.metrics.activity.read(gamespace_id, leaderboard.leaderboard_id, leaderboard.name)
+
+        try:
+            clusters = await self.__engine__(gamespace_id, leaderboard).list_clusters(
+                gamespace_id, leaderboard, cluster_ids, limit)
+        except StorageError as e:
+            raise LeaderboardError(500, e.message)
+
+        return {
+            cluster_id: RecordPage(records)
+            for cluster_id, records in clusters.items()
+        }
+
+    @timed("list_top_records_account")
+    async def list_top_records_account(self, leaderboard_name, gamespace_id,
+                                       account_id, sort_order, offset=0, limit=1000, cursor=None):
+
+        # no connection is held for the whole request, a cached leaderboard needs none at all
+        leaderboard = await self.find_leaderboard(
+            gamespace_id, leaderboard_name,
+            sort_order)
+
+        if LeaderboardsModel.is_clustered(leaderboard_name):
             try:
-                records = await db.query(
-                    """
-                        SELECT `account_id`, `display_name`, `score`, `profile`, `cluster_id`
-                        FROM `records`
-                        WHERE `gamespace_id`=%s AND `leaderboard_id`=%s AND `cluster_id` IN %s
-                        ORDER BY `score` {0};
-                    """.format(sort_order.upper()),
-                    gamespace_id, leaderboard_id, cluster_ids)
-            except DatabaseError as e:
-                raise LeaderboardError(500, "Failed to get top records: " + e.args[1])
-            else:
+                cluster_id = await self.__get_cluster__(
+                    gamespace_id, account_id, leaderboard.leaderboard_id, auto_create=False)
+            except NoClusterError:
+                raise LeaderboardNotFound(leaderboard_name)
+        else:
+            cluster_id = 0
 
-                result = {}
+        result = await self.__list_top_records_cached__(
+            leaderboard, gamespace_id, cluster_id,
+            offset, limit, cursor=cursor, since=await self.__since__(gamespace_id, [account_id]))
 
-                for record in records:
-                    cluster_id = record["cluster_id"]
+        return result
 
-                    try:
-                        existing = result[cluster_id]
-                        existing.append(RecordAdapter(record, len(existing) + 1))
-                    except KeyError:
-                        result[cluster_id] = [RecordAdapter(record, 1)]
+    @timed("list_top_records")
+    async def list_top_records(self, leaderboard_name, gamespace_id, sort_order, offset=0, limit=1000,
+                               cursor=None):
 
-                return result
+        leaderboard = await self.find_leaderboard(
+            gamespace_id, leaderboard_name,
+            sort_order)
 
-    async def list_top_records_account(self, leaderboard_name, gamespace_id,
-                                       account_id, sort_order, offset=0, limit=1000):
-        async with self.db.acquire() as db:
+        if LeaderboardsModel.is_clustered(leaderboard_name):
+            raise LeaderboardNotFound(leaderboard_name)
+        else:
+            cluster_id = 0
 
-            leaderboard = await self.find_leaderboard(
-                gamespace_id, leaderboard_name,
-                sort_order, db=db)
+        result = await self.__list_top_records_cached__(
+            leaderboard, gamespace_id, cluster_id,
+            offset, limit, cursor=cursor)
+
+        return result
 
+    async def create_snapshot(self, gamespace_id, leaderboard_name, sort_order, snapshot_name, ttl=None,
+                              previous=False):
+        """
+        Materializes a leaderboard, every cluster of it if it's clustered, into a snapshot, see LeaderboardSnapshots
+        :param previous: on a periodic leaderboard, the previous period is materialized instead of the current one.
+            Snapshots of a periodic leaderboard belong to the leaderboard, so they outlive the periods.
+        :returns: a dict with `snapshot_id` and `snapshot_records`
+        """
+
+        leaderboard = await self.find_leaderboard(
+            gamespace_id, leaderboard_name,
+            sort_order)
+
+        if leaderboard.periodic:
+            source = await self.__period_leaderboard__(gamespace_id, leaderboard, previous=previous)
+        else:
+            source = leaderboard
+
+        # a record still in the write-behind buffer is not in the database yet
+        if self.write_behind is not None:
+            await self.write_behind.flush()
+
+        db, table = self.__records_source__(gamespace_id, source)
+
+        try:
+            return await self.snapshots.create_snapshot(
+                gamespace_id, leaderboard.leaderboard_id, leaderboard.sort_order, snapshot_name, ttl=ttl,
+                table=table, records_of=source.leaderboard_id, source=db)
+        except SnapshotError as e:
+            raise LeaderboardError(e.code, e.message)
+
+    async def list_snapshots(self, gamespace_id, leaderboard_name, sort_order):
+        leaderboard = await self.find_leaderboard(
+            gamespace_id, leaderboard_name,
+            sort_order)
+
+        try:
+            return await self.snapshots.list_snapshots(gamespace_id, leaderboard.leaderboard_id)
+        except SnapshotError as e:
+            raise LeaderboardError(e.code, e.message)
+
+    async def delete_snapshot(self, gamespace_id, snapshot_id):
+        try:
+            await self.snapshots.delete_snapshot(gamespace_id, snapshot_id)
+        except SnapshotError as e:
+            raise LeaderboardError(e.code, e.message)
+
+    async def get_snapshot(self, gamespace_id, leaderboard_name, sort_order, snapshot_name):
+        leaderboard = await self.find_leaderboard(
+            gamespace_id, leaderboard_name,
+            sort_order)
+
+        try:
+            return await self.snapshots.get_snapshot(gamespace_id, leaderboard.leaderboard_id, snapshot_name)
+        except SnapshotError as e:
+            raise LeaderboardError(e.code, e.message)
+
+    @timed("list_snapshot_top")
+    async def list_snapshot_top(self, gamespace_id, leaderboard_name, sort_order, snapshot_name,
+                                account_id=None, cluster_id=None, offset=0, limit=1000):
+        """
+        :param account_id: on a clustered leaderboard, the cluster of the account's record is listed
+        :param cluster_id: on a clustered leaderboard, this cluster is listed if no account_id is given
+        :returns: a RecordPage, or None if the account has no record in the snapshot
+        """
+
+        snapshot = await self.get_snapshot(gamespace_id, leaderboard_name, sort_order, snapshot_name)
+
+        try:
             if LeaderboardsModel.is_clustered(leaderboard_name):
-                try:
-                    cluster_id = await self.cluster.get_cluster(
-                        gamespace_id, account_id, leaderboard.leaderboard_id,
-                        cluster_size=self.cluster_size, auto_create=False)
-                except NoClusterError:
-                    raise LeaderboardNotFound(leaderboard_name)
+                if account_id is not None:
+                    cluster_id = await self.snapshots.get_cluster(snapshot["snapshot_id"], account_id)
+                    if cluster_id is None:
+                        return None
+                elif cluster_id is None:
+                    raise LeaderboardError(400, "Either account or cluster should be specified")
             else:
                 cluster_id = 0
 
-            result = await self.__list_top_records_cluster__(
-                leaderboard.leaderboard_id, gamespace_id, cluster_id,
-                sort_order, offset, limit)
+            records = await self.snapshots.list_top(snapshot["snapshot_id"], cluster_id, offset, limit)
+        except SnapshotError as e:
+            raise LeaderboardError(e.code, e.message)
 
-            return result
+        return RecordPage(records)
 
-    async def list_top_records(self, leaderboard_name, gamespace_id, sort_order, offset=0, limit=1000):
-        async with self.db.acquire() as db:
+    @timed("list_snapshot_around")
+    async def list_snapshot_around(self, gamespace_id, leaderboard_name, sort_order, snapshot_name,
+                                   account_id, offset, limit):
+        """
+        :returns: a RecordPage, or None if the account has no record in the snapshot
+        """
 
-            leaderboard = await self.find_leaderboard(
-                gamespace_id, leaderboard_name,
-                sort_order, db=db)
+        snapshot = await self.get_snapshot(gamespace_id, leaderboard_name, sort_order, snapshot_name)
 
-            if LeaderboardsModel.is_clustered(leaderboard_name):
-                raise LeaderboardNotFound(leaderboard_name)
-            else:
-                cluster_id = 0
+        try:
+            records = await self.snapshots.list_around(snapshot["snapshot_id"], account_id, offset, limit)
+        except SnapshotError as e:
+            raise LeaderboardError(e.code, e.message)
+
+        if records is None:
+            return None
+
+        return RecordPage(records)
 
-            result = await self.__list_top_records_cluster__(
-                leaderboard.leaderboard_id, gamespace_id, cluster_id,
-                sort_order, offset, limit)
+    @timed("list_snapshot_accounts")
+    async def list_snapshot_accounts(self, gamespace_id, leaderboard_name, sort_order, snapshot_name, account_ids):
+        snapshot = await self.get_snapshot(gamespace_id, leaderboard_name, sort_order, snapshot_name)
 
-            return result
+        try:
+            records = await self.snapshots.list_accounts(snapshot["snapshot_id"], account_ids)
+        except SnapshotError as e:
+            raise LeaderboardError(e.code, e.message)
 
-    async def insert_record(self, gamespace_id, leaderboard_id, account_id,
-                            time_to_live, profile, score, display_name, cluster_id=0, db=None):
+        return RecordPage(records)
 
-        result = await (db or self.db).insert(
+    @timed("list_snapshot_records")
+    async def list_snapshot_records(self, gamespace_id, leaderboard_name, sort_order, snapshot_name,
+                                    after_cluster_id=0, after_rank=0, limit=1000):
+        """
+        Walks a whole snapshot, in pages
+        :returns: a (RecordPage, (cluster_id, rank) of the next page or None if this one is the last one)
+        """
+
+        snapshot = await self.get_snapshot(gamespace_id, leaderboard_name, sort_order, snapshot_name)
+
+        try:
+            records = await self.snapshots.list_records(snapshot["snapshot_id"], after_cluster_id, after_rank, limit)
+        except SnapshotError as e:
+            raise LeaderboardError(e.code, e.message)
+
+        if len(records) < int(limit):
+            following = None
+        else:
+            rank, record = records[-1]
+            following = (record["cluster_id"], rank)
+
+        return RecordPage(records), following
+
+    async def __write_pending_records__(self, board, records):
+        """
+        Writes a batch of pending records of the write-behind buffer
+        """
+
+        # looked up again (it's cached anyway), as the leaderboard may have been moved into another shard meanwhile
+        try:
+            leaderboard = await self.find_leaderboard(board.gamespace_id, board.leaderboard_name, board.sort_order)
+        except LeaderboardNotFound:
+            logging.warning("Leaderboard '{0}' has been deleted, {1} pending records are dropped".format(
+                board.leaderboard_name, len(records)))
+            return
+
+        try:
+            await self.__engine__(board.gamespace_id, leaderboard).write_records(
+                board.gamespace_id, leaderboard, board.cluster_id, records)
+        except StorageError as e:
+            raise LeaderboardError(500, "Failed to write pending records: " + e.message)
+
+        await self.__written__(board.gamespace_id, [record.account_id for record in records])
+
+        await self.__invalidate_top__(board.gamespace_id, board.leaderboard_id)
+
+    async def __create_leaderboard__(self, gamespace_id, leaderboard_name, sort_order, policy, db,
+                                     period=PERIOD_NONE, period_reset=0, parent_id=None, expire_at=None):
+        """
+        :param parent_id: a periodic leaderboard, if the leaderboard is a period of it
+        :param expire_at: a unix timestamp the period can be dropped after, see PeriodRotation
+        """
+
+        # periods are always kept in the main database, see PeriodRotation
+        shard = None if parent_id is not None else self.shards.place(gamespace_id, leaderboard_name, sort_order)
+
+        # concurrent first posts end up with the same leaderboard thanks to the unique key
+        leaderboard_id = await db.insert(
             """
-                INSERT INTO `records`
-                (`account_id`, `leaderboard_id`, `gamespace_id`, `expire_at`,
-                `profile`, `score`, `display_name`, `cluster_id`)
-                VALUES (%s, %s, %s, NOW() + INTERVAL %s SECOND, %s, %s, %s, %s);
-            """,
-            account_id, leaderboard_id, gamespace_id, time_to_live,
-            ujson.dumps(profile), score, display_name, cluster_id)
+                INSERT INTO `leaderboards`
+                (`leaderboard_name`, `gamespace_id`, `leaderboard_sort_order`, `leaderboard_policy`,
+                `leaderboard_period`, `leaderboard_period_reset`, `leaderboard_parent_id`, `leaderboard_expire_at`,
+                `leaderboard_shard`)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, FROM_UNIXTIME(%s), %s)
+                ON DUPLICATE KEY UPDATE `leaderboard_id`=LAST_INSERT_ID(`leaderboard_id`);
+            """, leaderboard_name, gamespace_id, sort_order, policy,
+            period, period_reset, parent_id, expire_at, shard)
+
+        # the leaderboard may have been there already, created by someone else with other settings,
+        #   so whatever is stored is what gets cached, not what has been asked for
+        stored = await db.get(
+            """
+                SELECT {0}
+                FROM `leaderboards`
+                WHERE `leaderboard_id`=%s;
+            """.format(LeaderboardsModel.LEADERBOARD_COLUMNS), leaderboard_id)
 
-        return result
+        if stored is None:
+            raise LeaderboardError(409, "Leaderboard has been deleted while being created")
+
+        leaderboard = LeaderboardAdapter(stored)
 
+        self.leaderboards_cache.set(
+            (int(gamespace_id), leaderboard_name, sort_order, await self.leaderboards_versions.get(int(gamespace_id))),
+            leaderboard)
+        return leaderboard
+
+    @timed("add_entry")
     async def add_entry(self, gamespace_id, leaderboard_name, sort_order, account_id,
-                        display_name, score, time_to_live, profile):
+                        display_name, score, time_to_live, profile, policy=None, period=None, period_reset=0):
+        """
+        Posts a score of an account into a leaderboard, creating the leaderboard upon first post.
+
+        :param profile: a JSON-serializable object, or a JSON text of it (which is then stored as is)
+
+        :param policy: how a new score is applied to the stored one, see LeaderboardsModel.POLICIES.
+            Only matters upon creation of the leaderboard, existing leaderboards keep their policy.
+        :param period: makes the leaderboard a periodic one (see periods.PERIODS), resetting `period_reset`
+            seconds after the start of a period, see LeaderboardPeriod. Only matters upon creation of the leaderboard,
+            too. A score posted into a periodic leaderboard goes into its current period.
+        :returns: True if the stored record has been changed, False if the score was not good enough
+            for the 'best' policy, so nothing has been written, or None if the record is written
+            later by the write-behind buffer
+
+        Database round trips, worst case:
+
+            1. Leaderboard lookup (none once the leaderboard is cached, see find_leaderboard)
+            2. Leaderboard creation, and reading it back (the very first post into the leaderboard only)
+            3. Cluster lookup (clustered leaderboards only); joining a cluster takes a few more round trips,
+               but happens once per account per leaderboard
+            4. The record upsert (always, see MySQLEngine.insert_record)
+            5. Reading the summed up score back ('increment' policy with the rank index enabled only)
+            6. Reading the score being replaced (only if this process keeps a score sketch of the leaderboard,
+               see get_percentile)
+
+        So a post into a known non-clustered leaderboard costs exactly one round trip, two at most if the
+            leaderboard is not cached, and four for the very first post.
+        With the top pages cache enabled, a change also costs a key/value storage round trip to invalidate it.
+        With the redis storage engine, the record is written with a single script instead
+            (after the upsert, if write-through is enabled).
+        """
 
         clustered = LeaderboardsModel.is_clustered(leaderboard_name)
 
+        try:
+            score = float(score)
+        except (TypeError, ValueError):
+            raise LeaderboardError(400, "Score should be a number")
+
+        # nor could it be ranked, nor sketched
+        if not math.isfinite(score):
+            raise LeaderboardError(400, "Score should be a finite number")
+
+        policy = policy or LeaderboardsModel.POLICY_LATEST
+
+        if policy not in LeaderboardsModel.POLICIES:
+            raise LeaderboardError(400, "Policy should be one of: " + ", ".join(LeaderboardsModel.POLICIES))
+
+        period = period or PERIOD_NONE
+
+        # a period is named after the periodic leaderboard, see LeaderboardPeriod
+        max_name_length = LeaderboardsModel.MAX_NAME_LENGTH - \
+            (LeaderboardPeriod.NAME_SUFFIX_LENGTH if period != PERIOD_NONE else 0)
+
+        if len(leaderboard_name) > max_name_length:
+            raise LeaderboardError(400, "Leaderboard name should be {0} characters long at most".format(
+                max_name_length))
+
+        if period != PERIOD_NONE:
+            if period not in PERIODS:
+                raise LeaderboardError(400, "Period should be one of: " + ", ".join(PERIODS))
+
+            try:
+                period_reset = int(period_reset or 0)
+            except (TypeError, ValueError):
+                raise LeaderboardError(400, "Period reset should be a number of seconds")
+
+            if not 0 <= period_reset < MAX_RESET[period]:
+                raise LeaderboardError(400, "Period reset should be less than {0} seconds".format(MAX_RESET[period]))
+
+        # encoded once, engines store it (and hand it back) as is
+        profile = encode_profile(profile)
+
         async with self.db.acquire() as db:
             try:
 
@@ -382,61 +1740,66 @@ class LeaderboardsModel(Model):
                         sort_order, db=db)
 
                 except LeaderboardNotFound:
-                    leaderboard_id = await db.insert(
-                        """
-                            INSERT INTO `leaderboards`
-                            (`leaderboard_name`, `gamespace_id`, `leaderboard_sort_order`)
-                            VALUES (%s, %s, %s);
-                        """, leaderboard_name, gamespace_id, sort_order)
-
-                    if clustered:
-                        cluster_id = await self.cluster.get_cluster(
-                            gamespace_id, account_id, leaderboard_id,
-                            cluster_size=self.cluster_size, auto_create=True)
-                    else:
-                        cluster_id = 0
-
-                    await self.insert_record(
-                        gamespace_id, leaderboard_id, account_id,
-                        time_to_live, profile, score, display_name,
-                        cluster_id=cluster_id, db=db)
+                    # so a new leaderboard never takes a name of a period, leaderboards named like that
+                    # before the periods were keep working as usual
+                    if PERIOD_SEPARATOR in leaderboard_name:
+                        raise LeaderboardError(400, "Leaderboard name should not contain '{0}'".format(
+                            PERIOD_SEPARATOR))
+
+                    leaderboard = await self.__create_leaderboard__(
+                        gamespace_id, leaderboard_name, sort_order, policy, db,
+                        period=period, period_reset=period_reset if period != PERIOD_NONE else 0)
+
+                if leaderboard.is_period:
+                    raise LeaderboardError(400, "Scores are posted into the periodic leaderboard, not its periods")
+
+                if leaderboard.periodic:
+                    leaderboard = await self.__period_leaderboard__(gamespace_id, leaderboard, db=db)
+                    leaderboard_name = leaderboard.name
+
+                if clustered:
+                    cluster_id = await self.__get_cluster__(
+                        gamespace_id, account_id, leaderboard.leaderboard_id, auto_create=True)
                 else:
+                    cluster_id = 0
 
-                    if clustered:
-                        cluster_id = await self.cluster.get_cluster(
-                            gamespace_id, account_id, leaderboard.leaderboard_id,
-                            cluster_size=self.cluster_size, auto_create=True)
-                    else:
-                        cluster_id = 0
-
-                    record = await db.get(
-                        """
-                            SELECT *
-                            FROM `records`
-                            WHERE `leaderboard_id`=%s AND `account_id`=%s AND `gamespace_id`=%s AND `cluster_id`=%s;
-                        """,
-                        leaderboard.leaderboard_id,
-                        account_id,
-                        gamespace_id,
-                        cluster_id
-                    )
-
-                    if not record:
-                        await self.insert_record(
-                            gamespace_id, leaderboard.leaderboard_id, account_id,
-                            time_to_live, profile, score, display_name,
-                            cluster_id=cluster_id, db=db
-                        )
-                    else:
-                        await db.execute(
-                            """
-                                UPDATE `records`
-                                SET `expire_at`=NOW() + INTERVAL %s SECOND, `profile`=%s,
-                                    `score`=%s, `display_name`=%s
-                                WHERE `leaderboard_id`=%s AND `account_id`=%s AND `gamespace_id`=%s AND `cluster_id`=%s;
-                            """,
-                            time_to_live, ujson.dumps(profile),
-                            score, display_name, leaderboard.leaderboard_id, account_id, gamespace_id, cluster_id)
             except DatabaseError as e:
                 raise LeaderboardError(500, "Failed add entry: " + e.args[1])
-        return "OK"
+
+        self.metrics.activity.write(gamespace_id, leaderboard.leaderboard_id, leaderboard_name)
+
+        if self.write_behind is not None:
+            try:
+                await self.write_behind.add(
+                    WriteBehindBoard(
+                        gamespace_id, leaderboard.leaderboard_id, leaderboard_name, cluster_id,
+                        leaderboard.policy, sort_order),
+                    PendingRecord(account_id, display_name, score, time_to_live, profile))
+            except WriteBehindFull:
+                raise LeaderboardError(503, "Too many pending scores, please try again later")
+            return None
+
+        engine = self.__engine__(gamespace_id, leaderboard)
+        sketched = self.score_sketches.loaded(gamespace_id, leaderboard.leaderboard_id)
+
+        try:
+            # the score being replaced has to leave the sketch
+            previous = await engine.get_score(
+                gamespace_id, leaderboard, cluster_id, account_id) if sketched else None
+
+            changed = await engine.insert_record(
+                gamespace_id, leaderboard, cluster_id, account_id,
+                display_name, score, time_to_live, profile)
+        except StorageError as e:
+            raise LeaderboardError(500, "Failed add entry: " + e.message)
+
+        await self.__written__(gamespace_id, [account_id])
+
+        if changed:
+            if sketched:
+                stored = score + (previous or 0) if leaderboard.policy == POLICY_INCREMENT else score
+                self.score_sketches.replace(gamespace_id, leaderboard.leaderboard_id, previous, stored)
+
+            await self.__invalidate_top__(gamespace_id, leaderboard.leaderboard_id)
+
+        return changed
@@ -0,0 +1,223 @@
+from anthill.common.database import Database, DatabaseConnection
+
+from collections import OrderedDict
+
+import bisect
+import functools
+import time
+
+
+class Histogram(object):
+    """
+    Latency histogram with fixed buckets, in milliseconds. Percentiles are estimated as an upper bound
+        of the bucket they fall into, so they're as precise as the buckets are.
+    """
+
+    BUCKETS = [0.25, 0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+    __slots__ = ("counts", "count", "total", "max")
+
+    def __init__(self):
+        # the last one counts everything above the biggest bucket
+        self.counts = [0] * (len(Histogram.BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, milliseconds):
+        self.counts[bisect.bisect_left(Histogram.BUCKETS, milliseconds)] += 1
+        self.count += 1
+        self.total += milliseconds
+        if milliseconds > self.max:
+            self.max = milliseconds
+
+    def percentile(self, percentile):
+        if not self.count:
+            return 0.0
+
+        threshold = self.count * percentile / 100.0
+        seen = 0
+
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= threshold:
+                return min(Histogram.BUCKETS[bucket], self.max) if bucket < len(Histogram.BUCKETS) else self.max
+
+        return self.max
+
+    def dump(self):
+        return {
+            "count": self.count,
+            "avg": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+            "max": self.max,
+            "buckets": {
+                str(bound): count
+                for bound, count in zip(Histogram.BUCKETS + ["inf"], self.counts)
+                if count
+            }
+        }
+
+
+class BoardActivity(object):
+    """
+    Reads and writes per leaderboard, as a rate per second over a sliding window of `window` seconds.
+    Only the `max_boards` most recently active leaderboards are tracked.
+    """
+
+    def __init__(self, window=60, max_boards=1000):
+        self.window = window
+        self.max_boards = max_boards
+        # (gamespace_id, leaderboard_id) -> [leaderboard_name, reads, writes, previous reads, previous writes]
+        self.boards = OrderedDict()
+        self.started_at = time.time()
+
+    def __rotate__(self):
+        now = time.time()
+        elapsed = now - self.started_at
+
+        if elapsed < self.window:
+            return
+
+        # if more than one window has passed, the previous one had nothing
+        recent = elapsed < self.window * 2
+
+        for board in self.boards.values():
+            board[3], board[4] = (board[1], board[2]) if recent else (0, 0)
+            board[1], board[2] = 0, 0
+
+        self.started_at = now if not recent else self.started_at + self.window
+
+    def __board__(self, gamespace_id, leaderboard_id, leaderboard_name):
+        self.__rotate__()
+
+        key = (int(gamespace_id), int(leaderboard_id))
+        board = self.boards.get(key)
+
+        if board is None:
+            board = [leaderboard_name, 0, 0, 0, 0]
+            self.boards[key] = board
+            while len(self.boards) > self.max_boards:
+                self.boards.popitem(last=False)
+        else:
+            self.boards.move_to_end(key)
+
+        return board
+
+    def read(self, gamespace_id, leaderboard_id, leaderboard_name):
+        self.__board__(gamespace_id, leaderboard_id, leaderboard_name)[1] += 1
+
+    def write(self, gamespace_id, leaderboard_id, leaderboard_name, count=1):
+        self.__board__(gamespace_id, leaderboard_id, leaderboard_name)[2] += count
+
+    def hottest(self, gamespace_id=None, limit=20):
+        """
+        :returns: a list of (gamespace_id, leaderboard_id, leaderboard_name, reads per second, writes per second),
+            the most active first
+        """
+        self.__rotate__()
+
+        # the previous window is weighted by how much of it the sliding window still covers
+        weight = 1.0 - min((time.time() - self.started_at) / self.window, 1.0)
+        result = []
+
+        for (board_gamespace_id, leaderboard_id), board in self.boards.items():
+            if gamespace_id is not None and board_gamespace_id != int(gamespace_id):
+                continue
+            name, reads, writes, previous_reads, previous_writes = board
+            result.append((
+                board_gamespace_id, leaderboard_id, name,
+                (reads + previous_reads * weight) / self.window,
+                (writes + previous_writes * weight) / self.window))
+
+        result.sort(key=lambda item: item[3] + item[4], reverse=True)
+        return result[:limit]
+
+
+class Metrics(object):
+    """
+    In-process metrics of the hot path: latency histograms per operation, connection pool wait,
+        rows returned by the database, and the board activity.
+    Please note every process of the service has its own.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.rows = 0
+        self.queries = 0
+        self.activity = BoardActivity()
+
+    def observe(self, name, seconds):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = Histogram()
+            self.histograms[name] = histogram
+        histogram.observe(seconds * 1000.0)
+
+    def rows_returned(self, rows):
+        self.queries += 1
+        self.rows += rows
+
+    def dump(self):
+        return {
+            "latency": {
+                name: histogram.dump()
+                for name, histogram in self.histograms.items()
+            },
+            "queries": self.queries,
+            "rows_returned": self.rows
+        }
+
+
+def timed(name):
+    """
+    Observes the latency of a coroutine method of an object with `metrics`, under the name given
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        async def wrapper(self, *args, **kwargs):
+            started = time.monotonic()
+            try:
+                return await method(self, *args, **kwargs)
+            finally:
+                self.metrics.observe(name, time.monotonic() - started)
+        return wrapper
+    return decorator
+
+
+class MeasuredConnection(DatabaseConnection):
+    def __init__(self, pool, auto_commit, metrics):
+        super(MeasuredConnection, self).__init__(pool, auto_commit)
+        self.metrics = metrics
+
+    async def __aenter__(self):
+        started = time.monotonic()
+        result = await super(MeasuredConnection, self).__aenter__()
+        self.metrics.observe("db_pool_wait", time.monotonic() - started)
+        return result
+
+    async def get(self, query, *args, **kwargs):
+        result = await super(MeasuredConnection, self).get(query, *args, **kwargs)
+        self.metrics.rows_returned(0 if result is None else 1)
+        return result
+
+    async def query(self, query, *args, **kwargs):
+        result = await super(MeasuredConnection, self).query(query, *args, **kwargs)
+        self.metrics.rows_returned(len(result))
+        return result
+
+
+class MeasuredDatabase(Database):
+    """
+    A Database that observes how long it takes to get a connection from the pool,
+        and how many rows the queries return
+    """
+
+    def __init__(self, metrics, *args, **kwargs):
+        super(MeasuredDatabase, self).__init__(*args, **kwargs)
+        self.metrics = metrics
+
+    def acquire(self, auto_commit=True):
+        return MeasuredConnection(self.pool, auto_commit, self.metrics)
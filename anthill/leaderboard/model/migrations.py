@@ -0,0 +1,403 @@
+from anthill.common.database import DatabaseError
+
+import logging
+
+
+class MigrationError(Exception):
+    def __init__(self, message):
+        self.message = message
+
+    def __str__(self):
+        return self.message
+
+
+class Migration(object):
+    """
+    A single versioned schema change. Each step is a coroutine function accepting a database connection.
+
+    Fresh installations get their tables created with the latest schema already (see /sql), and still
+        go through every migration, so the steps have to check if there's anything left to do.
+    """
+
+    def __init__(self, version, description, *steps):
+        self.version = version
+        self.description = description
+        self.steps = steps
+
+
+async def has_index(db, table, index):
+    existing = await db.get(
+        """
+            SELECT COUNT(*) AS `count`
+            FROM `information_schema`.`STATISTICS`
+            WHERE `TABLE_SCHEMA`=DATABASE() AND `TABLE_NAME`=%s AND `INDEX_NAME`=%s;
+        """, table, index)
+    return existing["count"] > 0
+
+
+async def has_column(db, table, column):
+    existing = await db.get(
+        """
+            SELECT COUNT(*) AS `count`
+            FROM `information_schema`.`COLUMNS`
+            WHERE `TABLE_SCHEMA`=DATABASE() AND `TABLE_NAME`=%s AND `COLUMN_NAME`=%s;
+        """, table, column)
+    return existing["count"] > 0
+
+
+def add_index(table, index, definition):
+    """
+    Adds an index online: the table remains readable and writable while the index is being built
+    """
+    async def step(db):
+        if await has_index(db, table, index):
+            return
+        await db.execute(
+            """
+                ALTER TABLE `{0}` ADD {1}, ALGORITHM=INPLACE, LOCK=NONE;
+            """.format(table, definition))
+    return step
+
+
+def drop_index(table, index):
+    async def step(db):
+        if not await has_index(db, table, index):
+            return
+        await db.execute(
+            """
+                ALTER TABLE `{0}` DROP INDEX `{1}`, ALGORITHM=INPLACE, LOCK=NONE;
+            """.format(table, index))
+    return step
+
+
+def add_column(table, column, definition):
+    async def step(db):
+        if await has_column(db, table, column):
+            return
+        await db.execute(
+            """
+                ALTER TABLE `{0}` ADD COLUMN `{1}` {2}, ALGORITHM=INPLACE, LOCK=NONE;
+            """.format(table, column, definition))
+    return step
+
+
+def execute(sql):
+    async def step(db):
+        await db.execute(sql)
+    return step
+
+
+async def merge_duplicate_leaderboards(db):
+    """
+    Before leaderboard names were unique, concurrent first posts could have created the same leaderboard twice.
+    Records and clusters of such duplicates are moved into the oldest one.
+    """
+
+    if await has_index(db, "leaderboards", "gamespace_leaderboard"):
+        return
+
+    duplicates = await db.query(
+        """
+            SELECT MIN(`leaderboard_id`) AS `keep`, GROUP_CONCAT(`leaderboard_id`) AS `all`
+            FROM `leaderboards`
+            GROUP BY `gamespace_id`, `leaderboard_name`, `leaderboard_sort_order`
+            HAVING COUNT(*) > 1;
+        """)
+
+    for duplicate in duplicates:
+        keep = duplicate["keep"]
+        remove = [int(leaderboard_id) for leaderboard_id in duplicate["all"].split(",")
+                  if int(leaderboard_id) != keep]
+
+        await db.execute(
+            """
+                UPDATE `records`
+                SET `leaderboard_id`=%s
+                WHERE `leaderboard_id` IN %s;
+            """, keep, remove)
+        await db.execute(
+            """
+                UPDATE `leaderboard_cluster_accounts`
+                SET `cluster_data`=%s
+                WHERE `cluster_data` IN %s;
+            """, keep, remove)
+        await db.execute(
+            """
+                UPDATE `leaderboard_clusters`
+                SET `cluster_data`=%s
+                WHERE `cluster_data` IN %s;
+            """, keep, remove)
+        await db.execute(
+            """
+                DELETE FROM `leaderboards`
+                WHERE `leaderboard_id` IN %s;
+            """, remove)
+
+        logging.warning("Merged duplicate leaderboards {0} into {1}".format(remove, keep))
+
+
+async def remove_duplicate_records(db):
+    """
+    Before the record upsert, concurrent posts of the same account could have created two records.
+    Only the most recent one is kept.
+    """
+
+    if await has_index(db, "records", "account_record"):
+        return
+
+    removed = await db.execute(
+        """
+            DELETE `a`
+            FROM `records` AS `a`
+            INNER JOIN `records` AS `b`
+                ON `a`.`gamespace_id`=`b`.`gamespace_id` AND `a`.`leaderboard_id`=`b`.`leaderboard_id`
+                AND `a`.`account_id`=`b`.`account_id` AND IFNULL(`a`.`cluster_id`, 0)=IFNULL(`b`.`cluster_id`, 0)
+                AND `a`.`record_id` < `b`.`record_id`;
+        """)
+
+    if removed:
+        logging.warning("Removed {0} duplicate records".format(removed))
+
+
+async def cluster_id_not_null(db):
+    column = await db.get(
+        """
+            SELECT `IS_NULLABLE`
+            FROM `information_schema`.`COLUMNS`
+            WHERE `TABLE_SCHEMA`=DATABASE() AND `TABLE_NAME`='records' AND `COLUMN_NAME`='cluster_id';
+        """)
+
+    if column is None or column["IS_NULLABLE"] != "YES":
+        return
+
+    await db.execute(
+        """
+            UPDATE `records`
+            SET `cluster_id`=0
+            WHERE `cluster_id` IS NULL;
+        """)
+    await db.execute(
+        """
+            ALTER TABLE `records`
+            MODIFY `cluster_id` int(11) unsigned NOT NULL DEFAULT '0', ALGORITHM=INPLACE, LOCK=NONE;
+        """)
+
+
+async def partition_periods_by_expiry(db):
+    """
+    `period_records` used to be partitioned by `leaderboard_id`, so a partition kept every period in it
+        until the longest one had expired. It's rebuilt partitioned by `period_expire_day` instead,
+        the records are copied over once, and the partitions are added upon start, see PeriodRotation.
+    """
+
+    if await has_column(db, "period_records", "period_expire_day"):
+        return
+
+    await db.execute("DROP TABLE IF EXISTS `period_records_new`;")
+    await db.execute(
+        """
+            CREATE TABLE `period_records_new` (
+              `record_id` int(11) unsigned NOT NULL AUTO_INCREMENT,
+              `account_id` int(11) unsigned NOT NULL,
+              `cluster_id` int(11) unsigned NOT NULL DEFAULT '0',
+              `gamespace_id` int(11) unsigned NOT NULL,
+              `leaderboard_id` int(11) unsigned NOT NULL,
+              `period_expire_day` int(11) unsigned NOT NULL,
+              `expire_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+              `score` float DEFAULT NULL,
+              `display_name` varchar(45) NOT NULL,
+              `profile` json NOT NULL,
+              PRIMARY KEY (`record_id`,`period_expire_day`),
+              UNIQUE KEY `account_record`
+                (`gamespace_id`,`leaderboard_id`,`account_id`,`cluster_id`,`period_expire_day`),
+              KEY `leaderboard_rank` (`gamespace_id`,`leaderboard_id`,`cluster_id`,`score`,`account_id`),
+              KEY `account_id` (`account_id`)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8
+            PARTITION BY RANGE (`period_expire_day`) (PARTITION `pmax` VALUES LESS THAN MAXVALUE);
+        """)
+
+    copied = await db.execute(
+        """
+            INSERT INTO `period_records_new`
+            (`account_id`, `cluster_id`, `gamespace_id`, `leaderboard_id`, `period_expire_day`,
+            `expire_at`, `score`, `display_name`, `profile`)
+            SELECT `r`.`account_id`, `r`.`cluster_id`, `r`.`gamespace_id`, `r`.`leaderboard_id`,
+                UNIX_TIMESTAMP(`l`.`leaderboard_expire_at`) DIV 86400,
+                `r`.`expire_at`, `r`.`score`, `r`.`display_name`, `r`.`profile`
+            FROM `period_records` AS `r`
+            INNER JOIN `leaderboards` AS `l` ON `l`.`leaderboard_id`=`r`.`leaderboard_id`
+            WHERE `l`.`leaderboard_expire_at` IS NOT NULL;
+        """)
+
+    await db.execute(
+        """
+            RENAME TABLE `period_records` TO `period_records_old`, `period_records_new` TO `period_records`;
+        """)
+    await db.execute("DROP TABLE `period_records_old`;")
+
+    logging.warning("Moved {0} records of periods into partitions by expiry".format(copied))
+
+
+MIGRATIONS = [
+    Migration(
+        1, "Unique leaderboard names",
+        merge_duplicate_leaderboards,
+        add_index("leaderboards", "gamespace_leaderboard",
+                  "UNIQUE KEY `gamespace_leaderboard` (`gamespace_id`,`leaderboard_name`,`leaderboard_sort_order`)")),
+    Migration(
+        2, "Unique records of an account",
+        cluster_id_not_null,
+        remove_duplicate_records,
+        add_index("records", "account_record",
+                  "UNIQUE KEY `account_record` (`gamespace_id`,`leaderboard_id`,`account_id`,`cluster_id`)")),
+    Migration(
+        3, "Leaderboard score update policy",
+        add_column("leaderboards", "leaderboard_policy",
+                   "enum('latest','best','increment') NOT NULL DEFAULT 'latest'")),
+    Migration(
+        4, "Covering index for ranked reads",
+        add_index("records", "leaderboard_rank",
+                  "KEY `leaderboard_rank` (`gamespace_id`,`leaderboard_id`,`cluster_id`,`score`,`account_id`)"),
+        drop_index("records", "score"),
+        drop_index("records", "cluster_id")),
+    Migration(
+        5, "Records are expired by the service",
+        execute("DROP EVENT IF EXISTS `records_expiration`;"),
+        add_index("records", "expire_at", "KEY `expire_at` (`expire_at`)")),
+    Migration(
+        6, "Records of an account are found by index",
+        add_index("records", "account_id", "KEY `account_id` (`account_id`)")),
+    Migration(
+        7, "Periodic leaderboards",
+        execute(
+            """
+                ALTER TABLE `leaderboards`
+                MODIFY `leaderboard_name` varchar(64) NOT NULL, ALGORITHM=INPLACE, LOCK=NONE;
+            """),
+        add_column("leaderboards", "leaderboard_period",
+                   "enum('none','daily','weekly','monthly') NOT NULL DEFAULT 'none'"),
+        add_column("leaderboards", "leaderboard_period_reset", "int(11) unsigned NOT NULL DEFAULT '0'"),
+        add_column("leaderboards", "leaderboard_parent_id", "int(11) unsigned DEFAULT NULL"),
+        add_column("leaderboards", "leaderboard_expire_at", "timestamp NULL DEFAULT NULL"),
+        add_index("leaderboards", "leaderboard_parent_id", "KEY `leaderboard_parent_id` (`leaderboard_parent_id`)")),
+    Migration(
+        8, "Records are split over shards",
+        add_column("leaderboards", "leaderboard_shard", "varchar(32) DEFAULT NULL"),
+        add_column("leaderboards", "leaderboard_shard_mirror", "varchar(32) DEFAULT NULL")),
+    Migration(
+        9, "Records of the periods are expired by the service",
+        add_index("period_records", "expire_at", "KEY `expire_at` (`expire_at`)")),
+    Migration(
+        10, "Records of the periods are partitioned by expiry",
+        partition_periods_by_expiry,
+        # they expire along with their periods
+        drop_index("period_records", "expire_at")),
+]
+
+
+class SchemaMigrations(object):
+    """
+    Brings the schema of an existing deployment up to date, applying the migrations
+        that has not been applied yet, in order. Applied versions are stored in `leaderboard_schema` table.
+
+    Several instances of the service may start at the same time, so the migrations are done under a lock.
+    """
+
+    LOCK_NAME = "leaderboard_schema_migrations"
+    LOCK_TIMEOUT = 600
+
+    def __init__(self, db, migrations=None):
+        self.db = db
+        self.migrations = migrations or MIGRATIONS
+
+    async def migrate(self):
+        async with self.db.acquire() as db:
+            locked = await db.get(
+                """
+                    SELECT GET_LOCK(%s, %s) AS `locked`;
+                """, SchemaMigrations.LOCK_NAME, SchemaMigrations.LOCK_TIMEOUT)
+
+            if not locked or not locked["locked"]:
+                raise MigrationError("Failed to acquire migrations lock")
+
+            try:
+                current = await db.get(
+                    """
+                        SELECT MAX(`version`) AS `version`
+                        FROM `leaderboard_schema`;
+                    """)
+
+                current = (current or {}).get("version") or 0
+
+                for migration in self.migrations:
+                    if migration.version <= current:
+                        continue
+
+                    logging.warning("Applying schema migration {0}: {1}".format(
+                        migration.version, migration.description))
+
+                    try:
+                        for step in migration.steps:
+                            await step(db)
+                    except DatabaseError as e:
+                        raise MigrationError("Failed to apply schema migration {0}: {1}".format(
+                            migration.version, e.args[1]))
+
+                    await db.execute(
+                        """
+                            INSERT INTO `leaderboard_schema`
+                            (`version`, `description`)
+                            VALUES (%s, %s);
+                        """, migration.version, migration.description)
+            finally:
+                await db.get(
+                    """
+                        SELECT RELEASE_LOCK(%s);
+                    """, SchemaMigrations.LOCK_NAME)
+
+
+# queries of the read path that are expected to be served by an index in the order requested
+HOT_QUERIES = [
+    ("top", """
+        EXPLAIN SELECT `account_id`, `display_name`, `score`, `profile`
+        FROM `records`
+        WHERE `gamespace_id`=%s AND `leaderboard_id`=%s AND `cluster_id`=%s
+        ORDER BY `score` {0}, `account_id` {0}
+        LIMIT %s, %s;
+    """, (0, 0, 0, 0, 50)),
+    ("around_me_rank", """
+        EXPLAIN SELECT COUNT(*) AS `count`
+        FROM `records`
+        WHERE `gamespace_id`=%s AND `leaderboard_id`=%s AND `cluster_id`=%s AND
+            (`score` {1} %s OR (`score`=%s AND `account_id` {1} %s));
+    """, (0, 0, 0, 0, 0, 0)),
+    ("around_me_window", """
+        EXPLAIN SELECT `account_id`, `display_name`, `score`, `profile`
+        FROM `records`
+        WHERE `gamespace_id`=%s AND `leaderboard_id`=%s AND `cluster_id`=%s AND
+            (`score` {1} %s OR (`score`=%s AND `account_id` {1} %s))
+        ORDER BY `score` {0}, `account_id` {0}
+        LIMIT %s;
+    """, (0, 0, 0, 0, 0, 0, 25)),
+]
+
+
+async def explain_hot_queries(db):
+    """
+    Runs EXPLAIN for the hot queries against the current schema, for both sort orders.
+    :returns: a list of (query name, sort order) that would need a filesort, or would not use an index at all
+    """
+
+    problems = []
+
+    for name, query, args in HOT_QUERIES:
+        for order, better in (("DESC", ">"), ("ASC", "<")):
+            plan = await db.query(query.format(order, better), *args)
+
+            for step in plan:
+                extra = step.get("Extra") or ""
+                if "filesort" in extra or step.get("key") is None and step.get("type") == "ALL":
+                    problems.append((name, order.lower()))
+                    break
+
+    return problems
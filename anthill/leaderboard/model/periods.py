@@ -0,0 +1,344 @@
+from tornado.ioloop import PeriodicCallback, IOLoop
+
+import datetime
+import logging
+import time
+
+
+PERIOD_NONE = "none"
+PERIOD_DAILY = "daily"
+PERIOD_WEEKLY = "weekly"
+PERIOD_MONTHLY = "monthly"
+
+PERIODS = [PERIOD_DAILY, PERIOD_WEEKLY, PERIOD_MONTHLY]
+
+# a period may reset that much after its start of a day (a week, a month) at most, in seconds
+MAX_RESET = {
+    PERIOD_DAILY: 86400,
+    PERIOD_WEEKLY: 86400 * 7,
+    PERIOD_MONTHLY: 86400 * 28
+}
+
+# separates the name of a periodic leaderboard from the key of a period, like "daily#20261016"
+PERIOD_SEPARATOR = "#"
+
+
+class LeaderboardPeriod(object):
+    """
+    A single period of a periodic leaderboard. Each period is a leaderboard of its own, named after the
+        periodic one and the period, like "daily#20261016", created upon first use.
+
+    A period starts `reset` seconds after the start of a UTC day (a daily one), a week (a weekly one,
+        weeks start on Monday), or a month (a monthly one). For example, a daily leaderboard
+        with the reset of 14400 resets every day at 04:00 UTC.
+    """
+
+    __slots__ = ("key", "start", "end")
+
+    # the longest a name of a period is, compared to the name of its periodic leaderboard: the separator and the key
+    NAME_SUFFIX_LENGTH = len(PERIOD_SEPARATOR) + len("YYYYMMDD")
+
+    def __init__(self, key, start, end):
+        self.key = key
+        self.start = start
+        self.end = end
+
+    def name(self, leaderboard_name):
+        return leaderboard_name + PERIOD_SEPARATOR + self.key
+
+    @staticmethod
+    def __first_day__(period, day):
+        if period == PERIOD_DAILY:
+            return day
+        if period == PERIOD_WEEKLY:
+            return day - datetime.timedelta(days=day.weekday())
+        return day.replace(day=1)
+
+    @staticmethod
+    def __next_day__(period, first_day):
+        if period == PERIOD_DAILY:
+            return first_day + datetime.timedelta(days=1)
+        if period == PERIOD_WEEKLY:
+            return first_day + datetime.timedelta(days=7)
+        return (first_day + datetime.timedelta(days=32)).replace(day=1)
+
+    @staticmethod
+    def __of_day__(period, reset, first_day):
+        start = datetime.datetime(first_day.year, first_day.month, first_day.day) + \
+            datetime.timedelta(seconds=reset)
+        following = LeaderboardPeriod.__next_day__(period, first_day)
+        end = datetime.datetime(following.year, following.month, following.day) + \
+            datetime.timedelta(seconds=reset)
+
+        key = first_day.strftime("%Y%m" if period == PERIOD_MONTHLY else "%Y%m%d")
+
+        return LeaderboardPeriod(key, start, end)
+
+    @staticmethod
+    def get(period, reset, now=None, previous=False):
+        """
+        :param now: a unix timestamp to get the period of, current time if not passed
+        :param previous: return the period before the one of `now`
+        """
+
+        shifted = datetime.datetime.utcfromtimestamp(time.time() if now is None else now) - \
+            datetime.timedelta(seconds=reset)
+
+        first_day = LeaderboardPeriod.__first_day__(period, shifted.date())
+
+        if previous:
+            first_day = LeaderboardPeriod.__first_day__(period, first_day - datetime.timedelta(days=1))
+
+        return LeaderboardPeriod.__of_day__(period, reset, first_day)
+
+    def following(self, period, reset):
+        """
+        :returns: the period after this one
+        """
+        return LeaderboardPeriod.__of_day__(period, reset, (self.end - datetime.timedelta(seconds=reset)).date())
+
+
+class PeriodRotation(object):
+    """
+    Records of the periods live in the `period_records` table, partitioned by ranges of `period_expire_day`:
+        the UTC day (days since the epoch) the period of a record expires on (see `leaderboard_expire_at`,
+        a period expires once the period after it has ended, so the previous period remains readable).
+    So a partition holds the periods that expire within the same `partition_days` days, whatever long they are,
+        and the periods are expired by dropping the partitions, which is instant no matter how many records
+        there are. Records of a period live as long as the period does.
+
+    Partitions are added ahead: there's always one for any period that could be created, up to `AHEAD_DAYS`
+        days from now, so the partition that's split to add a new one (`pmax`, the days past the last partition)
+        is always empty. Splitting an empty partition is instant, while a split of a partition with records
+        would copy every one of them, blocking writes into `period_records` meanwhile.
+
+    Every `interval` seconds (and before a period is created, see seal, if it expires past the partitions):
+
+        1. Partitions are added, so they go `AHEAD_DAYS` days ahead of today.
+        2. (Periodically only) Every partition whose days are all over is dropped, and the periods expired
+           are passed to `on_dropped`.
+
+    Only one instance of the service rotates periods at a time.
+    """
+
+    LOCK_NAME = "leaderboard_period_rotation"
+    # seconds a period creation waits for another instance adding a partition
+    LOCK_TIMEOUT = 10
+    TABLE = "period_records"
+    OPEN_PARTITION = "pmax"
+
+    # a period lasts a month at most, and expires once the month after it is over, reset included
+    AHEAD_DAYS = 31 * 2 + MAX_RESET[PERIOD_MONTHLY] // 86400 + 1
+
+    def __init__(self, db, on_dropped, interval, partition_days):
+        """
+        :param on_dropped: a coroutine function accepting a list of (gamespace_id, leaderboard_id)
+            of the periods dropped
+        :param partition_days: days of expiry a partition goes for
+        """
+        self.db = db
+        self.on_dropped = on_dropped
+        self.interval = interval
+        self.partition_days = max(int(partition_days), 1)
+
+        self.periodic = None
+        self.running = False
+
+        # the day the last partition ends at (exclusive), as last seen by this instance,
+        #   other instances may have added more since
+        self.bound = None
+
+        self.sealed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.last_run = None
+
+    @staticmethod
+    def expire_day(expire_at):
+        """
+        :param expire_at: a unix timestamp
+        :returns: the day (since the epoch) of it
+        """
+        return int(expire_at) // 86400
+
+    @staticmethod
+    def partition_of(leaderboard):
+        """
+        :returns: the `period_expire_day` of the records of a period
+        """
+        if leaderboard.expire_at is None:
+            raise ValueError("Period '{0}' never expires".format(leaderboard.name))
+        return PeriodRotation.expire_day(leaderboard.expire_at)
+
+    @staticmethod
+    def __today__():
+        return PeriodRotation.expire_day(time.time())
+
+    def start(self):
+        self.periodic = PeriodicCallback(
+            lambda: IOLoop.current().spawn_callback(self.run), self.interval * 1000)
+        self.periodic.start()
+
+    def stop(self):
+        if self.periodic is not None:
+            self.periodic.stop()
+            self.periodic = None
+
+    def stats(self):
+        return {
+            "sealed": self.sealed,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "bound": self.bound,
+            "last_run": self.last_run
+        }
+
+    async def run(self):
+        if self.running:
+            return
+
+        self.running = True
+
+        # noinspection PyBroadException
+        try:
+            async with self.db.acquire() as db:
+                locked = await db.get(
+                    """
+                        SELECT GET_LOCK(%s, 0) AS `locked`;
+                    """, PeriodRotation.LOCK_NAME)
+
+                if not locked or not locked["locked"]:
+                    return
+
+                try:
+                    await self.__seal__(db, PeriodRotation.__today__() + PeriodRotation.AHEAD_DAYS)
+                    await self.__drop__(db)
+                finally:
+                    await db.get(
+                        """
+                            SELECT RELEASE_LOCK(%s);
+                        """, PeriodRotation.LOCK_NAME)
+
+            self.last_run = int(time.time())
+        except Exception:
+            logging.exception("Failed to rotate periods")
+            self.failed += 1
+        finally:
+            self.running = False
+
+    async def seal(self, day=None):
+        """
+        Makes sure there's a partition for the records of the periods that expire on a day
+            (or on any day up to AHEAD_DAYS from today, if not passed), adding them if needed.
+        Called before a period is created, and upon start. Costs nothing, unless a partition is to be added.
+        :raises DatabaseError: if failed
+        """
+
+        if day is None:
+            day = PeriodRotation.__today__() + PeriodRotation.AHEAD_DAYS
+        elif self.bound is not None and day < self.bound:
+            return
+
+        async with self.db.acquire() as db:
+            locked = await db.get(
+                """
+                    SELECT GET_LOCK(%s, %s) AS `locked`;
+                """, PeriodRotation.LOCK_NAME, PeriodRotation.LOCK_TIMEOUT)
+
+            if not locked or not locked["locked"]:
+                # the instance holding the lock does the same
+                logging.warning("Failed to acquire the lock to add a partition of periods")
+                return
+
+            try:
+                await self.__seal__(db, max(day, PeriodRotation.__today__() + PeriodRotation.AHEAD_DAYS))
+            finally:
+                await db.get(
+                    """
+                        SELECT RELEASE_LOCK(%s);
+                    """, PeriodRotation.LOCK_NAME)
+
+    @staticmethod
+    async def __partitions__(db):
+        """
+        :returns: a list of (partition name, the day it goes up to, exclusive) of the sealed partitions
+        """
+        partitions = await db.query(
+            """
+                SELECT `PARTITION_NAME` AS `name`, `PARTITION_DESCRIPTION` AS `bound`
+                FROM `information_schema`.`PARTITIONS`
+                WHERE `TABLE_SCHEMA`=DATABASE() AND `TABLE_NAME`=%s
+                ORDER BY `PARTITION_ORDINAL_POSITION`;
+            """, PeriodRotation.TABLE)
+
+        return [
+            (partition["name"], int(partition["bound"]))
+            for partition in partitions
+            if partition["name"] != PeriodRotation.OPEN_PARTITION
+        ]
+
+    async def __seal__(self, db, day):
+        """
+        Adds the partitions up to the one of the day given, in a single split of `pmax`
+        """
+
+        partitions = await PeriodRotation.__partitions__(db)
+        bound = partitions[-1][1] if partitions else None
+
+        if bound is not None and day < bound:
+            self.bound = bound
+            return
+
+        if bound is None:
+            # the very first one takes every day before it, too
+            bound = PeriodRotation.__today__() // self.partition_days * self.partition_days
+
+        bounds = []
+        while bound <= day:
+            bound += self.partition_days
+            bounds.append(bound)
+
+        await db.execute(
+            """
+                ALTER TABLE `{0}` REORGANIZE PARTITION `{1}` INTO (
+                    {2},
+                    PARTITION `{1}` VALUES LESS THAN MAXVALUE
+                );
+            """.format(PeriodRotation.TABLE, PeriodRotation.OPEN_PARTITION, ",\n".join(
+                "PARTITION `p{0}` VALUES LESS THAN ({0})".format(partition_bound)
+                for partition_bound in bounds)))
+
+        self.bound = bound
+        self.sealed += len(bounds)
+
+    async def __drop__(self, db):
+        today = PeriodRotation.__today__()
+
+        for name, bound in await PeriodRotation.__partitions__(db):
+            if bound > today:
+                # periods in it (or the ones after) have not expired yet
+                break
+
+            await db.execute(
+                """
+                    ALTER TABLE `{0}` DROP PARTITION `{1}`;
+                """.format(PeriodRotation.TABLE, name))
+
+            self.dropped += 1
+
+            # the periods of the partition, along with the ones of any partition dropped before that have been left
+            periods = await db.query(
+                """
+                    SELECT `gamespace_id`, `leaderboard_id`
+                    FROM `leaderboards`
+                    WHERE `leaderboard_parent_id` IS NOT NULL AND `leaderboard_expire_at` < FROM_UNIXTIME(%s);
+                """, bound * 86400)
+
+            logging.info("Dropped partition {0} of {1} periods".format(name, len(periods)))
+
+            if periods:
+                # noinspection PyBroadException
+                try:
+                    await self.on_dropped([(period["gamespace_id"], period["leaderboard_id"]) for period in periods])
+                except Exception:
+                    logging.exception("Failed to process dropped periods")
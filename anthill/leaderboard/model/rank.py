@@ -0,0 +1,416 @@
+from collections import OrderedDict
+
+import asyncio
+import heapq
+import random
+import time
+
+
+class _SkipNode(object):
+    __slots__ = ("key", "value", "next", "width")
+
+    def __init__(self, key, value, level):
+        self.key = key
+        self.value = value
+        self.next = [None] * level
+        # width[i] is a number of positions between this node and next[i]
+        self.width = [1] * level
+
+
+class OrderStatisticSkipList(object):
+    """
+    Indexable skip list: keeps unique keys in order, and allows to find an n-th element,
+        and a position of a key in O(log n).
+    """
+
+    MAX_LEVEL = 24
+    PROBABILITY = 0.25
+
+    def __init__(self):
+        self.size = 0
+        self.level = 1
+        self.head = _SkipNode(None, None, OrderStatisticSkipList.MAX_LEVEL)
+
+    def __len__(self):
+        return self.size
+
+    @staticmethod
+    def __random_level__():
+        level = 1
+        while random.random() < OrderStatisticSkipList.PROBABILITY and level < OrderStatisticSkipList.MAX_LEVEL:
+            level += 1
+        return level
+
+    def insert(self, key, value):
+        update = [None] * OrderStatisticSkipList.MAX_LEVEL
+        positions = [0] * OrderStatisticSkipList.MAX_LEVEL
+
+        node = self.head
+        position = 0
+
+        for i in reversed(range(self.level)):
+            while node.next[i] is not None and node.next[i].key < key:
+                position += node.width[i]
+                node = node.next[i]
+            update[i] = node
+            positions[i] = position
+
+        level = OrderStatisticSkipList.__random_level__()
+
+        if level > self.level:
+            for i in range(self.level, level):
+                update[i] = self.head
+                positions[i] = 0
+                self.head.width[i] = self.size + 1
+            self.level = level
+
+        new_node = _SkipNode(key, value, level)
+        new_position = position + 1
+
+        for i in range(level):
+            previous = update[i]
+            new_node.next[i] = previous.next[i]
+            previous.next[i] = new_node
+            new_node.width[i] = previous.width[i] - (new_position - positions[i]) + 1
+            previous.width[i] = new_position - positions[i]
+
+        for i in range(level, self.level):
+            update[i].width[i] += 1
+
+        self.size += 1
+
+    def remove(self, key):
+        update = [None] * self.level
+        node = self.head
+
+        for i in reversed(range(self.level)):
+            while node.next[i] is not None and node.next[i].key < key:
+                node = node.next[i]
+            update[i] = node
+
+        target = node.next[0]
+
+        if target is None or target.key != key:
+            return None
+
+        for i in range(self.level):
+            if update[i].next[i] is target:
+                update[i].width[i] += target.width[i] - 1
+                update[i].next[i] = target.next[i]
+            else:
+                update[i].width[i] -= 1
+
+        while self.level > 1 and self.head.next[self.level - 1] is None:
+            self.level -= 1
+
+        self.size -= 1
+        return target.value
+
+    def position(self, key):
+        """
+        :returns: amount of keys strictly less than the key given
+        """
+        node = self.head
+        position = 0
+
+        for i in reversed(range(self.level)):
+            while node.next[i] is not None and node.next[i].key < key:
+                position += node.width[i]
+                node = node.next[i]
+
+        return position
+
+    def iterate(self, index):
+        """
+        Yields (index, key, value) starting from 0-based index given.
+        """
+        if index < 0 or index >= self.size:
+            return
+
+        target = index + 1
+        node = self.head
+        position = 0
+
+        for i in reversed(range(self.level)):
+            while node.next[i] is not None and position + node.width[i] <= target:
+                position += node.width[i]
+                node = node.next[i]
+
+        while node is not None:
+            yield index, node.key, node.value
+            index += 1
+            node = node.next[0]
+
+
+class RankIndex(object):
+    """
+    In-memory ranking of the records for a single (gamespace, leaderboard, cluster).
+
+    Records are ordered by (score, account_id), both descending for 'desc' leaderboards, exactly like
+        the SQL queries do, so ranks are the same no matter what path has served them.
+    Each record is a dict like the one that comes out of the `records` table, with `expire_at` being
+        a unix timestamp. Expired records are dropped lazily upon any access.
+    """
+
+    def __init__(self, sort_order):
+        self.descending = sort_order == "desc"
+        self.entries = OrderStatisticSkipList()
+        self.accounts = {}
+        self.expirations = []
+
+    def __len__(self):
+        self.expire()
+        return len(self.entries)
+
+    def key(self, score, account_id):
+        if self.descending:
+            return -score, -account_id
+        return score, account_id
+
+    def expire(self, now=None):
+        now = now or time.time()
+        expirations = self.expirations
+
+        while expirations and expirations[0][0] <= now:
+            expire_at, account_id = heapq.heappop(expirations)
+            existing = self.accounts.get(account_id)
+            # the record may have been updated with a new expiration since
+            if existing is not None and existing[1].get("expire_at") == expire_at:
+                self.remove(account_id)
+
+    def update(self, record):
+        account_id = int(record["account_id"])
+        score = float(record["score"] or 0)
+
+        self.remove(account_id)
+
+        key = self.key(score, account_id)
+        self.entries.insert(key, record)
+        self.accounts[account_id] = (key, record)
+
+        expire_at = record.get("expire_at")
+        if expire_at is not None:
+            heapq.heappush(self.expirations, (expire_at, account_id))
+
+    def remove(self, account_id):
+        existing = self.accounts.pop(int(account_id), None)
+        if existing is None:
+            return None
+        key, record = existing
+        self.entries.remove(key)
+        return record
+
+    def get(self, account_id):
+        """
+        :returns: a tuple (rank, record) of an account, or None if there's no such
+        """
+        self.expire()
+        existing = self.accounts.get(int(account_id))
+        if existing is None:
+            return None
+        key, record = existing
+        return self.entries.position(key) + 1, record
+
+    def slice(self, offset, limit):
+        """
+        :returns: a list of (rank, record) tuples, ranks are absolute
+        """
+        self.expire()
+        result = []
+        if limit <= 0:
+            return result
+        for index, key, record in self.entries.iterate(offset):
+            result.append((index + 1, record))
+            if len(result) >= limit:
+                break
+        return result
+
+    def after(self, score, account_id, limit):
+        """
+        :returns: a list of (rank, record) going strictly after a position (score, account_id)
+        """
+        self.expire()
+        key = self.key(float(score), int(account_id))
+        position = self.entries.position(key)
+        # the record at the position itself has been seen already
+        existing = self.accounts.get(int(account_id))
+        if existing is not None and existing[0] == key:
+            position += 1
+        return self.slice(position, limit)
+
+    def around(self, account_id, offset, limit):
+        """
+        :returns: a list of (rank, record) with the account given being in the middle,
+            or None if there's no such account
+        """
+        self.expire()
+        existing = self.accounts.get(int(account_id))
+        if existing is None:
+            return None
+        position = self.entries.position(existing[0])
+        start = max(position - limit // 2, 0)
+        return self.slice(start + offset, limit - offset)
+
+    def ranked(self, account_ids):
+        """
+        :returns: a list of (rank, record) for accounts given, ordered by rank
+        """
+        self.expire()
+        result = []
+        for account_id in set(account_ids):
+            existing = self.accounts.get(int(account_id))
+            if existing is not None:
+                result.append((self.entries.position(existing[0]) + 1, existing[1]))
+        result.sort(key=lambda entry: entry[0])
+        return result
+
+    def load(self, records, skip):
+        for record in records:
+            if int(record["account_id"]) in skip:
+                continue
+            self.update(record)
+
+
+class _RankIndexEntry(object):
+    def __init__(self, index):
+        self.index = index
+        self.loaded_at = time.time()
+        self.loading = None
+        # accounts that have been touched while the index was loading, the loaded data is older for them
+        self.touched = set()
+
+
+class RankIndexes(object):
+    """
+    A bounded set of rank indexes, each keyed by (gamespace_id, leaderboard_id, cluster_id).
+
+    An index is loaded lazily upon first read and then is kept in sync by the writes going through this process.
+    As other processes could write into the same leaderboard, an index is reloaded every `ttl` seconds.
+    Leaderboards bigger than `max_records` are not indexed at all, and are not checked again
+        for `too_big_ttl` seconds (`ttl` if not set).
+    """
+
+    def __init__(self, max_boards, max_records, ttl, too_big_ttl=None):
+        self.max_boards = max_boards
+        self.max_records = max_records
+        self.ttl = ttl
+        self.too_big_ttl = ttl if too_big_ttl is None else too_big_ttl
+        self.entries = OrderedDict()
+
+    def __fresh__(self, entry):
+        ttl = self.ttl if entry.index is not None else self.too_big_ttl
+        return entry.loaded_at + ttl > time.time()
+
+    async def get(self, key, sort_order, loader):
+        """
+        :param loader: a coroutine function, accepting maximum amount of records to load,
+            that returns a list of records, or None if there's too many of them
+        :returns: a RankIndex, or None if the leaderboard is too big to be indexed
+        """
+        key = RankIndexes.__key__(key)
+        entry = self.entries.get(key)
+
+        if entry is not None and self.__fresh__(entry):
+            self.entries.move_to_end(key)
+            if entry.loading is not None:
+                loading = entry.loading
+                try:
+                    await asyncio.shield(loading)
+                except asyncio.CancelledError:
+                    if not loading.cancelled():
+                        raise
+                    # the load was cancelled rather than failed, so it's made again
+                    return await self.get(key, sort_order, loader)
+            return entry.index
+
+        entry = _RankIndexEntry(RankIndex(sort_order))
+        entry.loading = asyncio.get_event_loop().create_future()
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_boards:
+            self.entries.popitem(last=False)
+
+        loading = entry.loading
+
+        try:
+            records = await loader(self.max_records)
+        except BaseException as e:
+            # the waiters have to be let go no matter what, cancellation included
+            if self.entries.get(key) is entry:
+                del self.entries[key]
+            entry.loading = None
+            if isinstance(e, asyncio.CancelledError):
+                loading.cancel()
+            else:
+                loading.set_exception(e)
+                # nobody may wait for it
+                loading.exception()
+            raise
+
+        if records is None:
+            entry.index = None
+        else:
+            entry.index.load(records, entry.touched)
+
+        entry.touched = None
+        entry.loading = None
+        entry.loaded_at = time.time()
+        loading.set_result(entry.index)
+
+        return entry.index
+
+    @staticmethod
+    def __key__(key):
+        # gamespaces and accounts may come as strings from the tokens
+        return tuple(int(part) for part in key)
+
+    def __touch__(self, entry, account_id):
+        if entry.touched is not None:
+            entry.touched.add(int(account_id))
+
+    def loaded(self, key):
+        entry = self.entries.get(RankIndexes.__key__(key))
+        return entry is not None and entry.index is not None
+
+    def update(self, key, record):
+        entry = self.entries.get(RankIndexes.__key__(key))
+        if entry is None or entry.index is None:
+            return
+        self.__touch__(entry, record["account_id"])
+        entry.index.update(record)
+
+    def remove(self, key, account_id):
+        entry = self.entries.get(RankIndexes.__key__(key))
+        if entry is None or entry.index is None:
+            return
+        self.__touch__(entry, account_id)
+        entry.index.remove(account_id)
+
+    def expire(self, key):
+        entry = self.entries.get(RankIndexes.__key__(key))
+        if entry is None or entry.index is None:
+            return
+        entry.index.expire()
+
+    def remove_account(self, gamespace_id, leaderboard_id, account_id):
+        gamespace_id, leaderboard_id = int(gamespace_id), int(leaderboard_id)
+        for (index_gamespace_id, index_leaderboard_id, cluster_id), entry in list(self.entries.items()):
+            if index_gamespace_id == gamespace_id and index_leaderboard_id == leaderboard_id:
+                self.remove((index_gamespace_id, index_leaderboard_id, cluster_id), account_id)
+
+    def remove_accounts(self, gamespace_id, account_ids):
+        """
+        Removes accounts from every index in a gamespace (or any gamespace if gamespace_id is None)
+        """
+        for key, entry in list(self.entries.items()):
+            if gamespace_id is not None and key[0] != int(gamespace_id):
+                continue
+            for account_id in account_ids:
+                self.remove(key, account_id)
+
+    def drop(self, gamespace_id, leaderboard_id):
+        gamespace_id, leaderboard_id = int(gamespace_id), int(leaderboard_id)
+        for key in list(self.entries.keys()):
+            if key[0] == gamespace_id and key[1] == leaderboard_id:
+                del self.entries[key]
@@ -0,0 +1,269 @@
+from tornado.ioloop import PeriodicCallback, IOLoop
+
+from anthill.common.database import DatabaseError
+
+from . cache import LRUCache
+
+import asyncio
+import logging
+import random
+import time
+
+
+def parse_replicas(value):
+    """
+    Parses the `db_replicas` option, like "main=10.0.0.7/leaderboard,main=10.0.0.8/leaderboard",
+        replicas of the shards (see RecordShards) are listed under the shard name
+    :returns: a list of (shard name, host, database) of every replica, a shard may have many
+    """
+    result = []
+    for item in filter(None, (value or "").split(",")):
+        shard, _, location = item.partition("=")
+        host, _, database = location.strip().partition("/")
+
+        if not shard.strip() or not host or not database:
+            raise ValueError("Replica '{0}' should be like shard=host/database".format(item))
+
+        result.append((shard.strip(), host, database))
+    return result
+
+
+class Replica(object):
+    __slots__ = ("name", "db", "healthy", "lag", "position", "reads", "ejected", "failed")
+
+    def __init__(self, name, db):
+        self.name = name
+        self.db = db
+        # replicas join the rotation once their lag is known
+        self.healthy = False
+        self.lag = None
+        # a unix time the replica has every write of the primary up to, as of the last check
+        self.position = 0
+        self.reads = 0
+        self.ejected = 0
+        self.failed = 0
+
+    def stats(self):
+        return {
+            "healthy": self.healthy,
+            "lag": self.lag,
+            "reads": self.reads,
+            "ejected": self.ejected,
+            "failed": self.failed
+        }
+
+
+class ReplicaPool(object):
+    """
+    Read replicas of a database (the primary). Ranked reads go to a random healthy replica, writes
+        (and everything else) stay on the primary.
+
+    Lag is measured with a heartbeat: every `interval` seconds, the `leaderboard_heartbeat` row is set
+        to the current time on the primary (by every instance of the service, it's the same row anyway),
+        then read back from every replica, concurrently. A replica is as far behind as its heartbeat is old.
+    A replica falling more than `max_lag` seconds behind (or failing to answer) is taken out of the rotation,
+        and is put back once it has caught up to half of that.
+
+    Read-your-writes: a read that has to see the writes made up to some time (see `since` of reader) is only
+        served by a replica that has caught up to that time, by the primary otherwise.
+    """
+
+    def __init__(self, primary, replicas, interval, max_lag):
+        """
+        :param replicas: a dict of replica name -> Database
+        """
+        self.primary = primary
+        self.replicas = [Replica(name, db) for name, db in replicas.items()]
+        self.interval = interval
+        self.max_lag = max_lag
+
+        self.periodic = None
+        self.running = False
+
+        self.primary_reads = 0
+        self.fresh_reads = 0
+
+    def start(self):
+        self.periodic = PeriodicCallback(
+            lambda: IOLoop.current().spawn_callback(self.run), self.interval * 1000)
+        self.periodic.start()
+
+    def stop(self):
+        if self.periodic is not None:
+            self.periodic.stop()
+            self.periodic = None
+
+    def stats(self):
+        return {
+            "primary_reads": self.primary_reads,
+            # reads that went to the primary as no replica had caught up with the writes they have to see
+            "fresh_reads": self.fresh_reads,
+            "replicas": {
+                replica.name: replica.stats()
+                for replica in self.replicas
+            }
+        }
+
+    def reader(self, since=None):
+        """
+        :param since: a unix time the read has to see every write made up to, None if any healthy replica would do
+        :returns: a database to read from
+        """
+
+        candidates = [
+            replica
+            for replica in self.replicas
+            if replica.healthy and (since is None or replica.position >= since)
+        ]
+
+        if not candidates:
+            self.primary_reads += 1
+            if since is not None:
+                self.fresh_reads += 1
+            return self.primary
+
+        replica = random.choice(candidates)
+        replica.reads += 1
+        return replica.db
+
+    async def run(self):
+        if self.running:
+            return
+
+        self.running = True
+
+        # noinspection PyBroadException
+        try:
+            await self.primary.execute(
+                """
+                    INSERT INTO `leaderboard_heartbeat`
+                    (`heartbeat_id`, `heartbeat_at`)
+                    VALUES (1, UNIX_TIMESTAMP(NOW(6)))
+                    ON DUPLICATE KEY UPDATE `heartbeat_at`=VALUES(`heartbeat_at`);
+                """)
+
+            await asyncio.gather(*[
+                self.__check__(replica)
+                for replica in self.replicas
+            ])
+        except Exception:
+            logging.exception("Failed to measure replica lag")
+        finally:
+            self.running = False
+
+    async def __check__(self, replica):
+        checked_at = time.time()
+
+        try:
+            heartbeat = await replica.db.get(
+                """
+                    SELECT UNIX_TIMESTAMP(NOW(6)) - `heartbeat_at` AS `lag`
+                    FROM `leaderboard_heartbeat`
+                    WHERE `heartbeat_id`=1;
+                """)
+        except DatabaseError as e:
+            replica.failed += 1
+            replica.lag = None
+            heartbeat = None
+            logging.warning("Replica '{0}' failed to answer: {1}".format(replica.name, e.args[1]))
+
+        if heartbeat is None:
+            self.__eject__(replica)
+            return
+
+        replica.lag = max(float(heartbeat["lag"]), 0.0)
+        # the lag is measured with the clock of the replica, the position is compared with the clock of this process
+        replica.position = checked_at - replica.lag
+
+        if replica.lag > self.max_lag:
+            self.__eject__(replica)
+        elif not replica.healthy and replica.lag <= self.max_lag / 2.0:
+            replica.healthy = True
+            logging.info("Replica '{0}' is back in rotation, {1:.3f}s behind".format(replica.name, replica.lag))
+
+    @staticmethod
+    def __eject__(replica):
+        if not replica.healthy:
+            return
+
+        replica.healthy = False
+        replica.ejected += 1
+        logging.warning("Replica '{0}' is out of rotation, {1} behind".format(
+            replica.name, "{0:.3f}s".format(replica.lag) if replica.lag is not None else "unknown"))
+
+
+class RecentWrites(object):
+    """
+    Accounts that have just written, along with when, so their reads go to a replica that has the write
+        (see ReplicaPool.reader), for `window` seconds after it.
+
+    Writes are remembered in process, and, if a key/value storage shared between the instances
+        of the service is passed, in it too, so an account reads its writes no matter what instance
+        has served the write. Then, a read costs a round trip to the storage, unless the account
+        has written through this instance.
+    """
+
+    def __init__(self, kv, max_accounts, window):
+        self.kv = kv
+        self.window = window
+        self.local = LRUCache(max_size=max_accounts, ttl=window)
+
+    @staticmethod
+    def __key__(gamespace_id, account_id):
+        return "lb:written:{0}:{1}".format(gamespace_id, account_id)
+
+    async def written(self, gamespace_id, account_ids):
+        now = time.time()
+        gamespace_id = int(gamespace_id)
+
+        for account_id in account_ids:
+            self.local.set((gamespace_id, int(account_id)), now)
+
+        if self.kv is None or not account_ids:
+            return
+
+        # noinspection PyBroadException
+        try:
+            async with self.kv.acquire() as kv:
+                pipeline = kv.pipeline()
+                for account_id in account_ids:
+                    pipeline.setex(RecentWrites.__key__(gamespace_id, int(account_id)), self.window, str(now))
+                await pipeline.execute()
+        except Exception:
+            logging.exception("Failed to remember recent writes")
+
+    async def since(self, gamespace_id, account_ids):
+        """
+        :returns: a unix time of the latest write of the accounts, if any of them has written recently,
+            otherwise None
+        """
+        gamespace_id = int(gamespace_id)
+        since = None
+        unknown = []
+
+        for account_id in account_ids:
+            written = self.local.get((gamespace_id, int(account_id)), None)
+            if written is None:
+                unknown.append(int(account_id))
+            elif since is None or written > since:
+                since = written
+
+        if self.kv is None or not unknown:
+            return since
+
+        # noinspection PyBroadException
+        try:
+            async with self.kv.acquire() as kv:
+                shared = await kv.mget(*[
+                    RecentWrites.__key__(gamespace_id, account_id)
+                    for account_id in unknown
+                ])
+        except Exception:
+            logging.exception("Failed to get recent writes")
+            return since
+
+        for written in shared:
+            if written is not None and (since is None or float(written) > since):
+                since = float(written)
+
+        return since
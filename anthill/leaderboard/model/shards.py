@@ -0,0 +1,529 @@
+from tornado.ioloop import PeriodicCallback, IOLoop
+
+from anthill.common.database import DatabaseError
+
+from . engine import StorageError
+
+from collections import OrderedDict
+
+import asyncio
+import bisect
+import hashlib
+import logging
+import re
+
+
+# the database the leaderboards themselves are kept in, it keeps records too, as a shard of that name
+SHARD_MAIN = "main"
+
+
+class ShardError(Exception):
+    def __init__(self, code, message):
+        self.code = code
+        self.message = message
+
+    def __str__(self):
+        return str(self.code) + ": " + self.message
+
+
+def parse_shards(value):
+    """
+    Parses the `records_shards` option, like "eu1=10.0.0.5/leaderboard,eu2=10.0.0.6/leaderboard"
+    :returns: a list of (shard name, host, database)
+    """
+    result = []
+    for item in filter(None, (value or "").split(",")):
+        name, _, location = item.partition("=")
+        name = name.strip()
+        host, _, database = location.strip().partition("/")
+
+        if not name or name == SHARD_MAIN or not host or not database:
+            raise ValueError("Shard '{0}' should be like name=host/database".format(item))
+
+        result.append((name, host, database))
+    return result
+
+
+class ShardRing(object):
+    """
+    Consistent hashing of leaderboards over shards. Every shard is put on a ring `replicas` times
+        (virtual nodes, so the shards get even shares), and a leaderboard goes to the first shard
+        after the leaderboard's own hash on the ring.
+
+    A shard added to the ring takes about 1/N of the leaderboards, only from the other shards,
+        so the rest of the leaderboards stay where they are.
+    """
+
+    REPLICAS = 128
+
+    def __init__(self, names, replicas=REPLICAS):
+        self.names = list(names)
+
+        points = sorted(
+            (ShardRing.__point__("{0}:{1}".format(name, replica)), name)
+            for name in self.names
+            for replica in range(replicas)
+        )
+
+        self.points = [point for point, name in points]
+        self.shards = [name for point, name in points]
+
+    @staticmethod
+    def __point__(key):
+        return int(hashlib.md5(key.encode()).hexdigest()[:16], 16)
+
+    @staticmethod
+    def leaderboard_key(gamespace_id, leaderboard_name, sort_order):
+        # the name is known before the leaderboard is created, so concurrent first posts end up on the same shard
+        return "{0}:{1}:{2}".format(int(gamespace_id), leaderboard_name, sort_order)
+
+    def get(self, key):
+        """
+        :returns: a name of the shard a key goes to
+        """
+        position = bisect.bisect(self.points, ShardRing.__point__(key))
+        return self.shards[position % len(self.shards)]
+
+
+class RecordShards(object):
+    """
+    Records of the mysql storage engine are split over several databases (shards), a leaderboard at a time:
+        every record of a leaderboard is kept in the same shard, so ranking never spans shards.
+
+    A shard of a leaderboard is chosen upon creation with the ShardRing of the `placement` shards
+        (see `records_shards_placement` option), and stored in `leaderboard_shard`, so changes of the ring
+        never move existing leaderboards by themselves: they're moved online, one by one, see ShardMoves.
+    Leaderboards without a shard (created before the sharding) are kept in the main database.
+
+    Everything else (leaderboards, clusters, snapshots, records of the periodic leaderboards and the
+        write-through of the redis storage engine) is kept in the main database.
+    """
+
+    def __init__(self, db, shards=None, placement=None):
+        """
+        :param shards: a dict of shard name -> Database, the main one is added as SHARD_MAIN
+        :param placement: names of the shards new leaderboards are placed on, every shard given if None
+        """
+        self.databases = OrderedDict([(SHARD_MAIN, db)])
+        self.databases.update(shards or {})
+
+        if placement is None:
+            placement = list(self.databases.keys())
+
+        for name in placement:
+            if name not in self.databases:
+                raise ValueError("Shard '{0}' is not configured".format(name))
+
+        self.ring = ShardRing(placement)
+
+    def names(self):
+        return list(self.databases.keys())
+
+    def database(self, name):
+        try:
+            return self.databases[name]
+        except KeyError:
+            raise ShardError(404, "Shard '{0}' is not configured".format(name))
+
+    def place(self, gamespace_id, leaderboard_name, sort_order):
+        """
+        :returns: a name of the shard a new leaderboard goes to
+        """
+        return self.ring.get(ShardRing.leaderboard_key(gamespace_id, leaderboard_name, sort_order))
+
+    # tables every shard has, besides the main one that has every table
+    TABLES = ["records", "leaderboard_heartbeat"]
+
+    async def setup(self, module_path):
+        """
+        Creates the tables in the shards that have none yet
+        :param module_path: a function to look up the /sql files with. Shards have no `leaderboards` table,
+            so the foreign key of the `records` is left out there.
+        """
+
+        for table in RecordShards.TABLES:
+            with open(module_path("sql/{0}.sql".format(table))) as f:
+                sql = re.sub(r",\s*CONSTRAINT [^\n]*FOREIGN KEY [^\n]*", "", f.read())
+
+            for name, db in self.databases.items():
+                if name == SHARD_MAIN:
+                    continue
+
+                try:
+                    existing = await db.get(
+                        """
+                            SHOW TABLES LIKE %s;
+                        """, table)
+
+                    if existing:
+                        continue
+
+                    await db.execute(sql)
+                except DatabaseError as e:
+                    raise ShardError(500, "Failed to set up shard '{0}': {1}".format(name, e.args[1]))
+
+                logging.warning("Created table '{0}' in shard '{1}'".format(table, name))
+
+
+class ShardMoves(object):
+    """
+    Moves a leaderboard from one shard into another, while the leaderboard is being read and written.
+
+    A leaderboard being moved has its `leaderboard_shard_mirror` set: every write into it goes into its shard
+        first, and the resulting records are copied into the mirror (see ShardedEngine). So:
+
+        1. The target shard becomes the mirror, so it gets every write from now on.
+        2. Existing records are copied into the target shard, `batch_size` at a time, paced to `rate` records
+           per second. The copy never overwrites a record, as the mirrored one is newer.
+        3. The target shard becomes the shard, and the source one becomes the mirror, so the instances
+           that still see the leaderboard the old way write into both shards just the same.
+        4. The mirror is dropped, and the records are deleted from the source shard.
+
+    Instances keep leaderboards in memory for a while (see `leaderboard_cache_ttl`), so every step is
+        followed by a pause of `settle` seconds, for every instance to see it.
+
+    A move takes a while, so it's a job, stored in `leaderboard_shard_moves` along with how far it went
+        (the step, the last record copied, records copied and purged), and run in background.
+        A move that has been interrupted is resumed from where it stopped by any instance of the service,
+        every `interval` seconds. A leaderboard is moved by a single instance at a time.
+    """
+
+    LOCK_NAME = "leaderboard_shard_move_{0}"
+
+    # finished moves are kept for this long, to see what has been moved
+    KEEP_FINISHED_DAYS = 30
+
+    def __init__(self, db, engine, on_changed, interval, settle, batch_size, rate):
+        """
+        :param engine: a ShardedEngine of the shards
+        :param on_changed: a function accepting (gamespace_id, leaderboard_id), called once the shard
+            (or the mirror) of a leaderboard has been changed
+        """
+        self.db = db
+        self.engine = engine
+        self.on_changed = on_changed
+        self.interval = interval
+        self.settle = settle
+        self.batch_size = batch_size
+        self.rate = rate
+
+        self.periodic = None
+        self.resuming = False
+
+        self.moved = 0
+        self.resumed = 0
+        self.copied = 0
+        self.purged = 0
+        self.failed = 0
+
+    def start(self):
+        self.periodic = PeriodicCallback(
+            lambda: IOLoop.current().spawn_callback(self.resume), self.interval * 1000)
+        self.periodic.start()
+
+    def stop(self):
+        if self.periodic is not None:
+            self.periodic.stop()
+            self.periodic = None
+
+    def stats(self):
+        return {
+            "moved": self.moved,
+            "resumed": self.resumed,
+            "copied": self.copied,
+            "purged": self.purged,
+            "failed": self.failed
+        }
+
+    @staticmethod
+    def __check__(leaderboard, target):
+        """
+        :returns: a name of the shard the records are moved from
+        """
+
+        if leaderboard is None:
+            raise ShardError(404, "No such leaderboard")
+
+        shard = leaderboard["leaderboard_shard"] or SHARD_MAIN
+        mirror = leaderboard["leaderboard_shard_mirror"]
+
+        if shard == target and mirror is None:
+            raise ShardError(409, "The leaderboard is in shard '{0}' already".format(target))
+
+        if mirror is not None and target not in (shard, mirror):
+            raise ShardError(409, "The leaderboard is being moved between shards '{0}' and '{1}', "
+                                  "please complete that first".format(shard, mirror))
+
+        # the previous move has been interrupted after the switch
+        return mirror if shard == target else shard
+
+    async def create(self, gamespace_id, leaderboard_id, target):
+        """
+        Checks the leaderboard can be moved, and stores a move of it
+        :returns: an id of a new move
+        """
+
+        try:
+            running = await self.db.get(
+                """
+                    SELECT `move_id`
+                    FROM `leaderboard_shard_moves`
+                    WHERE `leaderboard_id`=%s AND `move_status`='running'
+                    LIMIT 1;
+                """, leaderboard_id)
+
+            if running:
+                raise ShardError(409, "The leaderboard is being moved already, see move {0}".format(
+                    running["move_id"]))
+
+            leaderboard = await self.db.get(
+                """
+                    SELECT `leaderboard_shard`, `leaderboard_shard_mirror`
+                    FROM `leaderboards`
+                    WHERE `leaderboard_id`=%s AND `gamespace_id`=%s;
+                """, leaderboard_id, gamespace_id)
+
+            source = ShardMoves.__check__(leaderboard, target)
+
+            return await self.db.insert(
+                """
+                    INSERT INTO `leaderboard_shard_moves`
+                    (`gamespace_id`, `leaderboard_id`, `move_source`, `move_target`)
+                    VALUES (%s, %s, %s, %s);
+                """, gamespace_id, leaderboard_id, source, target)
+        except DatabaseError as e:
+            raise ShardError(500, "Failed to create a move: " + e.args[1])
+
+    async def list_moves(self, limit=50):
+        try:
+            return await self.db.query(
+                """
+                    SELECT `move_id`, `gamespace_id`, `leaderboard_id`, `move_source`, `move_target`,
+                        `move_status`, `move_step`, `move_copied`, `move_purged`, `move_error`,
+                        UNIX_TIMESTAMP(`created_at`) AS `created_at`, UNIX_TIMESTAMP(`updated_at`) AS `updated_at`
+                    FROM `leaderboard_shard_moves`
+                    ORDER BY `move_id` DESC
+                    LIMIT %s;
+                """, limit)
+        except DatabaseError as e:
+            raise ShardError(500, "Failed to list moves: " + e.args[1])
+
+    async def run(self, move_id):
+        """
+        Runs a move until it's complete.
+        Takes as long as copying every record (and waiting for every instance, three times) takes.
+        :returns: a dict with `copied` and `purged` records (by the move as a whole, if resumed), or None if
+            the leaderboard is being moved by someone else, or the move is finished already
+        """
+
+        try:
+            async with self.db.acquire() as db:
+                move = await db.get(
+                    """
+                        SELECT *
+                        FROM `leaderboard_shard_moves`
+                        WHERE `move_id`=%s;
+                    """, move_id)
+
+                if move is None or move["move_status"] != "running":
+                    return None
+
+                lock_name = ShardMoves.LOCK_NAME.format(move["leaderboard_id"])
+
+                locked = await db.get(
+                    """
+                        SELECT GET_LOCK(%s, 0) AS `locked`;
+                    """, lock_name)
+
+                if not locked or not locked["locked"]:
+                    return None
+
+                try:
+                    return await self.__move__(db, move)
+                except ShardError as e:
+                    # the move can't be done anymore, say, the leaderboard has been deleted meanwhile
+                    await db.execute(
+                        """
+                            UPDATE `leaderboard_shard_moves`
+                            SET `move_status`='failed', `move_error`=%s
+                            WHERE `move_id`=%s;
+                        """, e.message[:255], move_id)
+                    raise
+                finally:
+                    await db.get(
+                        """
+                            SELECT RELEASE_LOCK(%s);
+                        """, lock_name)
+        except DatabaseError as e:
+            self.failed += 1
+            raise ShardError(500, "Failed to move leaderboard: " + e.args[1])
+        except StorageError as e:
+            self.failed += 1
+            raise ShardError(500, "Failed to move leaderboard: " + e.message)
+        except ShardError:
+            self.failed += 1
+            raise
+
+    async def __update__(self, db, move, shard, mirror, step):
+        gamespace_id = move["gamespace_id"]
+        leaderboard_id = move["leaderboard_id"]
+
+        await db.execute(
+            """
+                UPDATE `leaderboards`
+                SET `leaderboard_shard`=%s, `leaderboard_shard_mirror`=%s
+                WHERE `leaderboard_id`=%s AND `gamespace_id`=%s;
+            """, shard, mirror, leaderboard_id, gamespace_id)
+
+        self.on_changed(gamespace_id, leaderboard_id)
+        await asyncio.sleep(self.settle)
+
+        await db.execute(
+            """
+                UPDATE `leaderboard_shard_moves`
+                SET `move_step`=%s
+                WHERE `move_id`=%s;
+            """, step, move["move_id"])
+
+    async def __move__(self, db, move):
+        gamespace_id = move["gamespace_id"]
+        leaderboard_id = move["leaderboard_id"]
+        source = move["move_source"]
+        target = move["move_target"]
+        target_engine = self.engine.get(target)
+
+        # the mirror is dropped already, so there's nothing to check
+        if move["move_step"] != "purge":
+            leaderboard = await db.get(
+                """
+                    SELECT `leaderboard_shard`, `leaderboard_shard_mirror`
+                    FROM `leaderboards`
+                    WHERE `leaderboard_id`=%s AND `gamespace_id`=%s;
+                """, leaderboard_id, gamespace_id)
+
+            if ShardMoves.__check__(leaderboard, target) != source:
+                raise ShardError(409, "The leaderboard has been moved by someone else meanwhile")
+
+            if (leaderboard["leaderboard_shard"] or SHARD_MAIN) != target:
+                if leaderboard["leaderboard_shard_mirror"] != target:
+                    await self.__update__(db, move, source, target, "copy")
+
+                if move["move_after_account_id"] is None:
+                    after = None
+                else:
+                    after = (move["move_after_account_id"], move["move_after_cluster_id"])
+
+                await self.__copy__(db, move["move_id"], self.engine.get(source), target_engine,
+                                    gamespace_id, leaderboard_id, after)
+                await self.__update__(db, move, target, source, "switch")
+
+            await self.__update__(db, move, target, None, "purge")
+
+        await self.__purge__(db, move["move_id"], self.engine.get(source), gamespace_id, leaderboard_id)
+
+        result = await db.get(
+            """
+                SELECT `move_copied` AS `copied`, `move_purged` AS `purged`
+                FROM `leaderboard_shard_moves`
+                WHERE `move_id`=%s;
+            """, move["move_id"])
+
+        await db.execute(
+            """
+                UPDATE `leaderboard_shard_moves`
+                SET `move_status`='done'
+                WHERE `move_id`=%s;
+            """, move["move_id"])
+
+        self.moved += 1
+        logging.info("Moved leaderboard {0} from shard '{1}' to '{2}': {3} records copied, {4} purged".format(
+            leaderboard_id, source, target, result["copied"], result["purged"]))
+
+        return result
+
+    async def __copy__(self, db, move_id, source, target, gamespace_id, leaderboard_id, after):
+        pause = float(self.batch_size) / self.rate
+
+        while True:
+            records = await source.load_page(gamespace_id, leaderboard_id, after, self.batch_size)
+
+            if not records:
+                break
+
+            await target.copy_records(gamespace_id, leaderboard_id, records, overwrite=False)
+
+            after = (records[-1]["account_id"], records[-1]["cluster_id"])
+            self.copied += len(records)
+
+            await db.execute(
+                """
+                    UPDATE `leaderboard_shard_moves`
+                    SET `move_after_account_id`=%s, `move_after_cluster_id`=%s, `move_copied`=`move_copied`+%s
+                    WHERE `move_id`=%s;
+                """, after[0], after[1], len(records), move_id)
+
+            if len(records) < self.batch_size:
+                break
+
+            await asyncio.sleep(pause)
+
+    async def __purge__(self, db, move_id, source, gamespace_id, leaderboard_id):
+        pause = float(self.batch_size) / self.rate
+
+        while True:
+            count = await source.purge_records(gamespace_id, leaderboard_id, self.batch_size)
+            self.purged += count
+
+            if count:
+                await db.execute(
+                    """
+                        UPDATE `leaderboard_shard_moves`
+                        SET `move_purged`=`move_purged`+%s
+                        WHERE `move_id`=%s;
+                    """, count, move_id)
+
+            if count < self.batch_size:
+                break
+
+            await asyncio.sleep(pause)
+
+    async def resume(self):
+        """
+        Runs the moves nobody runs, and deletes the old finished ones
+        """
+        if self.resuming:
+            return
+
+        self.resuming = True
+
+        # noinspection PyBroadException
+        try:
+            moves = await self.db.query(
+                """
+                    SELECT `move_id`
+                    FROM `leaderboard_shard_moves`
+                    WHERE `move_status`='running'
+                    ORDER BY `move_id`;
+                """)
+
+            for move in moves:
+                if self.periodic is None:
+                    break
+
+                try:
+                    if await self.run(move["move_id"]) is not None:
+                        self.resumed += 1
+                        logging.info("Resumed shard move {0}".format(move["move_id"]))
+                except ShardError as e:
+                    logging.error("Failed to resume shard move {0}: {1}".format(move["move_id"], e.message))
+
+            await self.db.execute(
+                """
+                    DELETE FROM `leaderboard_shard_moves`
+                    WHERE `move_status`<>'running' AND `updated_at` < NOW() - INTERVAL %s DAY
+                    LIMIT 100;
+                """, ShardMoves.KEEP_FINISHED_DAYS)
+        except Exception:
+            logging.exception("Failed to resume shard moves")
+        finally:
+            self.resuming = False
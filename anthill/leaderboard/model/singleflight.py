@@ -0,0 +1,67 @@
+import asyncio
+
+
+class SingleFlight(object):
+    """
+    Collapses concurrent identical requests: while a request of some key is in flight,
+        requests of the same key wait for its result (or its exception) instead of being made again.
+    Nothing is kept once a request completes, so it's no cache, see LRUCache for that.
+    """
+
+    def __init__(self):
+        # key -> a future of the request in flight
+        self.flights = {}
+
+        self.requests = 0
+        self.shared = 0
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "executed": self.requests - self.shared,
+            "shared": self.shared,
+            # a share of requests that did not have to be made
+            "dedup_ratio": float(self.shared) / self.requests if self.requests else 0.0
+        }
+
+    async def run(self, key, request):
+        """
+        :param request: a coroutine function making the request, called only if there's no such request in flight
+        """
+
+        self.requests += 1
+
+        flight = self.flights.get(key)
+
+        if flight is not None:
+            self.shared += 1
+            try:
+                return await asyncio.shield(flight)
+            except asyncio.CancelledError:
+                if not flight.cancelled():
+                    raise
+                # the request in flight was cancelled rather than failed, so it's made again
+                self.requests -= 1
+                self.shared -= 1
+                return await self.run(key, request)
+
+        flight = asyncio.get_event_loop().create_future()
+        self.flights[key] = flight
+
+        try:
+            result = await request()
+        except asyncio.CancelledError:
+            # the waiters have to be let go, they make the request again
+            flight.cancel()
+            raise
+        except BaseException as e:
+            flight.set_exception(e)
+            # nobody may wait for it
+            flight.exception()
+            raise
+        else:
+            flight.set_result(result)
+        finally:
+            del self.flights[key]
+
+        return result
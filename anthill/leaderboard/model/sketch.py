@@ -0,0 +1,235 @@
+from tornado.ioloop import IOLoop
+
+from collections import OrderedDict
+
+import asyncio
+import logging
+import math
+import time
+
+
+class ScoreSketch(object):
+    """
+    Approximate distribution of the scores of a leaderboard, to estimate the rank (and the percentile)
+        of a score without counting the records.
+
+    Scores are counted in logarithmic buckets: a bucket holds scores within GAMMA (2%) of each other,
+        separately for positive and negative scores, and scores closer to zero than MIN_SCORE share
+        a single bucket. The counts are kept in a Fenwick tree, so both an update and an estimate take
+        O(log BUCKETS), BUCKETS being fixed (about 4000), so it's constant time no matter how big the leaderboard is.
+
+    Error bound: records of the bucket the score falls into can't be told apart, so the rank is estimated
+        as if the score was in the middle of them, and is off by at most half of the records whose scores
+        are within 2% of it. The exact bound is returned with every estimate, see estimate.
+    """
+
+    GAMMA = 1.02
+    MIN_SCORE = 0.001
+    MAX_SCORE = 1e15
+
+    # buckets of each sign
+    MAGNITUDES = int(math.ceil(math.log(MAX_SCORE / MIN_SCORE) / math.log(GAMMA))) + 1
+    # negative buckets, the zero one, and positive buckets, in the order of scores
+    BUCKETS = MAGNITUDES * 2 + 1
+
+    __slots__ = ("tree", "total")
+
+    def __init__(self):
+        self.tree = [0] * (ScoreSketch.BUCKETS + 1)
+        self.total = 0
+
+    @staticmethod
+    def bucket(score):
+        magnitude = abs(score)
+
+        if magnitude < ScoreSketch.MIN_SCORE:
+            return ScoreSketch.MAGNITUDES
+
+        k = min(max(int(math.ceil(math.log(magnitude / ScoreSketch.MIN_SCORE) / math.log(ScoreSketch.GAMMA))), 0),
+                ScoreSketch.MAGNITUDES - 1)
+
+        return ScoreSketch.MAGNITUDES + 1 + k if score > 0 else ScoreSketch.MAGNITUDES - 1 - k
+
+    @staticmethod
+    def bucket_sql():
+        """
+        :returns: a (SQL expression, arguments) computing the bucket of the `score` column exactly like bucket() does
+        """
+        return (
+            """
+                CASE
+                    WHEN ABS(`score`) < %s THEN %s
+                    WHEN `score` > 0 THEN %s + 1 + LEAST(GREATEST(CEIL(LN(`score` / %s) / LN(%s)), 0), %s)
+                    ELSE %s - 1 - LEAST(GREATEST(CEIL(LN(-`score` / %s) / LN(%s)), 0), %s)
+                END
+            """,
+            [ScoreSketch.MIN_SCORE, ScoreSketch.MAGNITUDES,
+             ScoreSketch.MAGNITUDES, ScoreSketch.MIN_SCORE, ScoreSketch.GAMMA, ScoreSketch.MAGNITUDES - 1,
+             ScoreSketch.MAGNITUDES, ScoreSketch.MIN_SCORE, ScoreSketch.GAMMA, ScoreSketch.MAGNITUDES - 1])
+
+    def __add__(self, bucket, count):
+        tree = self.tree
+        i = bucket + 1
+        while i < len(tree):
+            tree[i] += count
+            i += i & -i
+
+    def __prefix__(self, bucket):
+        """
+        :returns: amount of scores in buckets up to the given one, inclusive
+        """
+        tree = self.tree
+        result = 0
+        i = bucket + 1
+        while i > 0:
+            result += tree[i]
+            i -= i & -i
+        return result
+
+    def load(self, buckets):
+        """
+        :param buckets: a list of (bucket, count)
+        """
+        for bucket, count in buckets:
+            self.__add__(int(bucket), int(count))
+            self.total += int(count)
+
+    def add(self, score):
+        self.__add__(ScoreSketch.bucket(score), 1)
+        self.total += 1
+
+    def remove(self, score):
+        bucket = ScoreSketch.bucket(score)
+        # the sketch may have been built before the score was written
+        if self.__prefix__(bucket) - self.__prefix__(bucket - 1) <= 0:
+            return
+        self.__add__(bucket, -1)
+        self.total -= 1
+
+    def estimate(self, score, sort_order):
+        """
+        :returns: a (rank, error, total): an estimated rank of the score, how many ranks it may be off by,
+            and the amount of scores
+        """
+        bucket = ScoreSketch.bucket(score)
+
+        below = self.__prefix__(bucket - 1)
+        same = self.__prefix__(bucket) - below
+        above = self.total - below - same
+
+        better = above if sort_order == "desc" else below
+
+        # a score better than any is the first
+        return max(better + (same + 1) // 2, 1), same // 2, self.total
+
+
+class _SketchEntry(object):
+    def __init__(self):
+        self.sketch = None
+        self.loading = None
+        self.loaded_at = 0
+
+
+class ScoreSketches(object):
+    """
+    A bounded set of score sketches, each keyed by (gamespace_id, leaderboard_id).
+
+    A sketch is built from the records upon first use, and then is kept in sync by the writes going through
+        this process. It is rebuilt in background every `ttl` seconds, to catch up with the writes of other
+        processes and with expired records, meanwhile the existing one is used.
+    """
+
+    def __init__(self, max_boards, ttl):
+        self.max_boards = max_boards
+        self.ttl = ttl
+        self.entries = OrderedDict()
+
+    @staticmethod
+    def __key__(gamespace_id, leaderboard_id):
+        return int(gamespace_id), int(leaderboard_id)
+
+    async def __load__(self, key, entry, loader):
+        loading = asyncio.get_event_loop().create_future()
+        entry.loading = loading
+
+        try:
+            sketch = ScoreSketch()
+            sketch.load(await loader())
+        except Exception as e:
+            entry.loading = None
+            if entry.sketch is None and self.entries.get(key) is entry:
+                del self.entries[key]
+            loading.set_exception(e)
+            # nobody may wait for it
+            loading.exception()
+            raise
+
+        entry.sketch = sketch
+        entry.loading = None
+        entry.loaded_at = time.time()
+        loading.set_result(sketch)
+
+        return sketch
+
+    async def __rebuild__(self, key, entry, loader):
+        # noinspection PyBroadException
+        try:
+            await self.__load__(key, entry, loader)
+        except Exception:
+            logging.exception("Failed to rebuild a score sketch")
+
+    async def get(self, gamespace_id, leaderboard_id, loader):
+        """
+        :param loader: a coroutine function returning a list of (bucket, count) of the leaderboard
+        :returns: a ScoreSketch
+        """
+
+        key = ScoreSketches.__key__(gamespace_id, leaderboard_id)
+        entry = self.entries.get(key)
+
+        if entry is None:
+            entry = _SketchEntry()
+            self.entries[key] = entry
+            while len(self.entries) > self.max_boards:
+                self.entries.popitem(last=False)
+
+        self.entries.move_to_end(key)
+
+        if entry.sketch is None:
+            if entry.loading is not None:
+                return await asyncio.shield(entry.loading)
+            return await self.__load__(key, entry, loader)
+
+        if entry.loading is None and entry.loaded_at + self.ttl < time.time():
+            IOLoop.current().spawn_callback(self.__rebuild__, key, entry, loader)
+
+        return entry.sketch
+
+    def loaded(self, gamespace_id, leaderboard_id):
+        entry = self.entries.get(ScoreSketches.__key__(gamespace_id, leaderboard_id))
+        return entry is not None and entry.sketch is not None
+
+    def replace(self, gamespace_id, leaderboard_id, previous, score):
+        """
+        Replaces a score of a record in a sketch, if there's one
+        :param previous: a previous score of the record, or None if it's a new one
+        :param score: a new score of the record, or None if it's deleted
+        """
+        entry = self.entries.get(ScoreSketches.__key__(gamespace_id, leaderboard_id))
+        if entry is None or entry.sketch is None:
+            return
+        if previous is not None:
+            entry.sketch.remove(previous)
+        if score is not None:
+            entry.sketch.add(score)
+
+    def drop(self, gamespace_id, leaderboard_id):
+        self.entries.pop(ScoreSketches.__key__(gamespace_id, leaderboard_id), None)
+
+    def outdate(self, gamespace_id=None):
+        """
+        Makes sketches of a gamespace (of every gamespace if gamespace_id is None) to be rebuilt upon next use
+        """
+        for key, entry in self.entries.items():
+            if gamespace_id is None or key[0] == int(gamespace_id):
+                entry.loaded_at = 0
@@ -0,0 +1,487 @@
+from tornado.ioloop import PeriodicCallback, IOLoop
+
+from anthill.common.database import DatabaseError
+
+from . engine.mysql import MySQLEngine
+
+import hashlib
+import logging
+
+
+class SnapshotError(Exception):
+    def __init__(self, code, message):
+        self.code = code
+        self.message = message
+
+    def __str__(self):
+        return str(self.code) + ": " + self.message
+
+
+class LeaderboardSnapshots(object):
+    """
+    Immutable copies of leaderboards, with ranks stored along with the records, say, to reward players
+        at the end of a season while the leaderboard itself is being posted into.
+
+    A snapshot is copied from the `records` table (so the records of the redis storage engine are copied
+        only with write-through enabled) in a consistent read, meaning it's the leaderboard exactly as it was
+        when the snapshot has been started, without locking anything. Each cluster of a clustered leaderboard
+        is ranked separately, as the leaderboard itself is.
+
+    Records of a snapshot are keyed by (snapshot_id, cluster_id, rank), so a page is a range of the primary key,
+        and a rank of an account is a single lookup of the `snapshot_account` key.
+
+    Snapshots expire after `ttl` seconds, and only `keep` latest snapshots of a leaderboard are kept.
+    Expired snapshots are deleted in chunks every `cleanup_interval` seconds.
+
+    A snapshot is created under a lock of its name, so a snapshot left `creating` by a creation that has failed
+        (or a process that has been stopped) is only ever replaced when nobody is creating it anymore.
+    """
+
+    LOCK_NAME = "leaderboard_snapshot_{0}"
+
+    def __init__(self, db, batch_size, ttl, keep, cleanup_interval):
+        self.db = db
+        self.batch_size = batch_size
+        self.ttl = ttl
+        self.keep = keep
+        self.cleanup_interval = cleanup_interval
+        self.periodic = None
+
+    def start(self):
+        self.periodic = PeriodicCallback(
+            lambda: IOLoop.current().spawn_callback(self.cleanup), self.cleanup_interval * 1000)
+        self.periodic.start()
+
+    def stop(self):
+        if self.periodic is not None:
+            self.periodic.stop()
+            self.periodic = None
+
+    @staticmethod
+    def __ranked__(records):
+        return [
+            (record["rank"], record)
+            for record in records
+        ]
+
+    async def get_snapshot(self, gamespace_id, leaderboard_id, snapshot_name):
+        """
+        :returns: a snapshot that is ready to be read
+        """
+
+        try:
+            snapshot = await self.db.get(
+                """
+                    SELECT `snapshot_id`, `snapshot_name`, `snapshot_records`,
+                        UNIX_TIMESTAMP(`created_at`) AS `created_at`, UNIX_TIMESTAMP(`expire_at`) AS `expire_at`
+                    FROM `leaderboard_snapshots`
+                    WHERE `gamespace_id`=%s AND `leaderboard_id`=%s AND `snapshot_name`=%s
+                        AND `snapshot_status`='ready';
+                """, gamespace_id, leaderboard_id, snapshot_name)
+        except DatabaseError as e:
+            raise SnapshotError(500, "Failed to get snapshot: " + e.args[1])
+
+        if snapshot is None:
+            raise SnapshotError(404, "No such snapshot")
+
+        return snapshot
+
+    async def list_snapshots(self, gamespace_id, leaderboard_id):
+        try:
+            return await self.db.query(
+                """
+                    SELECT `snapshot_id`, `snapshot_name`, `snapshot_status`, `snapshot_records`,
+                        UNIX_TIMESTAMP(`created_at`) AS `created_at`, UNIX_TIMESTAMP(`expire_at`) AS `expire_at`
+                    FROM `leaderboard_snapshots`
+                    WHERE `gamespace_id`=%s AND `leaderboard_id`=%s
+                    ORDER BY `snapshot_id` DESC;
+                """, gamespace_id, leaderboard_id)
+        except DatabaseError as e:
+            raise SnapshotError(500, "Failed to list snapshots: " + e.args[1])
+
+    async def create_snapshot(self, gamespace_id, leaderboard_id, sort_order, snapshot_name, ttl=None,
+                              table="records", records_of=None, source=None):
+        """
+        Copies a leaderboard into a new snapshot. Takes as long as copying every record takes.
+        :param table: a table the records are copied from
+        :param source: a database the records are copied from (say, a shard, see RecordShards), the same one
+            the snapshots are kept in if None
+        :param records_of: a leaderboard to copy the records of (say, a period of a periodic leaderboard),
+            the leaderboard itself if None
+        :returns: a dict with `snapshot_id` and `snapshot_records`
+        """
+
+        ttl = int(ttl or self.ttl)
+
+        # lock names are 64 characters long at most, snapshot names alone may be that long
+        lock_name = LeaderboardSnapshots.LOCK_NAME.format(hashlib.md5("{0}:{1}:{2}".format(
+            int(gamespace_id), int(leaderboard_id), snapshot_name).encode()).hexdigest())
+
+        try:
+            async with self.db.acquire() as db:
+                locked = await db.get(
+                    """
+                        SELECT GET_LOCK(%s, 0) AS `locked`;
+                    """, lock_name)
+
+                if not locked or not locked["locked"]:
+                    raise SnapshotError(409, "Snapshot '{0}' is being created already".format(snapshot_name))
+
+                try:
+                    return await self.__create__(
+                        gamespace_id, leaderboard_id, sort_order, snapshot_name, ttl, table, records_of, source)
+                finally:
+                    await db.get(
+                        """
+                            SELECT RELEASE_LOCK(%s);
+                        """, lock_name)
+        except DatabaseError as e:
+            raise SnapshotError(500, "Failed to create snapshot: " + e.args[1])
+
+    async def __create__(self, gamespace_id, leaderboard_id, sort_order, snapshot_name, ttl, table, records_of,
+                         source):
+
+        try:
+            existing = await self.db.get(
+                """
+                    SELECT `snapshot_id`, `snapshot_status`
+                    FROM `leaderboard_snapshots`
+                    WHERE `gamespace_id`=%s AND `leaderboard_id`=%s AND `snapshot_name`=%s;
+                """, gamespace_id, leaderboard_id, snapshot_name)
+
+            if existing is not None:
+                if existing["snapshot_status"] == "ready":
+                    raise SnapshotError(409, "Snapshot '{0}' already exists".format(snapshot_name))
+                # a snapshot that has never been finished, as nobody else holds the lock
+                await self.__delete_snapshot__(existing["snapshot_id"])
+
+            snapshot_id = await self.db.insert(
+                """
+                    INSERT INTO `leaderboard_snapshots`
+                    (`gamespace_id`, `leaderboard_id`, `snapshot_name`, `expire_at`)
+                    VALUES (%s, %s, %s, NOW() + INTERVAL %s SECOND);
+                """, gamespace_id, leaderboard_id, snapshot_name, ttl)
+        except DatabaseError as e:
+            raise SnapshotError(500, "Failed to create snapshot: " + e.args[1])
+
+        try:
+            count = await self.__copy__(
+                snapshot_id, gamespace_id, records_of or leaderboard_id, sort_order, table, source or self.db)
+
+            updated = await self.db.execute(
+                """
+                    UPDATE `leaderboard_snapshots`
+                    SET `snapshot_status`='ready', `snapshot_records`=%s
+                    WHERE `snapshot_id`=%s AND `snapshot_status`='creating';
+                """, count, snapshot_id)
+
+            if not updated:
+                # the snapshot has been deleted while being copied, so are the records copied
+                await self.__delete_snapshot__(snapshot_id)
+                raise SnapshotError(409, "Snapshot '{0}' has been deleted while being created".format(snapshot_name))
+        except DatabaseError as e:
+            raise SnapshotError(500, "Failed to create snapshot: " + e.args[1])
+
+        await self.__retain__(gamespace_id, leaderboard_id)
+
+        return {
+            "snapshot_id": snapshot_id,
+            "snapshot_records": count
+        }
+
+    async def __copy__(self, snapshot_id, gamespace_id, leaderboard_id, sort_order, table, source_db):
+        order = sort_order.upper()
+        worse = "<" if order == "DESC" else ">"
+        count = 0
+
+        # reads are done in a single consistent snapshot of the database, writes are done by another connection
+        async with source_db.acquire(auto_commit=False) as source:
+            await source.execute(
+                """
+                    START TRANSACTION WITH CONSISTENT SNAPSHOT, READ ONLY;
+                """)
+
+            try:
+                clusters = await source.query(
+                    """
+                        SELECT DISTINCT `cluster_id`
+                        FROM `{0}`
+                        WHERE `gamespace_id`=%s AND `leaderboard_id`=%s;
+                    """.format(table), gamespace_id, leaderboard_id)
+
+                for cluster in clusters:
+                    cluster_id = cluster["cluster_id"]
+                    rank = 0
+                    seek = ""
+                    args = []
+
+                    while True:
+                        # a range of the `leaderboard_rank` index after the last record copied
+                        records = await source.query(
+                            """
+                                SELECT `account_id`, `display_name`, `score`, CAST(`profile` AS CHAR) AS `profile`
+                                FROM `{2}`
+                                WHERE `gamespace_id`=%s AND `leaderboard_id`=%s AND `cluster_id`=%s {1}
+                                ORDER BY `score` {0}, `account_id` {0}
+                                LIMIT %s;
+                            """.format(order, seek, table),
+                            gamespace_id, leaderboard_id, cluster_id, *(args + [self.batch_size]))
+
+                        if not records:
+                            break
+
+                        await self.db.execute(
+                            """
+                                INSERT INTO `leaderboard_snapshot_records`
+                                (`snapshot_id`, `cluster_id`, `rank`, `account_id`, `score`, `display_name`, `profile`)
+                                VALUES {0};
+                            """.format(",".join(["(%s, %s, %s, %s, %s, %s, %s)"] * len(records))),
+                            *[value for position, record in enumerate(records, start=rank + 1) for value in (
+                                snapshot_id, cluster_id, position, record["account_id"], record["score"],
+                                record["display_name"], record["profile"])])
+
+                        rank += len(records)
+                        count += len(records)
+
+                        if len(records) < self.batch_size:
+                            break
+
+                        last = records[-1]
+                        score = MySQLEngine.__float_score__(last["score"])
+                        seek = "AND (`score` {0} %s OR (`score`=%s AND `account_id` {0} %s))".format(worse)
+                        args = [score, score, last["account_id"]]
+            finally:
+                await source.rollback()
+
+        return count
+
+    async def __retain__(self, gamespace_id, leaderboard_id):
+        """
+        Expires the snapshots of a leaderboard beyond `keep` latest ones
+        """
+        try:
+            await self.db.execute(
+                """
+                    UPDATE `leaderboard_snapshots`
+                    SET `expire_at`=NOW()
+                    WHERE `gamespace_id`=%s AND `leaderboard_id`=%s AND `snapshot_status`='ready'
+                        AND `snapshot_id` < (
+                            SELECT `snapshot_id` FROM (
+                                SELECT `snapshot_id`
+                                FROM `leaderboard_snapshots`
+                                WHERE `gamespace_id`=%s AND `leaderboard_id`=%s AND `snapshot_status`='ready'
+                                ORDER BY `snapshot_id` DESC
+                                LIMIT %s, 1
+                            ) AS `oldest_kept`
+                        );
+                """, gamespace_id, leaderboard_id, gamespace_id, leaderboard_id, self.keep - 1)
+        except DatabaseError as e:
+            logging.error("Failed to retain snapshots: " + e.args[1])
+
+    async def __delete_snapshot__(self, snapshot_id):
+        # in chunks, so no single statement locks a whole snapshot
+        while True:
+            deleted = await self.db.execute(
+                """
+                    DELETE FROM `leaderboard_snapshot_records`
+                    WHERE `snapshot_id`=%s
+                    LIMIT %s;
+                """, snapshot_id, self.batch_size)
+
+            if deleted < self.batch_size:
+                break
+
+        await self.db.execute(
+            """
+                DELETE FROM `leaderboard_snapshots`
+                WHERE `snapshot_id`=%s;
+            """, snapshot_id)
+
+    async def delete_snapshot(self, gamespace_id, snapshot_id):
+        try:
+            snapshot = await self.db.get(
+                """
+                    SELECT `snapshot_id`
+                    FROM `leaderboard_snapshots`
+                    WHERE `gamespace_id`=%s AND `snapshot_id`=%s;
+                """, gamespace_id, snapshot_id)
+
+            if snapshot is None:
+                raise SnapshotError(404, "No such snapshot")
+
+            await self.__delete_snapshot__(snapshot_id)
+        except DatabaseError as e:
+            raise SnapshotError(500, "Failed to delete snapshot: " + e.args[1])
+
+    async def delete_leaderboard(self, gamespace_id, leaderboard_id):
+        """
+        Makes every snapshot of a leaderboard expire, so they're deleted upon next cleanup
+        """
+        try:
+            await self.db.execute(
+                """
+                    UPDATE `leaderboard_snapshots`
+                    SET `expire_at`=NOW()
+                    WHERE `gamespace_id`=%s AND `leaderboard_id`=%s;
+                """, gamespace_id, leaderboard_id)
+        except DatabaseError as e:
+            raise SnapshotError(500, "Failed to delete snapshots: " + e.args[1])
+
+    async def delete_accounts(self, gamespace_id, accounts):
+        """
+        Deletes records of the accounts from every snapshot (of a gamespace, if gamespace_id is not None)
+        :returns: amount of records deleted
+        """
+        try:
+            if gamespace_id is None:
+                snapshots = await self.db.query(
+                    """
+                        SELECT `snapshot_id`
+                        FROM `leaderboard_snapshots`;
+                    """)
+            else:
+                snapshots = await self.db.query(
+                    """
+                        SELECT `snapshot_id`
+                        FROM `leaderboard_snapshots`
+                        WHERE `gamespace_id`=%s;
+                    """, gamespace_id)
+
+            if not snapshots:
+                return 0
+
+            # ranks of the rest of the records are kept as they were
+            return await self.db.execute(
+                """
+                    DELETE FROM `leaderboard_snapshot_records`
+                    WHERE `snapshot_id` IN %s AND `account_id` IN %s;
+                """, [snapshot["snapshot_id"] for snapshot in snapshots], accounts)
+        except DatabaseError as e:
+            raise SnapshotError(500, "Failed to delete snapshot records: " + e.args[1])
+
+    async def cleanup(self):
+        # noinspection PyBroadException
+        try:
+            expired = await self.db.query(
+                """
+                    SELECT `snapshot_id`
+                    FROM `leaderboard_snapshots`
+                    WHERE `expire_at` < NOW();
+                """)
+
+            for snapshot in expired:
+                await self.__delete_snapshot__(snapshot["snapshot_id"])
+
+            if expired:
+                logging.info("Deleted {0} expired snapshots".format(len(expired)))
+        except Exception:
+            logging.exception("Failed to delete expired snapshots")
+
+    async def list_top(self, snapshot_id, cluster_id, offset, limit):
+        offset = int(offset)
+        limit = int(limit)
+
+        try:
+            records = await self.db.query(
+                """
+                    SELECT `rank`, `account_id`, `display_name`, `score`, CAST(`profile` AS CHAR) AS `profile`,
+                        `cluster_id`
+                    FROM `leaderboard_snapshot_records`
+                    WHERE `snapshot_id`=%s AND `cluster_id`=%s AND `rank` > %s AND `rank` <= %s
+                    ORDER BY `rank`;
+                """, snapshot_id, cluster_id, offset, offset + limit)
+        except DatabaseError as e:
+            raise SnapshotError(500, "Failed to get snapshot records: " + e.args[1])
+
+        return LeaderboardSnapshots.__ranked__(records)
+
+    async def list_records(self, snapshot_id, after_cluster_id, after_rank, limit):
+        """
+        Lists every record of a snapshot, cluster after cluster, in pages
+        :returns: a list of ranked records that goes after a record (after_cluster_id, after_rank)
+        """
+        try:
+            records = await self.db.query(
+                """
+                    SELECT `rank`, `account_id`, `display_name`, `score`, CAST(`profile` AS CHAR) AS `profile`,
+                        `cluster_id`
+                    FROM `leaderboard_snapshot_records`
+                    WHERE `snapshot_id`=%s AND (`cluster_id` > %s OR (`cluster_id`=%s AND `rank` > %s))
+                    ORDER BY `cluster_id`, `rank`
+                    LIMIT %s;
+                """, snapshot_id, after_cluster_id, after_cluster_id, after_rank, int(limit))
+        except DatabaseError as e:
+            raise SnapshotError(500, "Failed to get snapshot records: " + e.args[1])
+
+        return LeaderboardSnapshots.__ranked__(records)
+
+    async def list_around(self, snapshot_id, account_id, offset, limit):
+        """
+        :returns: a list of ranked records around the account's one, or None if the account has no record
+        """
+        offset = int(offset)
+        limit = int(limit)
+
+        try:
+            async with self.db.acquire() as db:
+                own = await db.get(
+                    """
+                        SELECT `rank`, `cluster_id`
+                        FROM `leaderboard_snapshot_records`
+                        WHERE `snapshot_id`=%s AND `account_id`=%s;
+                    """, snapshot_id, account_id)
+
+                if own is None:
+                    return None
+
+                first = max(own["rank"] - limit // 2, 1) + offset
+
+                records = await db.query(
+                    """
+                        SELECT `rank`, `account_id`, `display_name`, `score`, CAST(`profile` AS CHAR) AS `profile`,
+                            `cluster_id`
+                        FROM `leaderboard_snapshot_records`
+                        WHERE `snapshot_id`=%s AND `cluster_id`=%s AND `rank` >= %s AND `rank` < %s
+                        ORDER BY `rank`;
+                    """, snapshot_id, own["cluster_id"], first, first + limit)
+        except DatabaseError as e:
+            raise SnapshotError(500, "Failed to get snapshot records: " + e.args[1])
+
+        return LeaderboardSnapshots.__ranked__(records)
+
+    async def list_accounts(self, snapshot_id, account_ids):
+        """
+        :returns: a list of ranked records of the accounts given (within their clusters), ordered by rank
+        """
+        if not account_ids:
+            return []
+
+        try:
+            records = await self.db.query(
+                """
+                    SELECT `rank`, `account_id`, `display_name`, `score`, CAST(`profile` AS CHAR) AS `profile`,
+                        `cluster_id`
+                    FROM `leaderboard_snapshot_records`
+                    WHERE `snapshot_id`=%s AND `account_id` IN %s
+                    ORDER BY `rank`, `cluster_id`;
+                """, snapshot_id, account_ids)
+        except DatabaseError as e:
+            raise SnapshotError(500, "Failed to get snapshot records: " + e.args[1])
+
+        return LeaderboardSnapshots.__ranked__(records)
+
+    async def get_cluster(self, snapshot_id, account_id):
+        """
+        :returns: a cluster the account's record was in, or None if the account has no record
+        """
+        try:
+            own = await self.db.get(
+                """
+                    SELECT `cluster_id`
+                    FROM `leaderboard_snapshot_records`
+                    WHERE `snapshot_id`=%s AND `account_id`=%s;
+                """, snapshot_id, account_id)
+        except DatabaseError as e:
+            raise SnapshotError(500, "Failed to get snapshot record: " + e.args[1])
+
+        return None if own is None else own["cluster_id"]
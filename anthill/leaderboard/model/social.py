@@ -1,13 +1,28 @@
 
 from anthill.common.internal import Internal
+from anthill.common.options import options
+
+from . cache import LRUCache
+from . singleflight import SingleFlight
 
 
 class SocialModel(object):
+    """
+    Friends of accounts, as told by the social service.
+
+    Friend lists are cached per (gamespace, account) for `friends_cache_ttl` seconds, and concurrent lookups
+        of the same account's friends share a single request to the social service.
+    """
 
     def __init__(self):
         self.internal = Internal()
+        self.friends = LRUCache(
+            max_size=options.friends_cache_size,
+            ttl=options.friends_cache_ttl)
+        # keyed by (gamespace, account_id)
+        self.requests = SingleFlight()
 
-    async def get_friends(self, gamespace, account_id, profile_fields):
+    async def __request_friends__(self, gamespace, account_id, profile_fields):
 
         response = await self.internal.request(
             "social", "get_connections",
@@ -15,9 +30,26 @@ class SocialModel(object):
             gamespace=gamespace,
             profile_fields=profile_fields)
 
-        friends_ids = [
-            user_info["account"]
+        return list({
+            int(user_info["account"])
             for user_info in response
-        ]
+        })
+
+    async def get_friends(self, gamespace, account_id, profile_fields):
+        """
+        :returns: a list of friend account ids
+        """
+
+        key = (int(gamespace), int(account_id))
+
+        friends_ids = self.friends.get(key)
+
+        if friends_ids is not LRUCache.MISSING:
+            return friends_ids
+
+        async def request():
+            result = await self.__request_friends__(gamespace, account_id, profile_fields)
+            self.friends.set(key, result)
+            return result
 
-        return friends_ids
+        return await self.requests.run(key, request)
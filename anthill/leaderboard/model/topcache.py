@@ -0,0 +1,166 @@
+from . cache import LRUCache
+
+import logging
+import ujson
+
+
+class TopCache(object):
+    """
+    Two-tier cache of leaderboard pages: an in-process LRU, backed by a shared key/value storage (Redis),
+        so a page fetched by one process is reused by others.
+
+    Every leaderboard (as well as every gamespace, and the whole service) has a version in the shared storage,
+        bumped upon each write.
+    Pages are cached per version, so a write invalidates all pages of a leaderboard at once,
+        without having to know what pages there are.
+    Versions are remembered in process for `staleness` seconds (configurable per leaderboard name), which
+        is how stale a page can be. With zero staleness, every read checks the versions (a single round trip).
+
+    If no key/value storage is passed, only the in-process tier is used, with versions kept in process.
+    """
+
+    def __init__(self, kv, max_pages, ttl, staleness, leaderboard_staleness=None):
+        self.kv = kv
+        self.ttl = ttl
+        self.staleness = staleness
+        self.leaderboard_staleness = leaderboard_staleness or {}
+        self.pages = LRUCache(max_size=max_pages, ttl=ttl)
+        self.versions = LRUCache(max_size=max_pages, ttl=staleness)
+        self.local_versions = {}
+
+    @staticmethod
+    def parse_staleness(value):
+        """
+        Parses a per-leaderboard staleness option, like "daily:5,@weekly:30"
+        """
+        result = {}
+        for item in filter(None, (value or "").split(",")):
+            name, seconds = item.rsplit(":", 1)
+            result[name.strip()] = int(seconds)
+        return result
+
+    GLOBAL_VERSION_KEY = "lb:version"
+
+    @staticmethod
+    def __gamespace_version_key__(gamespace_id):
+        return "lb:version:{0}".format(gamespace_id)
+
+    @staticmethod
+    def __leaderboard_version_key__(gamespace_id, leaderboard_id):
+        return "lb:version:{0}:{1}".format(gamespace_id, leaderboard_id)
+
+    async def __version__(self, gamespace_id, leaderboard_id, leaderboard_name):
+        gamespace_id, leaderboard_id = int(gamespace_id), int(leaderboard_id)
+
+        if self.kv is None:
+            return (
+                self.local_versions.get(None, 0),
+                self.local_versions.get(gamespace_id, 0),
+                self.local_versions.get((gamespace_id, leaderboard_id), 0))
+
+        version = self.versions.get((gamespace_id, leaderboard_id))
+
+        if version is not LRUCache.MISSING:
+            return version
+
+        async with self.kv.acquire() as kv:
+            versions = await kv.mget(
+                TopCache.GLOBAL_VERSION_KEY,
+                TopCache.__gamespace_version_key__(gamespace_id),
+                TopCache.__leaderboard_version_key__(gamespace_id, leaderboard_id))
+
+        version = tuple(int(v or 0) for v in versions)
+        staleness = self.leaderboard_staleness.get(leaderboard_name, self.staleness)
+
+        if staleness > 0:
+            self.versions.set((gamespace_id, leaderboard_id), version, ttl=staleness)
+
+        return version
+
+    async def get(self, gamespace_id, leaderboard_id, leaderboard_name, cluster_id, sort_order, page, fetch):
+        """
+        :param page: a string identifying a page (offset and limit, or a cursor)
+        :param fetch: a coroutine function to fetch the page with upon cache miss,
+            the result should be JSON-serializable
+        """
+
+        # noinspection PyBroadException
+        try:
+            version = await self.__version__(gamespace_id, leaderboard_id, leaderboard_name)
+        except Exception:
+            logging.exception("Failed to get leaderboard version, skipping the cache")
+            return await fetch()
+
+        key = "lb:page:{0}:{1}:{2}:{3}:{4}:{5}".format(
+            gamespace_id, leaderboard_id, cluster_id, sort_order, page, ".".join(map(str, version)))
+
+        result = self.pages.get(key)
+
+        if result is not LRUCache.MISSING:
+            return result
+
+        if self.kv is not None:
+            # noinspection PyBroadException
+            try:
+                async with self.kv.acquire() as kv:
+                    cached = await kv.get(key)
+            except Exception:
+                logging.exception("Failed to get a cached page")
+                cached = None
+
+            if cached is not None:
+                result = ujson.loads(cached)
+                self.pages.set(key, result)
+                return result
+
+        result = await fetch()
+        self.pages.set(key, result)
+
+        if self.kv is not None:
+            # noinspection PyBroadException
+            try:
+                async with self.kv.acquire() as kv:
+                    await kv.setex(key, self.ttl, ujson.dumps(result))
+            except Exception:
+                logging.exception("Failed to cache a page")
+
+        return result
+
+    async def __bump__(self, key, local_key):
+        self.local_versions[local_key] = self.local_versions.get(local_key, 0) + 1
+
+        # this process sees its own writes right away
+        if local_key is None:
+            self.versions.clear()
+        elif isinstance(local_key, tuple):
+            self.versions.pop(local_key)
+        else:
+            self.versions.pop_if(lambda k, v: k[0] == local_key)
+
+        if self.kv is None:
+            return
+
+        # noinspection PyBroadException
+        try:
+            async with self.kv.acquire() as kv:
+                await kv.incr(key)
+        except Exception:
+            logging.exception("Failed to invalidate cached pages")
+
+    async def invalidate_leaderboard(self, gamespace_id, leaderboard_id):
+        gamespace_id, leaderboard_id = int(gamespace_id), int(leaderboard_id)
+        await self.__bump__(
+            TopCache.__leaderboard_version_key__(gamespace_id, leaderboard_id),
+            (gamespace_id, leaderboard_id))
+
+    async def invalidate_gamespace(self, gamespace_id):
+        """
+        Invalidates every leaderboard of a gamespace, or of every gamespace if gamespace_id is None
+        """
+
+        if gamespace_id is None:
+            await self.__bump__(TopCache.GLOBAL_VERSION_KEY, None)
+            return
+
+        gamespace_id = int(gamespace_id)
+        await self.__bump__(TopCache.__gamespace_version_key__(gamespace_id), gamespace_id)
@@ -0,0 +1,221 @@
+from tornado.ioloop import PeriodicCallback, IOLoop
+
+import asyncio
+import logging
+
+
+class WriteBehindFull(Exception):
+    pass
+
+
+class PendingRecord(object):
+    __slots__ = ("account_id", "display_name", "score", "time_to_live", "profile", "attempts")
+
+    def __init__(self, account_id, display_name, score, time_to_live, profile):
+        self.account_id = account_id
+        self.display_name = display_name
+        self.score = score
+        self.time_to_live = time_to_live
+        self.profile = profile
+        # failed writes of it so far
+        self.attempts = 0
+
+
+class WriteBehindBoard(object):
+    """
+    A destination of the pending records: a cluster of a leaderboard, with its update policy.
+    """
+
+    __slots__ = ("gamespace_id", "leaderboard_id", "leaderboard_name", "cluster_id", "policy", "sort_order")
+
+    def __init__(self, gamespace_id, leaderboard_id, leaderboard_name, cluster_id, policy, sort_order):
+        self.gamespace_id = gamespace_id
+        self.leaderboard_id = leaderboard_id
+        self.leaderboard_name = leaderboard_name
+        self.cluster_id = cluster_id
+        self.policy = policy
+        self.sort_order = sort_order
+
+    def key(self):
+        return int(self.gamespace_id), int(self.leaderboard_id), int(self.cluster_id)
+
+    def coalesce(self, pending, record):
+        """
+        Merges a new record into a pending one of the same account, exactly like the database would
+        """
+        if self.policy == "increment":
+            record.score += pending.score
+        elif self.policy == "best":
+            better = record.score > pending.score if self.sort_order == "desc" else record.score < pending.score
+            if not better:
+                return pending
+        return record
+
+
+class WriteBehindBuffer(object):
+    """
+    Keeps score submissions in memory, coalescing submissions of the same account into the same leaderboard,
+        and writes them into the database in batches, every `interval` milliseconds or as soon
+        as `batch_size` records are pending, whatever comes first.
+
+    When `max_pending` records are pending, new submissions wait for a flush to complete,
+        and are rejected with WriteBehindFull if that did not help.
+
+    If a batch fails to be written, its records are put back into the buffer, merged with the ones submitted
+        since, and go with the next flush. A record that failed `max_retries` times is logged and dropped.
+    """
+
+    def __init__(self, writer, interval, batch_size, max_pending, max_retries):
+        """
+        :param writer: a coroutine function (board, list of PendingRecord) writing the records
+        """
+        self.writer = writer
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+
+        # board key -> (WriteBehindBoard, {account_id -> PendingRecord})
+        self.boards = {}
+        self.pending = 0
+        self.flushing = None
+        self.periodic = None
+
+        self.submitted = 0
+        self.coalesced = 0
+        self.written = 0
+        self.retried = 0
+        self.failed = 0
+        self.rejected = 0
+        self.flushes = 0
+
+    def start(self):
+        self.periodic = PeriodicCallback(
+            lambda: IOLoop.current().spawn_callback(self.flush), self.interval)
+        self.periodic.start()
+
+    async def stop(self):
+        if self.periodic is not None:
+            self.periodic.stop()
+            self.periodic = None
+        # the records that failed are retried until written or dropped
+        while self.boards:
+            await self.flush()
+
+    def stats(self):
+        return {
+            "pending": self.pending,
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "written": self.written,
+            "retried": self.retried,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "flushes": self.flushes
+        }
+
+    async def add(self, board, record):
+        key = board.key()
+        account_id = int(record.account_id)
+
+        existing = self.boards.get(key)
+        if existing is None or account_id not in existing[1]:
+            if self.pending >= self.max_pending:
+                await self.flush()
+                if self.pending >= self.max_pending:
+                    self.rejected += 1
+                    raise WriteBehindFull()
+            existing = self.boards.get(key)
+
+        self.submitted += 1
+
+        if existing is None:
+            existing = (board, {})
+            self.boards[key] = existing
+
+        records = existing[1]
+        pending = records.get(account_id)
+
+        if pending is None:
+            records[account_id] = record
+            self.pending += 1
+        else:
+            records[account_id] = board.coalesce(pending, record)
+            self.coalesced += 1
+
+        if self.pending >= self.batch_size and self.flushing is None:
+            IOLoop.current().spawn_callback(self.flush)
+
+    async def flush(self):
+        if self.flushing is not None:
+            await asyncio.shield(self.flushing)
+            return
+
+        if not self.boards:
+            return
+
+        self.flushing = asyncio.get_event_loop().create_future()
+        boards, self.boards, self.pending = self.boards, {}, 0
+
+        try:
+            for board, records in boards.values():
+                records = list(records.values())
+                for offset in range(0, len(records), self.batch_size):
+                    batch = records[offset:offset + self.batch_size]
+                    # noinspection PyBroadException
+                    try:
+                        await self.writer(board, batch)
+                    except Exception:
+                        logging.exception("Failed to write {0} pending records".format(len(batch)))
+                        self.__retry__(board, batch)
+                    else:
+                        self.written += len(batch)
+            self.flushes += 1
+        finally:
+            flushing, self.flushing = self.flushing, None
+            flushing.set_result(True)
+
+    def __retry__(self, board, batch):
+        """
+        Puts the records of a failed batch back, under the records of the same accounts submitted since
+        """
+
+        key = board.key()
+        existing = self.boards.get(key)
+
+        if existing is None:
+            existing = (board, {})
+            self.boards[key] = existing
+
+        board, records = existing
+        dropped = 0
+
+        for record in batch:
+            record.attempts += 1
+
+            if record.attempts > self.max_retries:
+                dropped += 1
+                continue
+
+            account_id = int(record.account_id)
+            newer = records.get(account_id)
+
+            if newer is None:
+                records[account_id] = record
+                self.pending += 1
+            else:
+                merged = board.coalesce(record, newer)
+                if board.policy == "increment":
+                    # the increments that failed are still in it
+                    merged.attempts = record.attempts
+                records[account_id] = merged
+
+            self.retried += 1
+
+        if dropped:
+            logging.error("Dropped {0} pending records that failed to be written {1} times".format(
+                dropped, self.max_retries + 1))
+            self.failed += dropped
+
+        if not records:
+            del self.boards[key]
@@ -40,6 +40,58 @@ define("db_name",
        type=str,
        help="MySQL database name")
 
+# Regular cache
+
+define("cache_host",
+       default="127.0.0.1",
+       help="Location of a regular cache (redis).",
+       group="cache",
+       type=str)
+
+define("cache_port",
+       default=6379,
+       help="Port of regular cache (redis).",
+       group="cache",
+       type=int)
+
+define("cache_db",
+       default=10,
+       help="Database of regular cache (redis).",
+       group="cache",
+       type=int)
+
+define("cache_max_connections",
+       default=500,
+       help="Maximum connections to the regular cache (connection pool).",
+       group="cache",
+       type=int)
+
+# Ranking storage (redis storage engine)
+
+define("ranking_host",
+       default="127.0.0.1",
+       help="Location of a ranking storage (redis), used by the redis storage engine.",
+       group="ranking",
+       type=str)
+
+define("ranking_port",
+       default=6379,
+       help="Port of the ranking storage (redis).",
+       group="ranking",
+       type=int)
+
+define("ranking_db",
+       default=11,
+       help="Database of the ranking storage (redis).",
+       group="ranking",
+       type=int)
+
+define("ranking_max_connections",
+       default=500,
+       help="Maximum connections to the ranking storage (connection pool).",
+       group="ranking",
+       type=int)
+
 # Leaderboard
 
 define("default_limit",
@@ -53,3 +105,377 @@ define("cluster_size",
        type=int,
        group="leaderboard",
        help="Cluster size to group users around")
+
+define("rank_index",
+       default=False,
+       type=bool,
+       group="leaderboard",
+       help="Keep an in-memory rank index for each leaderboard, so reads are served without sorting in MySQL")
+
+define("rank_index_max_records",
+       default=100000,
+       type=int,
+       group="leaderboard",
+       help="Leaderboards (or clusters) with more records than this are not kept in the rank index")
+
+define("rank_index_max_boards",
+       default=256,
+       type=int,
+       group="leaderboard",
+       help="Maximum amount of leaderboards (or clusters) kept in the rank index at once")
+
+define("rank_index_ttl",
+       default=60,
+       type=int,
+       group="leaderboard",
+       help="Seconds after which a rank index is reloaded from the database, to catch up with other processes")
+
+define("rank_index_too_big_ttl",
+       default=600,
+       type=int,
+       group="leaderboard",
+       help="Seconds a leaderboard (or a cluster) found too big for the rank index is not checked again")
+
+define("leaderboard_cache_size",
+       default=10000,
+       type=int,
+       group="leaderboard",
+       help="Maximum amount of leaderboard names to keep resolved in memory")
+
+define("leaderboard_cache_ttl",
+       default=300,
+       type=int,
+       group="leaderboard",
+       help="Seconds a resolved leaderboard name is kept in memory")
+
+define("largest_leaderboards_cache_ttl",
+       default=300,
+       type=int,
+       group="leaderboard",
+       help="Seconds the largest leaderboards of a gamespace (that are counted over every record of it) are kept")
+
+define("cluster_cache_size",
+       default=100000,
+       type=int,
+       group="leaderboard",
+       help="Maximum amount of account cluster assignments (of clustered leaderboards) to keep in memory")
+
+define("cluster_cache_ttl",
+       default=300,
+       type=int,
+       group="leaderboard",
+       help="Seconds an account cluster assignment is kept in memory")
+
+define("leaderboard_cache_negative_ttl",
+       default=5,
+       type=int,
+       group="leaderboard",
+       help="Seconds a missing leaderboard is remembered as missing")
+
+define("leaderboard_cache_shared",
+       default=True,
+       type=bool,
+       group="leaderboard",
+       help="Keep versions of the resolved leaderboards in the cache storage (see cache_host), so a leaderboard "
+            "deleted by an instance of the service is not resolved by the others from their memory")
+
+define("leaderboard_cache_version_ttl",
+       default=5,
+       type=int,
+       group="leaderboard",
+       help="Seconds a version of the resolved leaderboards of a gamespace is kept in memory, that is, "
+            "how long a deleted leaderboard can be resolved by the other instances")
+
+define("write_behind",
+       default=False,
+       type=bool,
+       group="leaderboard",
+       help="Buffer posted scores in memory and write them in batches, coalescing posts of the same account")
+
+define("write_behind_interval",
+       default=200,
+       type=int,
+       group="leaderboard",
+       help="Milliseconds between flushes of the write-behind buffer")
+
+define("write_behind_batch_size",
+       default=500,
+       type=int,
+       group="leaderboard",
+       help="Maximum records in a single batched write, a flush is also triggered once that many are pending")
+
+define("write_behind_max_pending",
+       default=100000,
+       type=int,
+       group="leaderboard",
+       help="Maximum records pending in the write-behind buffer, posts are rejected with 503 beyond that")
+
+define("write_behind_max_retries",
+       default=10,
+       type=int,
+       group="leaderboard",
+       help="Times a pending record that failed to be written is retried with the next flushes, before it's dropped")
+
+define("records_expiration",
+       default=True,
+       type=bool,
+       group="leaderboard",
+       help="Delete expired records in the service (only one instance does at a time)")
+
+define("records_expiration_interval",
+       default=60,
+       type=int,
+       group="leaderboard",
+       help="Seconds between looking for expired records")
+
+define("records_expiration_batch_size",
+       default=500,
+       type=int,
+       group="leaderboard",
+       help="Expired records deleted by a single statement")
+
+define("records_expiration_rate",
+       default=5000,
+       type=int,
+       group="leaderboard",
+       help="Maximum expired records deleted per second")
+
+define("friends_cache_size",
+       default=10000,
+       type=int,
+       group="leaderboard",
+       help="Maximum friend lists of accounts cached in process")
+
+define("friends_cache_ttl",
+       default=60,
+       type=int,
+       group="leaderboard",
+       help="Seconds a friend list of an account is cached for")
+
+define("friends_chunk_size",
+       default=500,
+       type=int,
+       group="leaderboard",
+       help="Maximum friends looked up with a single query, bigger friend lists are looked up in chunks")
+
+define("ranks_max_accounts",
+       default=1000,
+       type=int,
+       group="leaderboard",
+       help="Maximum accounts to get the ranks of with a single request")
+
+define("read_coalescing",
+       default=True,
+       type=bool,
+       group="leaderboard",
+       help="Concurrent reads of the same top page (or leaderboard) share a single query")
+
+define("score_sketch_max_boards",
+       default=100,
+       type=int,
+       group="leaderboard",
+       help="Maximum leaderboards to keep score sketches of (for percentiles) in process")
+
+define("score_sketch_ttl",
+       default=300,
+       type=int,
+       group="leaderboard",
+       help="Seconds after which a score sketch is rebuilt from the records")
+
+define("accounts_deletion_chunk_size",
+       default=500,
+       type=int,
+       group="leaderboard",
+       help="Deleted accounts whose records are deleted at a time")
+
+define("accounts_deletion_rate",
+       default=2000,
+       type=int,
+       group="leaderboard",
+       help="Maximum deleted accounts whose records are deleted per second")
+
+define("accounts_deletion_interval",
+       default=60,
+       type=int,
+       group="leaderboard",
+       help="Seconds between looking for interrupted account deletions to resume")
+
+define("period_rotation_interval",
+       default=3600,
+       type=int,
+       group="leaderboard",
+       help="Seconds between rotations of the partitions of periodic leaderboards")
+
+define("period_partition_days",
+       default=1,
+       type=int,
+       group="leaderboard",
+       help="Days of expiry a partition of periodic leaderboards goes for, the records of the periods "
+            "expire a partition at a time")
+
+define("snapshot_batch_size",
+       default=1000,
+       type=int,
+       group="leaderboard",
+       help="Records copied (or deleted) at a time when a leaderboard snapshot is created (or deleted)")
+
+define("snapshot_ttl",
+       default=2592000,
+       type=int,
+       group="leaderboard",
+       help="Seconds a leaderboard snapshot is kept for, unless specified upon creation")
+
+define("snapshots_max_per_leaderboard",
+       default=10,
+       type=int,
+       group="leaderboard",
+       help="Maximum snapshots kept of a leaderboard, older ones are deleted")
+
+define("snapshots_cleanup_interval",
+       default=3600,
+       type=int,
+       group="leaderboard",
+       help="Seconds between deletions of expired leaderboard snapshots")
+
+define("top_cache",
+       default=False,
+       type=bool,
+       group="leaderboard",
+       help="Cache pages of top records in memory and in the regular cache, invalidated upon writes")
+
+define("top_cache_size",
+       default=1000,
+       type=int,
+       group="leaderboard",
+       help="Maximum amount of top pages kept in memory")
+
+define("top_cache_ttl",
+       default=60,
+       type=int,
+       group="leaderboard",
+       help="Seconds a top page is cached for, at most")
+
+define("top_cache_staleness",
+       default=1,
+       type=int,
+       group="leaderboard",
+       help="Seconds a cached top page may stay stale after a write, zero to check for writes upon every read")
+
+define("top_cache_leaderboards",
+       default="",
+       type=str,
+       group="leaderboard",
+       help="Staleness of particular leaderboards, overriding top_cache_staleness, like \"daily:5,@weekly:30\"")
+
+define("storage_engine",
+       default="mysql",
+       type=str,
+       group="leaderboard",
+       help="Default storage engine of leaderboard records: mysql, or redis (sorted sets)")
+
+define("storage_engine_gamespaces",
+       default="",
+       type=str,
+       group="leaderboard",
+       help="Storage engines of particular gamespaces, overriding storage_engine, like \"1:redis,5:redis\"")
+
+define("storage_engine_leaderboards",
+       default="",
+       type=str,
+       group="leaderboard",
+       help="Storage engines of particular leaderboard names, overriding the others, like \"daily:redis\"")
+
+define("storage_engine_write_through",
+       default=True,
+       type=bool,
+       group="leaderboard",
+       help="Also write the records of the redis storage engine into MySQL, to load them from after a loss")
+
+define("clusters_top_limit",
+       default=1000,
+       type=int,
+       group="leaderboard",
+       help="Default amount of top records of each cluster, when listing many clusters at once")
+
+define("clusters_page_size",
+       default=100,
+       type=int,
+       group="leaderboard",
+       help="Default amount of clusters in a page, when walking through clusters of a leaderboard")
+
+define("clusters_concurrency",
+       default=8,
+       type=int,
+       group="leaderboard",
+       help="Maximum concurrent queries when listing many clusters (or chunks of accounts) at once")
+
+define("records_shards",
+       default="",
+       type=str,
+       group="leaderboard",
+       help="More databases to split the records over, like \"eu1=10.0.0.5/leaderboard,eu2=10.0.0.6/leaderboard\", "
+            "accessed with the credentials of the main one")
+
+define("records_shards_placement",
+       default="",
+       type=str,
+       group="leaderboard",
+       help="Shards new leaderboards are placed on, like \"main,eu1,eu2\" (the main database is 'main'), "
+            "every shard if empty")
+
+define("shard_move_batch_size",
+       default=1000,
+       type=int,
+       group="leaderboard",
+       help="Records copied (or deleted) by a single statement, when a leaderboard is moved into another shard")
+
+define("shard_move_rate",
+       default=5000,
+       type=int,
+       group="leaderboard",
+       help="Maximum records copied per second, when a leaderboard is moved into another shard")
+
+define("shard_move_interval",
+       default=60,
+       type=int,
+       group="leaderboard",
+       help="Seconds between looking for interrupted moves of leaderboards into another shard to resume")
+
+define("db_replicas",
+       default="",
+       type=str,
+       group="leaderboard",
+       help="Read replicas of the databases, like \"main=10.0.0.7/leaderboard,eu1=10.0.1.7/leaderboard\" "
+            "(of the main database, and of the shards), accessed with the credentials of the main one")
+
+define("replica_lag_interval",
+       default=1,
+       type=int,
+       group="leaderboard",
+       help="Seconds between measurements of the replica lag")
+
+define("replica_max_lag",
+       default=5,
+       type=int,
+       group="leaderboard",
+       help="Seconds a replica may fall behind before it's taken out of rotation, more than replica_lag_interval")
+
+define("read_your_writes_window",
+       default=10,
+       type=int,
+       group="leaderboard",
+       help="Seconds an account that has just written is only served by the replicas that have its write "
+            "(by the primary if there's none)")
+
+define("read_your_writes_max_accounts",
+       default=100000,
+       type=int,
+       group="leaderboard",
+       help="Maximum accounts that have just written kept in memory")
+
+define("read_your_writes_shared",
+       default=False,
+       type=bool,
+       group="leaderboard",
+       help="Remember the accounts that have just written in the cache storage (see cache_host) as well, "
+            "so they read their writes on every instance of the service")
@@ -1,11 +1,14 @@
 
 from anthill.common.options import options
-from anthill.common import server, discover, database, access, sign, keyvalue
+from anthill.common import server, discover, access, sign, keyvalue
 
 from . import handler as h
 from . import admin
 from . model.leaderboard import LeaderboardsModel
 from . model.social import SocialModel
+from . model.metrics import Metrics, MeasuredDatabase
+from . model.shards import parse_shards
+from . model.replicas import parse_replicas
 from . import options as _opts
 
 
@@ -14,13 +17,58 @@ class LeaderboardServer(server.Server):
     def __init__(self):
         super(LeaderboardServer, self).__init__()
 
-        self.db = database.Database(
+        self.metrics = Metrics()
+
+        self.db = MeasuredDatabase(
+            self.metrics,
             host=options.db_host,
             database=options.db_name,
             user=options.db_username,
             password=options.db_password)
 
-        self.leaderboards = LeaderboardsModel(self.db)
+        # databases the records are split over, besides the main one
+        self.shards = {
+            name: MeasuredDatabase(
+                self.metrics,
+                host=host,
+                database=database,
+                user=options.db_username,
+                password=options.db_password)
+            for name, host, database in parse_shards(options.records_shards)
+        }
+
+        # shard name -> replica name -> read replica of the shard (of the main database, too)
+        self.replicas = {}
+
+        for shard, host, database in parse_replicas(options.db_replicas):
+            self.replicas.setdefault(shard, {})["{0}/{1}".format(host, database)] = MeasuredDatabase(
+                self.metrics,
+                host=host,
+                database=database,
+                user=options.db_username,
+                password=options.db_password)
+
+        if options.top_cache or options.read_your_writes_shared or options.leaderboard_cache_shared:
+            self.cache = keyvalue.KeyValueStorage(
+                host=options.cache_host,
+                port=options.cache_port,
+                db=options.cache_db,
+                max_connections=options.cache_max_connections)
+        else:
+            self.cache = None
+
+        if LeaderboardsModel.ENGINE_REDIS in LeaderboardsModel.engines_used():
+            self.ranking = keyvalue.KeyValueStorage(
+                host=options.ranking_host,
+                port=options.ranking_port,
+                db=options.ranking_db,
+                max_connections=options.ranking_max_connections)
+        else:
+            self.ranking = None
+
+        self.leaderboards = LeaderboardsModel(
+            self.db, cache=self.cache, ranking=self.ranking, metrics=self.metrics, shards=self.shards,
+            replicas=self.replicas)
 
         self.limit = options.default_limit
 
@@ -41,8 +89,13 @@ class LeaderboardServer(server.Server):
 
     def get_handlers(self):
         return [
+            (r"/leaderboard/(asc|desc)/([^/]*)/snapshot/([^/]*)/around", h.LeaderboardSnapshotAroundMeHandler),
+            (r"/leaderboard/(asc|desc)/([^/]*)/snapshot/([^/]*)/rank", h.LeaderboardSnapshotRankHandler),
+            (r"/leaderboard/(asc|desc)/([^/]*)/snapshot/([^/]*)", h.LeaderboardSnapshotHandler),
             (r"/leaderboard/(asc|desc)/(.*)/entry", h.LeaderboardEntryHandler),
             (r"/leaderboard/(asc|desc)/(.*)/around", h.LeaderboardAroundMeHandler),
+            (r"/leaderboard/(asc|desc)/(.*)/percentile", h.LeaderboardPercentileHandler),
+            (r"/leaderboard/(asc|desc)/(.*)/ranks", h.LeaderboardRanksHandler),
             (r"/leaderboard/(asc|desc)/(.*)/friends", h.LeaderboardFriendsHandler),
             (r"/leaderboard/(asc|desc)/([^/]*)", h.LeaderboardTopHandler),
         ]
@@ -57,6 +110,18 @@ class LeaderboardServer(server.Server):
 
         self.social_service = SocialModel()
 
+        # after the models are started, so the schema has the index expired records are looked up with
+        for expiration in self.leaderboards.expirations.values():
+            expiration.start()
+
+        self.leaderboards.snapshots.start()
+        self.leaderboards.deletion.start()
+        self.leaderboards.moves.start()
+        self.leaderboards.rotation.start()
+
+        for pool in self.leaderboards.replicas.values():
+            pool.start()
+
 
 if __name__ == "__main__":
     stt = server.init()
@@ -0,0 +1,13 @@
+CREATE TABLE `leaderboard_deletion_jobs` (
+  `job_id` int(11) unsigned NOT NULL AUTO_INCREMENT,
+  `gamespace_id` int(11) unsigned DEFAULT NULL,
+  `job_status` enum('running','done') NOT NULL DEFAULT 'running',
+  `job_accounts` mediumtext NOT NULL,
+  `job_position` int(11) unsigned NOT NULL DEFAULT '0',
+  `job_total` int(11) unsigned NOT NULL,
+  `job_deleted` json NOT NULL,
+  `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`job_id`),
+  KEY `job_status` (`job_status`,`updated_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
\ No newline at end of file
@@ -0,0 +1,5 @@
+CREATE TABLE `leaderboard_heartbeat` (
+  `heartbeat_id` tinyint(3) unsigned NOT NULL,
+  `heartbeat_at` double NOT NULL,
+  PRIMARY KEY (`heartbeat_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
\ No newline at end of file
@@ -0,0 +1,6 @@
+CREATE TABLE `leaderboard_schema` (
+  `version` int(11) unsigned NOT NULL,
+  `description` varchar(255) NOT NULL,
+  `applied_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`version`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
\ No newline at end of file
@@ -0,0 +1,19 @@
+CREATE TABLE `leaderboard_shard_moves` (
+  `move_id` int(11) unsigned NOT NULL AUTO_INCREMENT,
+  `gamespace_id` int(11) unsigned NOT NULL,
+  `leaderboard_id` int(11) unsigned NOT NULL,
+  `move_source` varchar(32) NOT NULL,
+  `move_target` varchar(32) NOT NULL,
+  `move_status` enum('running','done','failed') NOT NULL DEFAULT 'running',
+  `move_step` enum('mirror','copy','switch','purge') NOT NULL DEFAULT 'mirror',
+  `move_after_account_id` int(11) unsigned DEFAULT NULL,
+  `move_after_cluster_id` int(11) unsigned DEFAULT NULL,
+  `move_copied` int(11) unsigned NOT NULL DEFAULT '0',
+  `move_purged` int(11) unsigned NOT NULL DEFAULT '0',
+  `move_error` varchar(255) DEFAULT NULL,
+  `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`move_id`),
+  KEY `move_status` (`move_status`,`updated_at`),
+  KEY `leaderboard_id` (`leaderboard_id`,`move_status`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
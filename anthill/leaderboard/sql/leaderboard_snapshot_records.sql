@@ -0,0 +1,11 @@
+CREATE TABLE `leaderboard_snapshot_records` (
+  `snapshot_id` int(11) unsigned NOT NULL,
+  `cluster_id` int(11) unsigned NOT NULL DEFAULT '0',
+  `rank` int(11) unsigned NOT NULL,
+  `account_id` int(11) unsigned NOT NULL,
+  `score` float DEFAULT NULL,
+  `display_name` varchar(45) NOT NULL,
+  `profile` json NOT NULL,
+  PRIMARY KEY (`snapshot_id`,`cluster_id`,`rank`),
+  UNIQUE KEY `snapshot_account` (`snapshot_id`,`account_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
\ No newline at end of file
@@ -0,0 +1,13 @@
+CREATE TABLE `leaderboard_snapshots` (
+  `snapshot_id` int(11) unsigned NOT NULL AUTO_INCREMENT,
+  `gamespace_id` int(11) unsigned NOT NULL,
+  `leaderboard_id` int(11) unsigned NOT NULL,
+  `snapshot_name` varchar(64) NOT NULL,
+  `snapshot_status` enum('creating','ready') NOT NULL DEFAULT 'creating',
+  `snapshot_records` int(11) unsigned NOT NULL DEFAULT '0',
+  `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `expire_at` timestamp NULL DEFAULT NULL,
+  PRIMARY KEY (`snapshot_id`),
+  UNIQUE KEY `leaderboard_snapshot` (`gamespace_id`,`leaderboard_id`,`snapshot_name`),
+  KEY `expire_at` (`expire_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
\ No newline at end of file
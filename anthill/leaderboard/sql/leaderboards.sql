@@ -1,7 +1,16 @@
 CREATE TABLE `leaderboards` (
   `leaderboard_id` int(11) unsigned NOT NULL AUTO_INCREMENT,
-  `leaderboard_name` varchar(45) NOT NULL,
+  `leaderboard_name` varchar(64) NOT NULL,
   `gamespace_id` int(11) unsigned NOT NULL,
   `leaderboard_sort_order` enum('asc','desc') NOT NULL DEFAULT 'asc',
-  PRIMARY KEY (`leaderboard_id`)
+  `leaderboard_policy` enum('latest','best','increment') NOT NULL DEFAULT 'latest',
+  `leaderboard_period` enum('none','daily','weekly','monthly') NOT NULL DEFAULT 'none',
+  `leaderboard_period_reset` int(11) unsigned NOT NULL DEFAULT '0',
+  `leaderboard_parent_id` int(11) unsigned DEFAULT NULL,
+  `leaderboard_expire_at` timestamp NULL DEFAULT NULL,
+  `leaderboard_shard` varchar(32) DEFAULT NULL,
+  `leaderboard_shard_mirror` varchar(32) DEFAULT NULL,
+  PRIMARY KEY (`leaderboard_id`),
+  UNIQUE KEY `gamespace_leaderboard` (`gamespace_id`,`leaderboard_name`,`leaderboard_sort_order`),
+  KEY `leaderboard_parent_id` (`leaderboard_parent_id`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8;
\ No newline at end of file
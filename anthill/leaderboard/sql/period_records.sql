@@ -0,0 +1,17 @@
+CREATE TABLE `period_records` (
+  `record_id` int(11) unsigned NOT NULL AUTO_INCREMENT,
+  `account_id` int(11) unsigned NOT NULL,
+  `cluster_id` int(11) unsigned NOT NULL DEFAULT '0',
+  `gamespace_id` int(11) unsigned NOT NULL,
+  `leaderboard_id` int(11) unsigned NOT NULL,
+  `period_expire_day` int(11) unsigned NOT NULL,
+  `expire_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  `score` float DEFAULT NULL,
+  `display_name` varchar(45) NOT NULL,
+  `profile` json NOT NULL,
+  PRIMARY KEY (`record_id`,`period_expire_day`),
+  UNIQUE KEY `account_record` (`gamespace_id`,`leaderboard_id`,`account_id`,`cluster_id`,`period_expire_day`),
+  KEY `leaderboard_rank` (`gamespace_id`,`leaderboard_id`,`cluster_id`,`score`,`account_id`),
+  KEY `account_id` (`account_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8
+PARTITION BY RANGE (`period_expire_day`) (PARTITION `pmax` VALUES LESS THAN MAXVALUE);
\ No newline at end of file
@@ -1,7 +1,7 @@
 CREATE TABLE `records` (
   `record_id` int(11) unsigned NOT NULL AUTO_INCREMENT,
   `account_id` int(11) unsigned NOT NULL,
-  `cluster_id` int(11) unsigned DEFAULT NULL,
+  `cluster_id` int(11) unsigned NOT NULL DEFAULT '0',
   `gamespace_id` int(11) unsigned NOT NULL,
   `leaderboard_id` int(11) unsigned NOT NULL,
   `expire_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
@@ -9,8 +9,10 @@ CREATE TABLE `records` (
   `display_name` varchar(45) NOT NULL,
   `profile` json NOT NULL,
   PRIMARY KEY (`record_id`),
+  UNIQUE KEY `account_record` (`gamespace_id`,`leaderboard_id`,`account_id`,`cluster_id`),
   KEY `leaderboard_id` (`leaderboard_id`),
-  KEY `score` (`score`),
-  KEY `cluster_id` (`cluster_id`),
+  KEY `leaderboard_rank` (`gamespace_id`,`leaderboard_id`,`cluster_id`,`score`,`account_id`),
+  KEY `expire_at` (`expire_at`),
+  KEY `account_id` (`account_id`),
   CONSTRAINT `leaderboard_id` FOREIGN KEY (`leaderboard_id`) REFERENCES `leaderboards` (`leaderboard_id`) ON DELETE NO ACTION ON UPDATE NO ACTION
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8;
\ No newline at end of file
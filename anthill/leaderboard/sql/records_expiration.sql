@@ -1,6 +0,0 @@
-CREATE EVENT `records_expiration`
-ON SCHEDULE EVERY 5 MINUTE STARTS CURRENT_TIMESTAMP
-DO
-   DELETE
-   FROM `records`
-   WHERE `records`.`expire_at` < NOW();
\ No newline at end of file
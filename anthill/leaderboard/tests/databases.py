@@ -0,0 +1,57 @@
+"""
+Databases the tests run against. Every test that needs one is skipped unless it's configured:
+
+    LEADERBOARD_TEST_MYSQL      host/database of a MySQL database the tests may wipe, like "127.0.0.1/test"
+    LEADERBOARD_TEST_MYSQL_USER, LEADERBOARD_TEST_MYSQL_PASSWORD
+                                credentials of it, "root" with no password by default
+    LEADERBOARD_TEST_REDIS      host:port/db of a Redis database the tests may wipe, like "127.0.0.1:6379/15"
+"""
+
+from anthill.common.database import Database
+from anthill.common.keyvalue import KeyValueStorage
+
+import os
+import unittest
+
+
+MYSQL = os.environ.get("LEADERBOARD_TEST_MYSQL")
+REDIS = os.environ.get("LEADERBOARD_TEST_REDIS")
+
+SQL_ROOT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sql")
+
+skip_without_mysql = unittest.skipUnless(MYSQL, "LEADERBOARD_TEST_MYSQL is not set")
+skip_without_redis = unittest.skipUnless(REDIS, "LEADERBOARD_TEST_REDIS is not set")
+
+
+def mysql():
+    host, _, database = MYSQL.partition("/")
+    return Database(
+        host=host,
+        database=database,
+        user=os.environ.get("LEADERBOARD_TEST_MYSQL_USER", "root"),
+        password=os.environ.get("LEADERBOARD_TEST_MYSQL_PASSWORD", ""))
+
+
+def redis():
+    location, _, db = REDIS.partition("/")
+    host, _, port = location.partition(":")
+    return KeyValueStorage(host=host, port=int(port or 6379), db=int(db or 0), max_connections=16)
+
+
+async def create_tables(db, tables):
+    """
+    Creates the tables (dropped first, if any) as of /sql, in order, so a table referenced goes first
+    """
+
+    async with db.acquire() as conn:
+        await conn.execute("SET FOREIGN_KEY_CHECKS=0;")
+
+        try:
+            for table in tables:
+                with open(os.path.join(SQL_ROOT, table + ".sql")) as f:
+                    sql = f.read()
+
+                await conn.execute("DROP TABLE IF EXISTS `{0}`;".format(table))
+                await conn.execute(sql)
+        finally:
+            await conn.execute("SET FOREIGN_KEY_CHECKS=1;")
@@ -0,0 +1,476 @@
+import pytest
+
+pytest.importorskip("tornado")
+pytest.importorskip("aioredis")
+pytest.importorskip("anthill.common")
+
+from tornado.testing import AsyncTestCase, gen_test
+
+from anthill.leaderboard.model.leaderboard import LeaderboardAdapter
+from anthill.leaderboard.model.engine import StorageError, encode_profile
+from anthill.leaderboard.model.engine.mysql import MySQLEngine
+from anthill.leaderboard.model.engine.redis import RedisEngine
+from anthill.leaderboard.model.rank import RankIndexes
+from anthill.leaderboard.model.writebehind import PendingRecord
+from anthill.leaderboard.tests import databases
+
+from unittest import mock
+
+import itertools
+import ujson
+
+
+GAMESPACE = 1
+OTHER_GAMESPACE = 2
+TIME_TO_LIVE = 3600
+
+
+def ranked(records):
+    """
+    :returns: a list of (rank, account_id, score) of ranked records, to compare with
+    """
+    return [
+        (rank, int(record["account_id"]), float(record["score"]))
+        for rank, record in records
+    ]
+
+
+class EngineContract(object):
+    """
+    What every StorageEngine has to do the same way, so a leaderboard ranks the same no matter the engine.
+    Test cases of the engines provide the engine (create_engine) and the leaderboards (create_leaderboard).
+    """
+
+    def setUp(self):
+        super(EngineContract, self).setUp()
+        self.names = itertools.count(1)
+        self.engine = self.io_loop.run_sync(self.create_engine)
+
+    def tearDown(self):
+        self.io_loop.run_sync(self.close)
+        super(EngineContract, self).tearDown()
+
+    async def create_engine(self):
+        raise NotImplementedError()
+
+    async def create_leaderboard(self, gamespace_id, leaderboard_name, sort_order, policy):
+        """
+        :returns: an id of a new leaderboard
+        """
+        raise NotImplementedError()
+
+    async def close(self):
+        pass
+
+    async def leaderboard(self, sort_order="desc", policy="latest", clustered=False, gamespace_id=GAMESPACE):
+        leaderboard_name = "{0}test_{1}".format("@" if clustered else "", next(self.names))
+        leaderboard_id = await self.create_leaderboard(gamespace_id, leaderboard_name, sort_order, policy)
+
+        return LeaderboardAdapter({
+            "leaderboard_id": leaderboard_id,
+            "leaderboard_name": leaderboard_name,
+            "leaderboard_sort_order": sort_order,
+            "leaderboard_policy": policy
+        })
+
+    async def post(self, leaderboard, account_id, score, cluster_id=0, gamespace_id=GAMESPACE):
+        return await self.engine.insert_record(
+            gamespace_id, leaderboard, cluster_id, account_id,
+            "player {0}".format(account_id), score, TIME_TO_LIVE, encode_profile({"account": account_id}))
+
+    async def top(self, leaderboard, cluster_id=0, offset=0, limit=100, after=None, gamespace_id=GAMESPACE):
+        return ranked(await self.engine.list_top(gamespace_id, leaderboard, cluster_id, offset, limit, after=after))
+
+    async def score(self, leaderboard, account_id, cluster_id=0, gamespace_id=GAMESPACE):
+        return await self.engine.get_score(gamespace_id, leaderboard, cluster_id, account_id)
+
+    @gen_test
+    async def test_latest_policy(self):
+        leaderboard = await self.leaderboard(policy="latest")
+
+        self.assertTrue(await self.post(leaderboard, 1, 100))
+        self.assertTrue(await self.post(leaderboard, 1, 50))
+
+        self.assertEqual(await self.score(leaderboard, 1), 50)
+        self.assertEqual(await self.top(leaderboard), [(1, 1, 50)])
+
+    @gen_test
+    async def test_best_policy(self):
+        for sort_order, better, worse in (("desc", 150, 50), ("asc", 50, 150)):
+            leaderboard = await self.leaderboard(sort_order=sort_order, policy="best")
+
+            self.assertTrue(await self.post(leaderboard, 1, 100))
+            self.assertFalse(await self.post(leaderboard, 1, worse))
+            self.assertEqual(await self.score(leaderboard, 1), 100)
+
+            self.assertTrue(await self.post(leaderboard, 1, better))
+            self.assertEqual(await self.score(leaderboard, 1), better)
+
+    @gen_test
+    async def test_increment_policy(self):
+        leaderboard = await self.leaderboard(policy="increment")
+
+        self.assertTrue(await self.post(leaderboard, 1, 10))
+        self.assertTrue(await self.post(leaderboard, 1, 5))
+
+        self.assertEqual(await self.score(leaderboard, 1), 15)
+        self.assertEqual(await self.top(leaderboard), [(1, 1, 15)])
+
+    @gen_test
+    async def test_write_records(self):
+        def pending(account_id, score):
+            return PendingRecord(account_id, "player {0}".format(account_id), score, TIME_TO_LIVE, "{}")
+
+        increment = await self.leaderboard(policy="increment")
+
+        await self.engine.write_records(GAMESPACE, increment, 0, [pending(1, 10), pending(2, 3)])
+        await self.engine.write_records(GAMESPACE, increment, 0, [pending(1, 5)])
+
+        self.assertEqual(await self.top(increment), [(1, 1, 15), (2, 2, 3)])
+
+        best = await self.leaderboard(policy="best")
+
+        await self.engine.write_records(GAMESPACE, best, 0, [pending(1, 10), pending(2, 3)])
+        await self.engine.write_records(GAMESPACE, best, 0, [pending(1, 5), pending(2, 7)])
+
+        self.assertEqual(await self.top(best), [(1, 1, 10), (2, 2, 7)])
+
+    @gen_test
+    async def test_record(self):
+        leaderboard = await self.leaderboard()
+        await self.post(leaderboard, 1, 10)
+
+        records = await self.engine.list_top(GAMESPACE, leaderboard, 0, 0, 10)
+
+        self.assertEqual(len(records), 1)
+        rank, record = records[0]
+
+        self.assertEqual(rank, 1)
+        self.assertEqual(record["display_name"], "player 1")
+        self.assertEqual(ujson.loads(record["profile"]), {"account": 1})
+
+    @gen_test
+    async def test_ties(self):
+        for sort_order, expected in (
+                ("desc", [(1, 5, 20), (2, 4, 10), (3, 3, 10), (4, 2, 10), (5, 1, 10)]),
+                ("asc", [(1, 1, 10), (2, 2, 10), (3, 3, 10), (4, 4, 10), (5, 5, 20)])):
+
+            leaderboard = await self.leaderboard(sort_order=sort_order)
+
+            for account_id in (3, 1, 4, 2):
+                await self.post(leaderboard, account_id, 10)
+            await self.post(leaderboard, 5, 20)
+
+            # equal scores are ordered by account id, in the sort order too
+            self.assertEqual(await self.top(leaderboard), expected)
+
+    @gen_test
+    async def test_ranks_at_offset(self):
+        leaderboard = await self.leaderboard()
+
+        for account_id in range(1, 11):
+            await self.post(leaderboard, account_id, account_id * 10)
+
+        top = await self.top(leaderboard)
+
+        self.assertEqual([rank for rank, account_id, score in top], list(range(1, 11)))
+        self.assertEqual(top[0], (1, 10, 100))
+        self.assertEqual(await self.top(leaderboard, offset=3, limit=4), top[3:7])
+        self.assertEqual(await self.top(leaderboard, offset=20, limit=4), [])
+
+    @gen_test
+    async def test_cursor_pages(self):
+        for sort_order in ("desc", "asc"):
+            leaderboard = await self.leaderboard(sort_order=sort_order)
+
+            # ties span the pages
+            for account_id, score in enumerate([5, 5, 5, 4, 4, 3, 3, 3, 3, 2, 1.5], start=1):
+                await self.post(leaderboard, account_id, score)
+
+            top = await self.top(leaderboard)
+            pages = []
+            after = None
+
+            while True:
+                page = await self.top(leaderboard, limit=3, after=after)
+                pages.extend(page)
+
+                if len(page) < 3:
+                    break
+
+                rank, account_id, score = page[-1]
+                after = (score, account_id, rank)
+
+            self.assertEqual(pages, top)
+
+    @gen_test
+    async def test_around(self):
+        leaderboard = await self.leaderboard()
+
+        for account_id in range(1, 10):
+            await self.post(leaderboard, account_id, account_id * 10)
+
+        top = await self.top(leaderboard)
+
+        for cluster_id in (0, None):
+            around = await self.engine.list_around(GAMESPACE, leaderboard, cluster_id, 5, 0, 5)
+            self.assertEqual(ranked(around), top[2:7])
+
+        # the top one has nobody above
+        around = await self.engine.list_around(GAMESPACE, leaderboard, 0, 9, 0, 5)
+        self.assertEqual(ranked(around), top[0:5])
+
+        around = await self.engine.list_around(GAMESPACE, leaderboard, 0, 5, 1, 5)
+        self.assertEqual(ranked(around), top[3:7])
+
+        self.assertIsNone(await self.engine.list_around(GAMESPACE, leaderboard, 0, 100, 0, 5))
+        self.assertIsNone(await self.engine.list_around(GAMESPACE, leaderboard, None, 100, 0, 5))
+
+    @gen_test
+    async def test_list_accounts(self):
+        leaderboard = await self.leaderboard()
+
+        for account_id in range(1, 7):
+            await self.post(leaderboard, account_id, account_id * 10)
+
+        top = await self.top(leaderboard)
+        expected = [entry for entry in top if entry[1] in (2, 4, 6)]
+
+        records = await self.engine.list_accounts(GAMESPACE, leaderboard, [2, 4, 6, 100], 0, 10)
+        self.assertEqual(ranked(records), expected)
+
+        records = await self.engine.list_accounts(GAMESPACE, leaderboard, [2, 4, 6, 100], 1, 1)
+        self.assertEqual(ranked(records), expected[1:2])
+
+    @gen_test
+    async def test_clusters(self):
+        leaderboard = await self.leaderboard(clustered=True)
+
+        for account_id, cluster_id, score in ((1, 1, 10), (2, 1, 20), (3, 1, 30), (4, 2, 5), (5, 2, 50)):
+            await self.post(leaderboard, account_id, score, cluster_id=cluster_id)
+
+        # each cluster is ranked on its own
+        self.assertEqual(await self.top(leaderboard, cluster_id=1), [(1, 3, 30), (2, 2, 20), (3, 1, 10)])
+        self.assertEqual(await self.top(leaderboard, cluster_id=2), [(1, 5, 50), (2, 4, 5)])
+
+        clusters = await self.engine.list_clusters(GAMESPACE, leaderboard, [1, 2, 3], 2)
+
+        self.assertEqual(set(clusters.keys()), {1, 2})
+        self.assertEqual(ranked(clusters[1]), [(1, 3, 30), (2, 2, 20)])
+        self.assertEqual(ranked(clusters[2]), [(1, 5, 50), (2, 4, 5)])
+
+        records = await self.engine.list_accounts(GAMESPACE, leaderboard, [1, 4, 5, 100], 0, 10)
+
+        self.assertEqual(ranked(records), [(1, 5, 50), (3, 1, 10), (2, 4, 5)])
+        self.assertEqual([int(record["cluster_id"]) for rank, record in records], [2, 1, 2])
+
+        # the cluster of the account's record is looked in
+        self.assertEqual(await self.score(leaderboard, 4, cluster_id=None), 5)
+
+        around = await self.engine.list_around(GAMESPACE, leaderboard, None, 4, 0, 5)
+        self.assertEqual(ranked(around), [(1, 5, 50), (2, 4, 5)])
+
+    @gen_test
+    async def test_delete_record(self):
+        leaderboard = await self.leaderboard()
+
+        await self.post(leaderboard, 1, 20)
+        await self.post(leaderboard, 2, 10)
+
+        await self.engine.delete_record(GAMESPACE, leaderboard, 1)
+
+        self.assertIsNone(await self.score(leaderboard, 1))
+        self.assertEqual(await self.top(leaderboard), [(1, 2, 10)])
+
+    @gen_test
+    async def test_delete_leaderboard(self):
+        deleted = await self.leaderboard()
+        kept = await self.leaderboard()
+
+        for leaderboard in (deleted, kept):
+            await self.post(leaderboard, 1, 10)
+
+        await self.engine.delete_leaderboard(GAMESPACE, deleted.leaderboard_id)
+
+        self.assertEqual(await self.top(deleted), [])
+        self.assertEqual(await self.top(kept), [(1, 1, 10)])
+
+    @gen_test
+    async def test_delete_accounts(self):
+        leaderboard = await self.leaderboard()
+        other = await self.leaderboard(gamespace_id=OTHER_GAMESPACE)
+
+        await self.post(leaderboard, 1, 10)
+        await self.post(leaderboard, 2, 20)
+        await self.post(leaderboard, 3, 30)
+        await self.post(other, 1, 10, gamespace_id=OTHER_GAMESPACE)
+
+        # of a single gamespace
+        self.assertEqual(await self.engine.delete_accounts(GAMESPACE, [1]), 1)
+        self.assertEqual(await self.top(leaderboard), [(1, 3, 30), (2, 2, 20)])
+        self.assertEqual(await self.top(other, gamespace_id=OTHER_GAMESPACE), [(1, 1, 10)])
+
+        # of every gamespace
+        self.assertEqual(await self.engine.delete_accounts(None, [1, 2]), 2)
+        self.assertEqual(await self.top(leaderboard), [(1, 3, 30)])
+        self.assertEqual(await self.top(other, gamespace_id=OTHER_GAMESPACE), [])
+
+
+@databases.skip_without_mysql
+class MySQLEngineTestCase(EngineContract, AsyncTestCase):
+
+    def create_mysql_engine(self):
+        return MySQLEngine(self.db)
+
+    async def create_engine(self):
+        self.db = databases.mysql()
+        await databases.create_tables(self.db, ["leaderboards", "records"])
+        return self.create_mysql_engine()
+
+    async def create_leaderboard(self, gamespace_id, leaderboard_name, sort_order, policy):
+        return await self.db.insert(
+            """
+                INSERT INTO `leaderboards`
+                (`leaderboard_name`, `gamespace_id`, `leaderboard_sort_order`, `leaderboard_policy`)
+                VALUES (%s, %s, %s, %s);
+            """, leaderboard_name, gamespace_id, sort_order, policy)
+
+    async def close(self):
+        await self.db.pool.close()
+
+
+class MySQLRankIndexEngineTestCase(MySQLEngineTestCase):
+    """
+    Same as MySQLEngineTestCase, the leaderboards are small enough to be ranked by the rank indexes
+    """
+
+    def create_mysql_engine(self):
+        return MySQLEngine(self.db, rank_indexes=RankIndexes(max_boards=100, max_records=1000, ttl=60))
+
+
+@databases.skip_without_redis
+class RedisEngineTestCase(EngineContract, AsyncTestCase):
+
+    async def create_engine(self):
+        self.kv = databases.redis()
+        self.leaderboard_ids = itertools.count(1)
+
+        async with self.kv.acquire() as db:
+            await db.flushdb()
+
+        return RedisEngine(self.kv)
+
+    async def create_leaderboard(self, gamespace_id, leaderboard_name, sort_order, policy):
+        return next(self.leaderboard_ids)
+
+    async def close(self):
+        self.kv.connection_pool.close()
+        await self.kv.connection_pool.wait_closed()
+
+
+@databases.skip_without_mysql
+@databases.skip_without_redis
+class RedisWarmTestCase(AsyncTestCase):
+    """
+    A cluster missing in Redis is loaded from the durable storage upon first use
+    """
+
+    def setUp(self):
+        super(RedisWarmTestCase, self).setUp()
+        self.db = databases.mysql()
+        self.kv = databases.redis()
+        self.durable = MySQLEngine(self.db)
+        self.io_loop.run_sync(self.prepare)
+
+    def tearDown(self):
+        self.io_loop.run_sync(self.close)
+        super(RedisWarmTestCase, self).tearDown()
+
+    async def prepare(self):
+        await databases.create_tables(self.db, ["leaderboards", "records"])
+        async with self.kv.acquire() as db:
+            await db.flushdb()
+
+    async def close(self):
+        self.kv.connection_pool.close()
+        await self.kv.connection_pool.wait_closed()
+        await self.db.pool.close()
+
+    async def leaderboard(self, leaderboard_name, policy="latest"):
+        leaderboard_id = await self.db.insert(
+            """
+                INSERT INTO `leaderboards`
+                (`leaderboard_name`, `gamespace_id`, `leaderboard_sort_order`, `leaderboard_policy`)
+                VALUES (%s, %s, 'desc', %s);
+            """, leaderboard_name, GAMESPACE, policy)
+
+        return LeaderboardAdapter({
+            "leaderboard_id": leaderboard_id,
+            "leaderboard_name": leaderboard_name,
+            "leaderboard_sort_order": "desc",
+            "leaderboard_policy": policy
+        })
+
+    async def post(self, engine, leaderboard, account_id, score, cluster_id=0):
+        await engine.insert_record(
+            GAMESPACE, leaderboard, cluster_id, account_id,
+            "player {0}".format(account_id), score, TIME_TO_LIVE, encode_profile({}))
+
+    @gen_test
+    async def test_warm_in_pages(self):
+        leaderboard = await self.leaderboard("test_pages")
+
+        for account_id in range(1, 26):
+            await self.post(self.durable, leaderboard, account_id, account_id * 10)
+
+        with mock.patch.object(RedisEngine, "WARM_BATCH", 10):
+            engine = RedisEngine(self.kv, self.durable)
+            top = ranked(await engine.list_top(GAMESPACE, leaderboard, 0, 0, 100))
+
+        self.assertEqual(top, ranked(await self.durable.list_top(GAMESPACE, leaderboard, 0, 0, 100)))
+        self.assertEqual(len(top), 25)
+
+    @gen_test
+    async def test_warm_keeps_newer_records(self):
+        leaderboard = await self.leaderboard("test_newer")
+
+        await self.post(self.durable, leaderboard, 1, 10)
+        await self.post(self.durable, leaderboard, 2, 20)
+
+        # written into Redis since the load has started
+        await self.post(RedisEngine(self.kv), leaderboard, 1, 50)
+
+        engine = RedisEngine(self.kv, self.durable)
+        self.assertEqual(ranked(await engine.list_top(GAMESPACE, leaderboard, 0, 0, 100)), [(1, 1, 50), (2, 2, 20)])
+
+    @gen_test
+    async def test_failed_warm_is_retried(self):
+        leaderboard = await self.leaderboard("test_failed")
+
+        for account_id in range(1, 4):
+            await self.post(self.durable, leaderboard, account_id, account_id * 10)
+
+        engine = RedisEngine(self.kv, self.durable)
+
+        with mock.patch.object(self.durable, "load_records", side_effect=StorageError("failed")):
+            with self.assertRaises(StorageError):
+                await engine.list_top(GAMESPACE, leaderboard, 0, 0, 100)
+
+        # neither this process nor the others are left with a partial board
+        for instance in (engine, RedisEngine(self.kv, self.durable)):
+            self.assertEqual(ranked(await instance.list_top(GAMESPACE, leaderboard, 0, 0, 100)),
+                             [(1, 3, 30), (2, 2, 20), (3, 1, 10)])
+
+    @gen_test
+    async def test_warm_cluster_of_account(self):
+        leaderboard = await self.leaderboard("@test_clusters")
+
+        await self.post(self.durable, leaderboard, 1, 10, cluster_id=2)
+        await self.post(self.durable, leaderboard, 2, 20, cluster_id=2)
+
+        engine = RedisEngine(self.kv, self.durable)
+
+        self.assertEqual(await engine.get_score(GAMESPACE, leaderboard, None, 1), 10)
+        self.assertEqual(ranked(await engine.list_around(GAMESPACE, leaderboard, None, 1, 0, 5)),
+                         [(1, 2, 20), (2, 1, 10)])
+        self.assertIsNone(await engine.get_score(GAMESPACE, leaderboard, None, 3))
@@ -0,0 +1,58 @@
+import pytest
+
+pytest.importorskip("tornado")
+pytest.importorskip("anthill.common")
+
+from tornado.testing import AsyncTestCase, gen_test
+
+from anthill.leaderboard.model.migrations import explain_hot_queries
+from anthill.leaderboard.tests import databases
+
+
+@databases.skip_without_mysql
+class HotQueriesTestCase(AsyncTestCase):
+    """
+    The hot queries of the read path have to be served by an index in the order requested,
+        so a change of the schema (or of the queries) that would make them sort or scan fails here.
+    """
+
+    LEADERBOARDS = 5
+    RECORDS = 2000
+
+    def setUp(self):
+        super(HotQueriesTestCase, self).setUp()
+        self.db = databases.mysql()
+        self.io_loop.run_sync(self.fill)
+
+    def tearDown(self):
+        self.io_loop.run_sync(self.db.pool.close)
+        super(HotQueriesTestCase, self).tearDown()
+
+    async def fill(self):
+        await databases.create_tables(self.db, ["leaderboards", "records"])
+
+        # enough records for the optimizer not to prefer a scan of a tiny table
+        for leaderboard in range(1, HotQueriesTestCase.LEADERBOARDS + 1):
+            leaderboard_id = await self.db.insert(
+                """
+                    INSERT INTO `leaderboards`
+                    (`leaderboard_name`, `gamespace_id`, `leaderboard_sort_order`)
+                    VALUES (%s, 1, 'desc');
+                """, "test_{0}".format(leaderboard))
+
+            values = []
+            for account_id in range(1, HotQueriesTestCase.RECORDS + 1):
+                values.extend([account_id, leaderboard_id, account_id % 100, "player"])
+
+            await self.db.execute(
+                """
+                    INSERT INTO `records`
+                    (`account_id`, `gamespace_id`, `leaderboard_id`, `score`, `display_name`, `profile`)
+                    VALUES {0};
+                """.format(", ".join(["(%s, 1, %s, %s, %s, '{}')"] * HotQueriesTestCase.RECORDS)), *values)
+
+        await self.db.execute("ANALYZE TABLE `records`;")
+
+    @gen_test(timeout=60)
+    async def test_hot_queries_use_index(self):
+        self.assertEqual(await explain_hot_queries(self.db), [])
@@ -0,0 +1,110 @@
+import pytest
+
+pytest.importorskip("tornado")
+pytest.importorskip("anthill.common")
+
+from tornado.testing import AsyncTestCase, gen_test
+
+from anthill.common.options import options
+
+from anthill.leaderboard import options as _opts
+from anthill.leaderboard.model.leaderboard import LeaderboardsModel, LeaderboardNotFound
+from anthill.leaderboard.tests import databases
+
+from unittest import mock
+
+import asyncio
+
+
+GAMESPACE = 1
+TIME_TO_LIVE = 3600
+
+
+@databases.skip_without_mysql
+class LeaderboardsTestCase(AsyncTestCase):
+    """
+    Every instance of the service (a model here) has a cache of leaderboards of its own
+    """
+
+    TABLES = ["leaderboards", "records", "leaderboard_clusters", "leaderboard_cluster_accounts"]
+
+    def setUp(self):
+        super(LeaderboardsTestCase, self).setUp()
+        self.db = databases.mysql()
+        self.io_loop.run_sync(lambda: databases.create_tables(self.db, LeaderboardsTestCase.TABLES))
+
+    def tearDown(self):
+        self.io_loop.run_sync(self.db.pool.close)
+        super(LeaderboardsTestCase, self).tearDown()
+
+    async def stored(self, leaderboard_name, sort_order):
+        return await self.db.get(
+            """
+                SELECT `leaderboard_id`, `leaderboard_policy`
+                FROM `leaderboards`
+                WHERE `gamespace_id`=%s AND `leaderboard_name`=%s AND `leaderboard_sort_order`=%s;
+            """, GAMESPACE, leaderboard_name, sort_order)
+
+    @gen_test(timeout=30)
+    async def test_concurrent_first_posts(self):
+        instances = [LeaderboardsModel(self.db), LeaderboardsModel(self.db)]
+
+        # both miss the leaderboard and create it, each with a policy of its own
+        await asyncio.gather(*[
+            instance.add_entry(
+                GAMESPACE, "race", "desc", account_id, "player", 10, TIME_TO_LIVE, {}, policy=policy)
+            for account_id, (instance, policy) in enumerate(zip(instances, ["best", "increment"]), start=1)
+        ])
+
+        stored = await self.stored("race", "desc")
+
+        # only one of them has got its way, and both know which one
+        for instance in instances:
+            leaderboard = await instance.find_leaderboard(GAMESPACE, "race", "desc")
+
+            self.assertEqual(leaderboard.leaderboard_id, stored["leaderboard_id"])
+            self.assertEqual(leaderboard.policy, stored["leaderboard_policy"])
+
+
+@databases.skip_without_mysql
+@databases.skip_without_redis
+class SharedLeaderboardsTestCase(AsyncTestCase):
+    """
+    A leaderboard deleted by an instance of the service is not resolved by the others from their memory
+    """
+
+    TABLES = ["leaderboards", "records", "leaderboard_clusters", "leaderboard_cluster_accounts",
+              "leaderboard_snapshots", "leaderboard_snapshot_records"]
+
+    def setUp(self):
+        super(SharedLeaderboardsTestCase, self).setUp()
+        self.db = databases.mysql()
+        self.kv = databases.redis()
+        self.io_loop.run_sync(self.prepare)
+
+    def tearDown(self):
+        self.io_loop.run_sync(self.close)
+        super(SharedLeaderboardsTestCase, self).tearDown()
+
+    async def prepare(self):
+        await databases.create_tables(self.db, SharedLeaderboardsTestCase.TABLES)
+        async with self.kv.acquire() as db:
+            await db.flushdb()
+
+    async def close(self):
+        self.kv.connection_pool.close()
+        await self.kv.connection_pool.wait_closed()
+        await self.db.pool.close()
+
+    @gen_test(timeout=30)
+    async def test_deleted_elsewhere(self):
+        with mock.patch.object(options.mockable(), "leaderboard_cache_version_ttl", 0):
+            deleting, other = LeaderboardsModel(self.db, cache=self.kv), LeaderboardsModel(self.db, cache=self.kv)
+
+        await deleting.add_entry(GAMESPACE, "race", "desc", 1, "player", 10, TIME_TO_LIVE, {})
+
+        leaderboard = await other.find_leaderboard(GAMESPACE, "race", "desc")
+        await deleting.delete_leaderboard(leaderboard.leaderboard_id, GAMESPACE)
+
+        with self.assertRaises(LeaderboardNotFound):
+            await other.find_leaderboard(GAMESPACE, "race", "desc")
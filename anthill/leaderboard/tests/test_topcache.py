@@ -0,0 +1,181 @@
+import pytest
+
+pytest.importorskip("tornado")
+pytest.importorskip("aioredis")
+pytest.importorskip("anthill.common")
+
+from tornado.testing import AsyncTestCase, gen_test
+
+from anthill.leaderboard.model.topcache import TopCache
+from anthill.leaderboard.tests import databases
+
+import asyncio
+
+
+GAMESPACE = 1
+OTHER_GAMESPACE = 2
+LEADERBOARD = 10
+OTHER_LEADERBOARD = 11
+STALENESS = 1
+
+
+class Fetch(object):
+    """
+    A page fetched from the storage engine, counting how many times it has been
+    """
+
+    def __init__(self, page):
+        self.page = page
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        return self.page
+
+
+class BrokenStorage(object):
+    """
+    A key/value storage that is down
+    """
+
+    def acquire(self):
+        raise ConnectionRefusedError("The storage is down")
+
+
+@databases.skip_without_redis
+class TopCacheTestCase(AsyncTestCase):
+    """
+    Pages are shared between the instances of the service (a TopCache here) through the key/value storage
+    """
+
+    def setUp(self):
+        super(TopCacheTestCase, self).setUp()
+        self.kv = databases.redis()
+        self.io_loop.run_sync(self.flush)
+
+    def tearDown(self):
+        self.io_loop.run_sync(self.close)
+        super(TopCacheTestCase, self).tearDown()
+
+    async def flush(self):
+        async with self.kv.acquire() as db:
+            await db.flushdb()
+
+    async def close(self):
+        self.kv.connection_pool.close()
+        await self.kv.connection_pool.wait_closed()
+
+    def instance(self, staleness=STALENESS, leaderboard_staleness=None, kv=None):
+        return TopCache(kv or self.kv, max_pages=100, ttl=60, staleness=staleness,
+                        leaderboard_staleness=leaderboard_staleness)
+
+    async def get(self, instance, fetch, leaderboard_id=LEADERBOARD, leaderboard_name="race",
+                  gamespace_id=GAMESPACE, page="0:10"):
+        return await instance.get(gamespace_id, leaderboard_id, leaderboard_name, 0, "desc", page, fetch)
+
+    @gen_test
+    async def test_shared_page(self):
+        first, second = self.instance(), self.instance()
+
+        fetch = Fetch([{"account_id": 1, "score": 10.0}])
+        self.assertEqual(await self.get(first, fetch), fetch.page)
+        self.assertEqual(await self.get(second, fetch), fetch.page)
+
+        # fetched by the first instance, reused by the second one
+        self.assertEqual(fetch.calls, 1)
+
+        # another page is fetched on its own
+        self.assertEqual(await self.get(second, fetch, page="10:10"), fetch.page)
+        self.assertEqual(fetch.calls, 2)
+
+    @gen_test
+    async def test_invalidate_leaderboard(self):
+        writing, reading = self.instance(), self.instance()
+
+        fetch = Fetch([{"account_id": 1, "score": 10.0}])
+        await self.get(writing, fetch)
+        await self.get(reading, fetch)
+
+        await writing.invalidate_leaderboard(GAMESPACE, LEADERBOARD)
+
+        # the writing instance sees its write right away
+        await self.get(writing, fetch)
+        self.assertEqual(fetch.calls, 2)
+
+        # the other one keeps its page until its version is stale
+        await self.get(reading, fetch)
+        self.assertEqual(fetch.calls, 2)
+
+        # then it reuses the page the writing instance has fetched since
+        await asyncio.sleep(STALENESS + 0.1)
+
+        await self.get(reading, fetch)
+        self.assertEqual(fetch.calls, 2)
+
+        # or fetches it itself, if nobody has
+
+        await writing.invalidate_leaderboard(GAMESPACE, LEADERBOARD)
+        await asyncio.sleep(STALENESS + 0.1)
+
+        await self.get(reading, fetch)
+        self.assertEqual(fetch.calls, 3)
+
+    @gen_test
+    async def test_invalidate_gamespace(self):
+        writing, reading = self.instance(), self.instance()
+
+        fetch = Fetch([{"account_id": 1, "score": 10.0}])
+        other = Fetch([{"account_id": 2, "score": 20.0}])
+
+        await self.get(reading, fetch)
+        await self.get(reading, other, gamespace_id=OTHER_GAMESPACE)
+
+        await writing.invalidate_gamespace(GAMESPACE)
+        await asyncio.sleep(STALENESS + 0.1)
+
+        # the other gamespace is kept
+        await self.get(reading, fetch)
+        await self.get(reading, other, gamespace_id=OTHER_GAMESPACE)
+        self.assertEqual((fetch.calls, other.calls), (2, 1))
+
+        # of every gamespace
+        await writing.invalidate_gamespace(None)
+        await asyncio.sleep(STALENESS + 0.1)
+
+        await self.get(reading, fetch)
+        await self.get(reading, other, gamespace_id=OTHER_GAMESPACE)
+        self.assertEqual((fetch.calls, other.calls), (3, 2))
+
+    @gen_test
+    async def test_leaderboard_staleness(self):
+        self.assertEqual(TopCache.parse_staleness("daily:5, @weekly:30"), {"daily": 5, "@weekly": 30})
+
+        writing = self.instance()
+        reading = self.instance(staleness=60, leaderboard_staleness=TopCache.parse_staleness("race:0"))
+
+        fetch = Fetch([{"account_id": 1, "score": 10.0}])
+        stale = Fetch([{"account_id": 1, "score": 10.0}])
+
+        await self.get(reading, fetch)
+        await self.get(reading, stale, leaderboard_id=OTHER_LEADERBOARD, leaderboard_name="other")
+
+        await writing.invalidate_gamespace(GAMESPACE)
+
+        # "race" checks the version upon every read, the rest are as stale as a minute
+        await self.get(reading, fetch)
+        await self.get(reading, stale, leaderboard_id=OTHER_LEADERBOARD, leaderboard_name="other")
+        self.assertEqual((fetch.calls, stale.calls), (2, 1))
+
+    @gen_test
+    async def test_storage_failure(self):
+        instance = self.instance(kv=BrokenStorage())
+
+        fetch = Fetch([{"account_id": 1, "score": 10.0}])
+
+        self.assertEqual(await self.get(instance, fetch), fetch.page)
+        self.assertEqual(await self.get(instance, fetch), fetch.page)
+        self.assertEqual(fetch.calls, 2)
+
+        # nothing to invalidate, but it's not an error of the write
+        await instance.invalidate_leaderboard(GAMESPACE, LEADERBOARD)
+        await instance.invalidate_gamespace(GAMESPACE)
@@ -0,0 +1,65 @@
+"""
+Compares two results of benchmark.load, scenario by scenario, and exits with a non-zero status if the second
+    one is worse than the first one by more than --threshold (either a throughput drop, or a p99 increase).
+
+    python -m benchmark.compare baseline.json current.json [--threshold 10]
+"""
+
+import argparse
+import json
+import sys
+
+
+def compare(baseline, current, threshold):
+    """
+    :returns: a list of (scenario, metric, baseline value, current value, change in percent, regressed)
+    """
+
+    result = []
+
+    for scenario, before in sorted(baseline["scenarios"].items()):
+        after = current["scenarios"].get(scenario)
+        if after is None:
+            continue
+
+        for metric, higher_is_better in (("throughput", True), ("p50", False), ("p99", False)):
+            change = (after[metric] - before[metric]) * 100.0 / before[metric] if before[metric] else 0.0
+            regressed = (-change if higher_is_better else change) > threshold
+            result.append((scenario, metric, before[metric], after[metric], change, regressed))
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark results")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Percent of change considered a regression")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    changed = {
+        name: (value, current["options"].get(name))
+        for name, value in baseline["options"].items()
+        if current["options"].get(name) != value
+    }
+
+    for name, (before, after) in sorted(changed.items()):
+        print("option {0}: {1} -> {2}".format(name, before, after))
+
+    regressions = 0
+
+    for scenario, metric, before, after, change, regressed in compare(baseline, current, args.threshold):
+        regressions += regressed
+        print("{0:<14} {1:<10} {2:>12.2f} {3:>12.2f} {4:>+8.1f}%{5}".format(
+            scenario, metric, before, after, change, "  REGRESSION" if regressed else ""))
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
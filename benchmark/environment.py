@@ -0,0 +1,91 @@
+from anthill.common.options import options
+from anthill.common import keyvalue
+
+from anthill.leaderboard.model.leaderboard import LeaderboardsModel
+from anthill.leaderboard.model.metrics import Metrics, MeasuredDatabase
+from anthill.leaderboard.model.shards import parse_shards
+from anthill.leaderboard.model.replicas import parse_replicas
+
+import anthill.leaderboard.options
+import benchmark.options
+
+import os
+
+
+class BenchmarkApplication(object):
+    """
+    Just enough of a server for the model to be started with (it looks up its /sql files with it)
+    """
+
+    ROOT = os.path.dirname(os.path.abspath(anthill.leaderboard.options.__file__))
+
+    def module_path(self, *paths):
+        return os.path.join(BenchmarkApplication.ROOT, *paths)
+
+
+async def start_model():
+    """
+    Creates and starts a LeaderboardsModel exactly like the service does, according to the options
+    """
+
+    metrics = Metrics()
+
+    db = MeasuredDatabase(
+        metrics,
+        host=options.db_host,
+        database=options.db_name,
+        user=options.db_username,
+        password=options.db_password)
+
+    cache = keyvalue.KeyValueStorage(
+        host=options.cache_host,
+        port=options.cache_port,
+        db=options.cache_db,
+        max_connections=options.cache_max_connections) if options.top_cache else None
+
+    ranking = keyvalue.KeyValueStorage(
+        host=options.ranking_host,
+        port=options.ranking_port,
+        db=options.ranking_db,
+        max_connections=options.ranking_max_connections) \
+        if LeaderboardsModel.ENGINE_REDIS in LeaderboardsModel.engines_used() else None
+
+    shards = {
+        name: MeasuredDatabase(
+            metrics,
+            host=host,
+            database=database,
+            user=options.db_username,
+            password=options.db_password)
+        for name, host, database in parse_shards(options.records_shards)
+    }
+
+    replicas = {}
+
+    for shard, host, database in parse_replicas(options.db_replicas):
+        replicas.setdefault(shard, {})["{0}/{1}".format(host, database)] = MeasuredDatabase(
+            metrics,
+            host=host,
+            database=database,
+            user=options.db_username,
+            password=options.db_password)
+
+    model = LeaderboardsModel(db, cache=cache, ranking=ranking, metrics=metrics, shards=shards, replicas=replicas)
+    await model.started(BenchmarkApplication())
+
+    # replicas join the rotation once their lag is measured
+    for pool in model.replicas.values():
+        pool.start()
+        await pool.run()
+
+    return model
+
+
+def storage_mode():
+    """
+    :returns: the options that make a difference to the results, to tell the runs apart
+    """
+    return {
+        name: options[name]
+        for name in sorted(options.group_dict("leaderboard").keys())
+    }
@@ -0,0 +1,170 @@
+"""
+Creates the synthetic leaderboards of the benchmark in the database the options point to:
+
+    bench       a non-clustered leaderboard, sorted descending, of --bench_records records
+    @bench      a clustered one of the same records, in clusters of --cluster_size accounts
+
+Accounts are numbered from 1 to --bench_records, scores are drawn with --bench_seed, so two runs of the
+    same options generate exactly the same data. Existing leaderboards of the same names are deleted first.
+
+    python -m benchmark.generate --db_name=bench_leaderboard --bench_records=1000000
+"""
+
+from anthill.common.options import options
+from anthill.common import options as common_options
+
+from anthill.leaderboard.model.leaderboard import LeaderboardNotFound
+
+from benchmark.environment import start_model
+
+from tornado.ioloop import IOLoop
+
+import logging
+import random
+import time
+import ujson
+
+
+def scores(count, seed):
+    """
+    Scores of accounts 1..count: most players score little, few score a lot, and there are plenty of ties
+    """
+    generator = random.Random(seed)
+    return [float(int(generator.paretovariate(1.5) * 100)) for _ in range(count)]
+
+
+def friends_of(account_id, size, records, seed):
+    """
+    :returns: a deterministic friend list of an account, of accounts 1..records
+    """
+    generator = random.Random(seed * 1000003 + account_id)
+    return generator.sample(range(1, records + 1), min(size, records))
+
+
+async def create_leaderboard(model, gamespace_id, name):
+    try:
+        existing = await model.find_leaderboard(gamespace_id, name, "desc")
+    except LeaderboardNotFound:
+        existing = None
+
+    if existing is not None:
+        logging.info("Deleting existing leaderboard '{0}'".format(name))
+        await model.delete_leaderboard(existing.leaderboard_id, gamespace_id)
+        await model.db.execute(
+            """
+                DELETE FROM `leaderboard_cluster_accounts`
+                WHERE `gamespace_id`=%s AND `cluster_data`=%s;
+            """, gamespace_id, existing.leaderboard_id)
+        await model.db.execute(
+            """
+                DELETE FROM `leaderboard_clusters`
+                WHERE `gamespace_id`=%s AND `cluster_data`=%s;
+            """, gamespace_id, existing.leaderboard_id)
+        await model.db.execute(
+            """
+                DELETE FROM `leaderboards`
+                WHERE `leaderboard_id`=%s;
+            """, existing.leaderboard_id)
+
+    return await model.db.insert(
+        """
+            INSERT INTO `leaderboards`
+            (`leaderboard_name`, `gamespace_id`, `leaderboard_sort_order`, `leaderboard_policy`)
+            VALUES (%s, %s, 'desc', 'latest');
+        """, name, gamespace_id)
+
+
+async def create_clusters(model, gamespace_id, leaderboard_id, records, cluster_size):
+    """
+    :returns: a list of cluster ids, the first `cluster_size` accounts are in the first one, and so on
+    """
+
+    count = (records + cluster_size - 1) // cluster_size
+
+    for offset in range(0, count, options.bench_batch_size):
+        batch = range(offset, min(offset + options.bench_batch_size, count))
+        await model.db.execute(
+            """
+                INSERT INTO `leaderboard_clusters`
+                (`gamespace_id`, `cluster_size`, `cluster_data`)
+                VALUES {0};
+            """.format(",".join(["(%s, %s, %s)"] * len(batch))),
+            *[value for cluster in batch for value in (
+                gamespace_id,
+                # the last cluster may have free rooms left
+                cluster_size * count - records if cluster == count - 1 else 0,
+                leaderboard_id)])
+
+    clusters = await model.db.query(
+        """
+            SELECT `cluster_id`
+            FROM `leaderboard_clusters`
+            WHERE `gamespace_id`=%s AND `cluster_data`=%s
+            ORDER BY `cluster_id`;
+        """, gamespace_id, leaderboard_id)
+
+    cluster_ids = [cluster["cluster_id"] for cluster in clusters]
+
+    for offset in range(0, records, options.bench_batch_size):
+        accounts = range(offset + 1, min(offset + options.bench_batch_size, records) + 1)
+        await model.db.execute(
+            """
+                INSERT INTO `leaderboard_cluster_accounts`
+                (`account_id`, `gamespace_id`, `cluster_id`, `cluster_data`)
+                VALUES {0};
+            """.format(",".join(["(%s, %s, %s, %s)"] * len(accounts))),
+            *[value for account_id in accounts for value in (
+                account_id, gamespace_id, cluster_ids[(account_id - 1) // cluster_size], leaderboard_id)])
+
+    return cluster_ids
+
+
+async def insert_records(model, gamespace_id, leaderboard_id, account_scores, cluster_size=None):
+    # far enough in the future for the records not to expire during the benchmark
+    expire_at = int(time.time()) + 86400 * 30
+    profile = ujson.dumps({"level": 1, "avatar": "https://example.com/avatar.png"})
+
+    clusters = None
+    if cluster_size is not None:
+        clusters = await create_clusters(model, gamespace_id, leaderboard_id, len(account_scores), cluster_size)
+
+    for offset in range(0, len(account_scores), options.bench_batch_size):
+        batch = range(offset, min(offset + options.bench_batch_size, len(account_scores)))
+        await model.db.execute(
+            """
+                INSERT INTO `records`
+                (`account_id`, `cluster_id`, `gamespace_id`, `leaderboard_id`,
+                    `expire_at`, `score`, `display_name`, `profile`)
+                VALUES {0};
+            """.format(",".join(["(%s, %s, %s, %s, FROM_UNIXTIME(%s), %s, %s, %s)"] * len(batch))),
+            *[value for i in batch for value in (
+                i + 1, 0 if clusters is None else clusters[i // cluster_size], gamespace_id, leaderboard_id,
+                expire_at, account_scores[i], "Player {0}".format(i + 1), profile)])
+
+        logging.info("{0} of {1} records".format(batch[-1] + 1, len(account_scores)))
+
+
+async def generate():
+    model = await start_model()
+    gamespace_id = options.bench_gamespace
+    account_scores = scores(options.bench_records, options.bench_seed)
+
+    started = time.time()
+
+    leaderboard_id = await create_leaderboard(model, gamespace_id, options.bench_leaderboard)
+    await insert_records(model, gamespace_id, leaderboard_id, account_scores)
+
+    if options.bench_clustered:
+        clustered_id = await create_leaderboard(
+            model, gamespace_id, model.LEADERBOARD_CLUSTERED_TRIGGER + options.bench_leaderboard)
+        await insert_records(model, gamespace_id, clustered_id, account_scores, cluster_size=options.cluster_size)
+
+    logging.info("Generated {0} records in {1:.1f}s".format(options.bench_records, time.time() - started))
+
+    await model.stopped()
+
+
+if __name__ == "__main__":
+    common_options.parse_env()
+    common_options.parse_command_line()
+    IOLoop.current().run_sync(generate)
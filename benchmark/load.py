@@ -0,0 +1,227 @@
+"""
+Runs concurrent load against the synthetic leaderboards (see benchmark.generate), one scenario after another,
+    and reports the throughput and latencies of each as JSON.
+
+Scenarios of the model (LeaderboardsModel is driven in process, responses are serialized as the handlers do):
+
+    submit          posts a random score of a random account
+    top             the first page of the top
+    top_deep        a page of the top at a random offset
+    around          a page around a random account
+    friends         records of friends of a random account, friend list sizes cycle through --bench_friends
+    all_clusters    top --bench_clusters_limit records of every cluster of the clustered leaderboard
+
+Scenarios of the HTTP handlers of a running service (--bench_url and --bench_token are required):
+
+    http_submit, http_top, http_top_deep, http_around, http_friends
+
+Storage modes are compared by running with different options, those are stored along with the results:
+
+    python -m benchmark.load --db_name=bench_leaderboard --bench_records=1000000 --bench_output=mysql.json
+    python -m benchmark.load --db_name=bench_leaderboard --bench_records=1000000 --bench_output=redis.json \\
+        --storage_engine=redis
+    python -m benchmark.compare mysql.json redis.json
+"""
+
+from anthill.common.options import options
+from anthill.common import options as common_options
+
+from anthill.leaderboard.handler import dump_page_chunks
+
+from benchmark.environment import start_model, storage_mode
+from benchmark.generate import friends_of
+
+from tornado.httpclient import AsyncHTTPClient
+from tornado.httputil import url_concat
+from tornado.ioloop import IOLoop
+
+import asyncio
+import itertools
+import logging
+import random
+import subprocess
+import sys
+import time
+import ujson
+import urllib.parse
+
+
+def percentile(latencies, value):
+    """
+    :param latencies: sorted latencies
+    """
+    if not latencies:
+        return 0.0
+    return latencies[min(int(len(latencies) * value / 100.0), len(latencies) - 1)]
+
+
+class Load(object):
+    def __init__(self, model):
+        self.model = model
+        self.gamespace_id = options.bench_gamespace
+        self.name = options.bench_leaderboard
+        self.records = options.bench_records
+        self.page_size = options.bench_page_size
+        self.friends_sizes = itertools.cycle([int(size) for size in options.bench_friends.split(",")])
+        self.http = AsyncHTTPClient(max_clients=options.bench_concurrency)
+
+    def __account__(self, generator):
+        return generator.randint(1, self.records)
+
+    @staticmethod
+    def __serialize__(records, limit=None):
+        return len("".join(dump_page_chunks(records, limit)))
+
+    async def submit(self, generator):
+        account_id = self.__account__(generator)
+        await self.model.add_entry(
+            self.gamespace_id, self.name, "desc", account_id, "Player {0}".format(account_id),
+            float(generator.randint(0, 100000)), 86400 * 30, {"level": generator.randint(1, 100)})
+
+    async def top(self, generator):
+        records = await self.model.list_top_records(
+            self.name, self.gamespace_id, "desc", 0, self.page_size)
+        self.__serialize__(records, self.page_size)
+
+    async def top_deep(self, generator):
+        records = await self.model.list_top_records(
+            self.name, self.gamespace_id, "desc",
+            generator.randint(0, max(self.records - self.page_size, 0)), self.page_size)
+        self.__serialize__(records, self.page_size)
+
+    async def around(self, generator):
+        records = await self.model.list_around_me_records(
+            self.__account__(generator), self.name, self.gamespace_id, "desc", 0, self.page_size)
+        if records is not None:
+            self.__serialize__(records)
+
+    async def friends(self, generator):
+        friends_ids = friends_of(
+            self.__account__(generator), next(self.friends_sizes), self.records, options.bench_seed)
+        records = await self.model.list_friends_records(
+            friends_ids, self.name, self.gamespace_id, "desc", 0, self.page_size)
+        self.__serialize__(records)
+
+    async def all_clusters(self, generator):
+        clusters = await self.model.list_top_all_clusters(
+            self.model.LEADERBOARD_CLUSTERED_TRIGGER + self.name, self.gamespace_id, "desc",
+            limit=options.bench_clusters_limit)
+        for records in (clusters or {}).values():
+            self.__serialize__(records)
+
+    async def __http__(self, path, method="GET", **arguments):
+        url = options.bench_url.rstrip("/") + "/leaderboard/desc/" + urllib.parse.quote(self.name) + path
+        arguments["access_token"] = options.bench_token
+
+        if method == "GET":
+            await self.http.fetch(url_concat(url, arguments))
+        else:
+            await self.http.fetch(url, method=method, body=urllib.parse.urlencode(arguments))
+
+    async def http_submit(self, generator):
+        await self.__http__(
+            "", method="POST", score=generator.randint(0, 100000),
+            display_name="Player", profile=ujson.dumps({"level": generator.randint(1, 100)}))
+
+    async def http_top(self, generator):
+        await self.__http__("", limit=self.page_size)
+
+    async def http_top_deep(self, generator):
+        await self.__http__(
+            "", offset=generator.randint(0, max(self.records - self.page_size, 0)), limit=self.page_size)
+
+    async def http_around(self, generator):
+        await self.__http__("/around", limit=self.page_size)
+
+    async def http_friends(self, generator):
+        await self.__http__("/friends", limit=self.page_size)
+
+    async def run(self, scenario):
+        """
+        Runs a scenario with `bench_concurrency` clients for `bench_duration` seconds
+        """
+
+        request = getattr(self, scenario)
+        deadline = time.monotonic() + options.bench_duration
+        latencies = []
+        errors = []
+
+        async def client(number):
+            generator = random.Random(options.bench_seed * 1000 + number)
+            while time.monotonic() < deadline:
+                started = time.monotonic()
+                try:
+                    await request(generator)
+                except Exception as e:
+                    errors.append(str(e))
+                else:
+                    latencies.append((time.monotonic() - started) * 1000.0)
+
+        started = time.monotonic()
+        await asyncio.gather(*[client(number) for number in range(options.bench_concurrency)])
+        elapsed = time.monotonic() - started
+
+        latencies.sort()
+
+        if errors:
+            logging.warning("Scenario '{0}' failed {1} times, like: {2}".format(scenario, len(errors), errors[0]))
+
+        return {
+            "requests": len(latencies),
+            "errors": len(errors),
+            "throughput": len(latencies) / elapsed,
+            "p50": percentile(latencies, 50),
+            "p90": percentile(latencies, 90),
+            "p99": percentile(latencies, 99),
+            "max": latencies[-1] if latencies else 0.0,
+            "mean": sum(latencies) / len(latencies) if latencies else 0.0
+        }
+
+
+def revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def load():
+    model = await start_model()
+    scenarios = [scenario.strip() for scenario in options.bench_scenarios.split(",") if scenario.strip()]
+
+    if any(scenario.startswith("http_") for scenario in scenarios) and not (options.bench_url and options.bench_token):
+        raise ValueError("--bench_url and --bench_token are required for the http_* scenarios")
+
+    runner = Load(model)
+
+    result = {
+        "started": int(time.time()),
+        "revision": revision(),
+        "records": options.bench_records,
+        "concurrency": options.bench_concurrency,
+        "duration": options.bench_duration,
+        "options": storage_mode(),
+        "scenarios": {}
+    }
+
+    for scenario in scenarios:
+        logging.info("Running '{0}'".format(scenario))
+        result["scenarios"][scenario] = await runner.run(scenario)
+
+    result["metrics"] = await model.get_metrics()
+
+    await model.stopped()
+
+    output = ujson.dumps(result, indent=2)
+
+    if options.bench_output:
+        with open(options.bench_output, "w") as f:
+            f.write(output)
+    else:
+        sys.stdout.write(output + "\n")
+
+
+if __name__ == "__main__":
+    common_options.parse_env()
+    common_options.parse_command_line()
+    IOLoop.current().run_sync(load)
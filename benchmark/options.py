@@ -0,0 +1,94 @@
+from anthill.common.options import define
+
+# Options of the service (storage engines, caches, the database) are used as they are,
+#   so every storage mode can be benchmarked by passing the options it takes, like --storage_engine=redis
+
+define("bench_gamespace",
+       default=1,
+       type=int,
+       group="benchmark",
+       help="Gamespace the synthetic leaderboards are created in")
+
+define("bench_leaderboard",
+       default="bench",
+       type=str,
+       group="benchmark",
+       help="Name of the synthetic leaderboard, the clustered one is named the same with a '@' prepended")
+
+define("bench_records",
+       default=100000,
+       type=int,
+       group="benchmark",
+       help="Records in each synthetic leaderboard, accounts are numbered from 1")
+
+define("bench_clustered",
+       default=True,
+       type=bool,
+       group="benchmark",
+       help="Create the clustered leaderboard as well (its clusters are of --cluster_size accounts)")
+
+define("bench_batch_size",
+       default=5000,
+       type=int,
+       group="benchmark",
+       help="Rows inserted with a single statement upon generation")
+
+define("bench_seed",
+       default=1,
+       type=int,
+       group="benchmark",
+       help="Seed of the synthetic data and of the load, so runs are reproducible")
+
+define("bench_friends",
+       default="10,100,1000,5000",
+       type=str,
+       group="benchmark",
+       help="Friend list sizes the friends scenario cycles through")
+
+define("bench_scenarios",
+       default="submit,top,top_deep,around,friends,all_clusters",
+       type=str,
+       group="benchmark",
+       help="Scenarios to run, one after another")
+
+define("bench_concurrency",
+       default=32,
+       type=int,
+       group="benchmark",
+       help="Concurrent clients of each scenario")
+
+define("bench_duration",
+       default=20,
+       type=int,
+       group="benchmark",
+       help="Seconds each scenario runs for")
+
+define("bench_page_size",
+       default=50,
+       type=int,
+       group="benchmark",
+       help="Records of a page requested")
+
+define("bench_clusters_limit",
+       default=10,
+       type=int,
+       group="benchmark",
+       help="Top records of each cluster the all_clusters scenario requests")
+
+define("bench_url",
+       default="",
+       type=str,
+       group="benchmark",
+       help="Location of a running service, to run the http_* scenarios against")
+
+define("bench_token",
+       default="",
+       type=str,
+       group="benchmark",
+       help="Access token for the http_* scenarios, with the 'leaderboard' scope")
+
+define("bench_output",
+       default="",
+       type=str,
+       group="benchmark",
+       help="File to write results into, as JSON (standard output if empty)")
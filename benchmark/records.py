@@ -0,0 +1,109 @@
+"""
+Compares the way pages of records used to be serialized with the current one:
+
+    legacy      profiles decoded upon read, a plain RecordAdapter per record, ujson.dumps(record.dump())
+    current     profiles kept as the stored JSON text, slotted RecordAdapter, record.dump_json()
+
+Both start from rows as the database driver hands them out (a JSON column comes in as text),
+    and produce the same JSON, record by record.
+
+    python -m benchmark.records [--rows 1000] [--pages 200] [--profile-size 8]
+"""
+
+from anthill.leaderboard.model.leaderboard import RecordAdapter
+
+import argparse
+import random
+import timeit
+import tracemalloc
+import ujson
+
+
+class LegacyRecordAdapter(object):
+    def __init__(self, data, rank):
+        self.account = data.get("account_id")
+        self.cluster_id = data.get("cluster_id")
+        self.score = data.get("score")
+        self.name = data.get("display_name")
+        self.profile = data.get("profile", {})
+        self.rank = rank
+
+    def dump(self):
+        return {
+            "rank": self.rank,
+            "score": self.score,
+            "account": self.account,
+            "display_name": self.name,
+            "profile": self.profile
+        }
+
+
+def generate_rows(rows, profile_size):
+    result = []
+    for i in range(rows):
+        profile = {
+            "field_{0}".format(f): random.choice([random.randint(0, 100000), "value-{0}".format(f), True])
+            for f in range(profile_size)
+        }
+        result.append({
+            "account_id": i + 1,
+            "display_name": "Player {0}".format(i + 1),
+            "score": float(random.randint(0, 1000000)),
+            "profile": ujson.dumps(profile),
+            "cluster_id": 0
+        })
+    return result
+
+
+def legacy(rows):
+    chunk = []
+    for rank, row in enumerate(rows, 1):
+        row = dict(row, profile=ujson.loads(row["profile"]))
+        record = LegacyRecordAdapter(row, rank)
+        chunk.append(ujson.dumps(record.dump(), escape_forward_slashes=False))
+    return ",".join(chunk)
+
+
+def current(rows):
+    chunk = []
+    for rank, row in enumerate(rows, 1):
+        record = RecordAdapter(row, rank)
+        chunk.append(record.dump_json())
+    return ",".join(chunk)
+
+
+def measure(name, func, rows, pages):
+    seconds = min(timeit.repeat(lambda: func(rows), number=pages, repeat=3)) / pages
+
+    tracemalloc.start()
+    func(rows)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    per_row = seconds / len(rows) * 1000000000
+    print("{0:<8} {1:>10.3f} ms/page {2:>10.0f} ns/row {3:>10.0f} KiB peak/page".format(
+        name, seconds * 1000, per_row, peak / 1024.0))
+
+    return seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serialization of leaderboard pages")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--profile-size", type=int, default=8)
+    args = parser.parse_args()
+
+    rows = generate_rows(args.rows, args.profile_size)
+
+    assert ujson.loads("[" + legacy(rows) + "]") == ujson.loads("[" + current(rows) + "]")
+
+    legacy_seconds, legacy_peak = measure("legacy", legacy, rows, args.pages)
+    current_seconds, current_peak = measure("current", current, rows, args.pages)
+
+    print("cpu: {0:.1f}x faster, memory: {1:.1f}x less".format(
+        legacy_seconds / current_seconds, float(legacy_peak) / max(current_peak, 1)))
+
+
+if __name__ == "__main__":
+    main()